@@ -1,14 +1,16 @@
 import csv
+import hashlib
 import random
 import asyncio
 import aiohttp
 import configparser
 from time import time as current_time
-from bs4 import BeautifulSoup
 import logging
-
-# Initialize variables
-requests_per_second = 2  # Default value
+from crawl_queue import DEFAULT_QUEUE_DEPTH, DEFAULT_WORKERS, run_crawl_queue
+from crawler_client import crawler_settings, create_crawler_session
+from page_stats import read_page_stats
+from rate_limiter import HostRateLimiter, rate_limit_settings
+from ua_variants import UaVariantPlanner, variant_settings
 
 # Clear the previous asynchronous crawling log
 with open('async_crawling_log.txt', 'w'):
@@ -23,50 +25,69 @@ try:
     config.read('crawler_config.ini')
     desktop_agents = config['UserAgents']['desktop_agents'].split(',')
     mobile_agents = config['UserAgents']['mobile_agents'].split(',')
-    requests_per_second = int(config['RateLimit']['requests_per_second'])
 except Exception as e:
     logging.debug(f"Failed to read the configuration file. Exception: {e}")
 
 # Asynchronous crawl_url function
-async def crawl_url(url, user_agent):
+async def crawl_url(url, user_agent, session, limiter, planner=None):
     headers = {'User-Agent': user_agent}
     start_time = current_time()
-    async with aiohttp.ClientSession() as session:
-        try:
+    try:
+        # Wait for the host's rate limit and adaptive concurrency limit, then report the response back to it
+        async with limiter.limit(url) as slot:
             async with session.get(url, headers=headers) as response:
+                slot.record(response.status, response.headers.get('Retry-After'))
                 response.raise_for_status()
                 end_time = current_time()
                 duration = end_time - start_time
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                page_length = len(text)
-                num_images = len(soup.find_all('img'))
-                num_links = len(soup.find_all('a'))
-                logging.info(f'Successfully crawled {url} with {user_agent}. Title: {soup.title.string}, Page Length: {page_length}, Images: {num_images}, Links: {num_links}, Duration: {duration:.2f} seconds')
-        except Exception as e:
-            end_time = current_time()
-            duration = end_time - start_time
-            logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
+                digest = hashlib.blake2b() if planner is not None else None
+                stats = await read_page_stats(response, digest)
+                if planner is not None and not stats.skipped:
+                    planner.observe(url, user_agent, response.headers.get('Vary'), digest.hexdigest())
+                logging.info(f'Successfully crawled {url} with {user_agent}. Title: {stats.title}, Page Length: {stats.page_length}, Images: {stats.num_images}, Links: {stats.num_links}, Duration: {duration:.2f} seconds')
+    except Exception as e:
+        end_time = current_time()
+        duration = end_time - start_time
+        logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
+
+# Function to list the (url, user agent) crawl jobs of the links
+# With a UaVariantPlanner each URL is fetched once per class of agents that get the same page
+def crawl_jobs(reader, planner=None):
+    for row in reader:
+        url = row[0]
+        user_agents = desktop_agents + mobile_agents  # Loop through all user agents
+        if planner is not None:
+            user_agents = planner.plan(url, user_agents)
+        for user_agent in user_agents:
+            yield url, user_agent
 
 # Asynchronous main function to crawl all URLs
 async def crawl_all_urls():
-    with open('sitemap_links.csv', 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        tasks = []
-        semaphore = asyncio.Semaphore(requests_per_second)
+    # One pooled session shared by every page fetch of the run
+    async with create_crawler_session(**crawler_settings(config)) as session:
+        with open('sitemap_links.csv', 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+
+            # Token bucket and in-flight cap per host
+            limiter = HostRateLimiter(*rate_limit_settings(config))
 
-        async def bounded_crawl(url, user_agent):
-            async with semaphore:
-                await crawl_url(url, user_agent)
+            # User agent classes learned on the previous runs
+            planner = None
+            if config.getboolean('UserAgents', 'variant_planner', fallback=True):
+                planner = UaVariantPlanner('ua_variants.json', **variant_settings(config))
 
-        for row in reader:
-            url = row[0]
-            for user_agent in desktop_agents + mobile_agents:  # Loop through all user agents
-                task = asyncio.ensure_future(bounded_crawl(url, user_agent))
-                tasks.append(task)
-                await asyncio.sleep(1 / requests_per_second)  # Sleep to maintain the rate limit
+            async def crawl_job(url, user_agent):
+                await crawl_url(url, user_agent, session, limiter, planner)
 
-        await asyncio.gather(*tasks)
+            # A fixed pool of workers fed lazily from the CSV
+            workers = config.getint('Crawler', 'workers', fallback=DEFAULT_WORKERS)
+            await run_crawl_queue(crawl_jobs(reader, planner), crawl_job, workers=workers,
+                                  queue_size=config.getint('Crawler', 'queue_size', fallback=workers * DEFAULT_QUEUE_DEPTH))
+            limiter.log_limits()
+            if planner is not None:
+                planner.merge(planner.learn())
+                planner.log_summary()
+                planner.save()
 
 # Entry point
 if __name__ == '__main__':
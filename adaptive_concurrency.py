@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from time import monotonic, time as current_time
+
+import aiohttp
+
+# Responses telling that a host is overloaded
+OVERLOAD_STATUSES = (429, 503)
+
+# Errors counted as a host pushing back when no response was received
+OVERLOAD_ERRORS = (asyncio.TimeoutError, aiohttp.ClientConnectionError)
+
+# Defaults of the AIMD controller
+DEFAULT_INITIAL_IN_FLIGHT = 1
+DEFAULT_LATENCY_TOLERANCE = 2.0
+DEFAULT_DECREASE_FACTOR = 0.5
+DEFAULT_WINDOW = 20
+MIN_DECREASE_INTERVAL = 1.0
+
+# Weights of a new window median in the long-term median: faster medians pull it down quickly, slower
+# ones raise it gradually, so noise never ratchets it down and a host that really got slower is let go
+BASELINE_FALL = 0.5
+BASELINE_RISE = 0.05
+
+# Pause of a host already at one request in flight that still pushes back without Retry-After,
+# doubled on every consecutive overload up to MAX_OVERLOAD_PAUSE
+BASE_OVERLOAD_PAUSE = 1.0
+MAX_OVERLOAD_PAUSE = 300.0
+
+
+# Function to read a Retry-After header, either delay seconds or an HTTP date, as seconds to wait
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - current_time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to get a percentile of a sorted list of latencies
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Concurrency limit of one host, adjusted with additive increase / multiplicative decrease
+# Every healthy response raises the limit by about one request per round of limit responses, up to
+# max_limit. A 429/503, a timeout or a connection error, or a recent median latency above latency_tolerance
+# times the host's long-term median, cuts it by decrease_factor. Retry-After pauses the host.
+# The long-term median is a moving average of the window medians, updated every half window.
+class AdaptiveLimit:
+    def __init__(self, host, max_limit, initial_limit=DEFAULT_INITIAL_IN_FLIGHT,
+                 latency_tolerance=DEFAULT_LATENCY_TOLERANCE, decrease_factor=DEFAULT_DECREASE_FACTOR,
+                 window=DEFAULT_WINDOW):
+        self.host = host
+        self.max_limit = max(1, max_limit)
+        self.limit = float(min(self.max_limit, max(1, initial_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.latencies = deque(maxlen=window)
+        self.samples = 0
+        self.baseline = None
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.paused_until = 0
+        self.last_decrease = 0
+        self.overloads = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        pause = self.paused_until - monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    # Function to get the p50 and p90 latency of the recent window
+    def latency_percentiles(self):
+        latencies = sorted(self.latencies)
+        return percentile(latencies, 0.5), percentile(latencies, 0.9)
+
+    # Function to feed the outcome of a request: its latency, and its status or the error it raised
+    def on_response(self, latency, status=None, retry_after=None, error=None):
+        if status in OVERLOAD_STATUSES or error is not None:
+            self.on_overload(f"HTTP {status}" if error is None else type(error).__name__, parse_retry_after(retry_after))
+            return
+        self.overloads = 0
+        self.latencies.append(latency)
+        self.samples += 1
+        if self.samples % (self.latencies.maxlen // 2) == 0:
+            p50 = self.latency_percentiles()[0]
+            baseline = self.baseline if self.baseline is not None else p50
+            self.baseline = baseline + (BASELINE_FALL if p50 < baseline else BASELINE_RISE) * (p50 - baseline)
+            if p50 > self.latency_tolerance * baseline:
+                self.decrease(f"p50 latency {p50:.2f}s over {self.latency_tolerance:g} x {baseline:.2f}s")
+                return
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        if int(self.limit) != previous:
+            logging.info(f"Concurrency limit for {self.host}: {previous} -> {int(self.limit)} (healthy)")
+
+    def on_overload(self, reason, retry_after=None):
+        self.overloads += 1
+        if retry_after is not None:
+            pause = retry_after
+        elif self.limit <= 1:
+            pause = min(MAX_OVERLOAD_PAUSE, BASE_OVERLOAD_PAUSE * 2 ** (self.overloads - 1))
+        else:
+            pause = 0
+        if pause > 0:
+            self.paused_until = max(self.paused_until, monotonic() + pause)
+            logging.info(f"Pausing {self.host} for {pause:.0f} seconds ({reason})")
+        self.decrease(reason)
+
+    def decrease(self, reason):
+        # Requests already in flight when the host pushed back count as one signal
+        now = monotonic()
+        p50 = self.latency_percentiles()[0] or 0
+        if now - self.last_decrease < max(MIN_DECREASE_INTERVAL, p50):
+            return
+        self.last_decrease = now
+        previous = self.limit
+        self.limit = max(1.0, self.limit * self.decrease_factor)
+        self.decreases += 1
+        logging.info(f"Concurrency limit for {self.host}: {int(previous)} -> {int(self.limit)} ({reason})")
+
+    # Function to describe the current state of the limit for the logs
+    def summary(self):
+        p50, p90 = self.latency_percentiles()
+        latency = f"p50 {p50:.2f}s, p90 {p90:.2f}s" if p50 is not None else "no samples"
+        return (f"{self.host}: limit {int(self.limit)}/{self.max_limit}, in flight {self.in_flight}, "
+                f"{latency}, {self.decreases} decreases")
+
+
+# One request holding a slot of an AdaptiveLimit
+# The latency runs from the moment the slot is granted to record(), called once the response headers are in
+class RequestSlot:
+    def __init__(self, adaptive_limit):
+        self.adaptive_limit = adaptive_limit
+        self.start_time = monotonic()
+        self.recorded = False
+
+    def record(self, status, retry_after=None):
+        self.recorded = True
+        self.adaptive_limit.on_response(monotonic() - self.start_time, status, retry_after)
+
+    # Function to count a request that failed before any response as an overload when it timed out or lost its connection
+    def record_error(self, error):
+        if not self.recorded and isinstance(error, OVERLOAD_ERRORS):
+            self.recorded = True
+            self.adaptive_limit.on_response(monotonic() - self.start_time, error=error)
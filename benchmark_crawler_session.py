@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from crawler_client import create_crawler_session
+
+# Benchmark of one aiohttp session per page fetch against the shared crawler session, on a local TLS server
+# Usage: python benchmark_crawler_session.py --requests 500 --concurrency 8
+
+PAGE = ('<html><head><title>Benchmark page</title></head><body>'
+        + '<p>Benchmark paragraph <a href="/next">link</a> <img src="/image.png"></p>' * 50
+        + '</body></html>')
+
+
+# Function to create a self-signed certificate for 127.0.0.1 with the openssl command line tool
+def create_certificate(folder):
+    certfile = os.path.join(folder, 'cert.pem')
+    keyfile = os.path.join(folder, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-keyout', keyfile, '-out', certfile, '-subj', '/CN=127.0.0.1',
+                    '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+# Function to start the local TLS test server, counting the connections (and so the TLS handshakes) it accepts
+async def start_server(certfile, keyfile, connections):
+    async def handle(request):
+        connections.add(request.transport)
+        return web.Response(text=PAGE, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(certfile, keyfile)
+    site = web.TCPSite(runner, '127.0.0.1', 0, ssl_context=server_context)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, port
+
+
+# The previous crawl_url path, opening a fresh session for every page fetch
+async def fetch_with_new_session(url, client_context, session=None):
+    async with aiohttp.ClientSession() as new_session:
+        async with new_session.get(url, ssl=client_context) as response:
+            await response.text()
+
+
+# The shared session path of crawl_url
+async def fetch_with_shared_session(url, client_context, session):
+    async with session.get(url, ssl=client_context) as response:
+        await response.text()
+
+
+# Function to fetch request_count pages with at most concurrency requests in flight
+async def run_fetches(fetch, base_url, request_count, concurrency, client_context, session=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def bounded_fetch(i):
+        async with semaphore:
+            start_time = time.perf_counter()
+            await fetch(f"{base_url}/page-{i}", client_context, session)
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(bounded_fetch(i) for i in range(request_count)))
+    return time.perf_counter() - start_time, latencies
+
+
+async def run_benchmark(args, certfile, keyfile):
+    connections = set()
+    runner, port = await start_server(certfile, keyfile, connections)
+    base_url = f"https://127.0.0.1:{port}"
+    client_context = ssl.create_default_context(cafile=certfile)
+    try:
+        for name in ('Session per request', 'Shared session'):
+            connections.clear()
+            if name == 'Shared session':
+                async with create_crawler_session(max_connections_per_host=args.concurrency) as session:
+                    duration, latencies = await run_fetches(fetch_with_shared_session, base_url, args.requests,
+                                                            args.concurrency, client_context, session)
+            else:
+                duration, latencies = await run_fetches(fetch_with_new_session, base_url, args.requests,
+                                                        args.concurrency, client_context)
+            latencies.sort()
+            print(f"{name:>19}: {duration:.2f} seconds, {args.requests / duration:.0f} requests/second, "
+                  f"median latency {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                  f"{len(connections)} TLS handshakes")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare one session per page fetch with the shared crawler session.')
+    parser.add_argument('--requests', type=int, default=500, help='Number of page fetches per mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of fetches in flight at once')
+    parser.add_argument('--certfile', help='Server certificate for 127.0.0.1, generated with openssl when omitted')
+    parser.add_argument('--keyfile', help='Private key of the server certificate')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.certfile and args.keyfile:
+            certfile, keyfile = args.certfile, args.keyfile
+        else:
+            certfile, keyfile = create_certificate(folder)
+        print(f"Local TLS server: {args.requests} page fetches per mode, {args.concurrency} in flight")
+        asyncio.run(run_benchmark(args, certfile, keyfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import heapq
+import random
+from time import time as current_time
+
+from crawl_frontier import CrawlFrontier
+
+# Benchmark of the crawl order: links in sitemap file order against the priority frontier
+# Usage: python benchmark_frontier.py --links 20000 --sites 8 --fresh 0.05 --workers 16
+# The crawl is simulated: each worker takes the next link and waits for its host's rate limit, so a run
+# of links from one host holds the workers up behind that host (head-of-line blocking). Reported are the
+# mean time until the fresh links (lastmod within the last day) are fetched, and the time to fetch them all.
+
+
+# Function to build the rows of a links CSV: url, lastmod epoch, priority, changefreq
+def make_rows(link_count, site_count, fresh_share, now, rng):
+    rows = []
+    for site in range(site_count):
+        # Sites are listed one after another, the larger ones first, like concatenated sitemaps
+        share = link_count * (site_count - site) * 2 // (site_count * (site_count + 1))
+        for page in range(share):
+            fresh = rng.random() < fresh_share
+            age = rng.uniform(0, 86400) if fresh else rng.uniform(86400, 365 * 86400)
+            changefreq = 'daily' if fresh else rng.choice(['weekly', 'monthly', 'yearly'])
+            rows.append([f"https://site{site}.example/page{page}", str(now - age), f"{rng.choice([0.3, 0.5, 0.8]):.1f}",
+                         changefreq])
+    return rows
+
+
+# Function to simulate crawling rows in order, returning the fetch end time of every URL
+def simulate(rows, workers, host_interval, fetch_time):
+    free_workers = [0.0] * workers
+    host_ready = {}
+    finished = {}
+    for row in rows:
+        url = row[0]
+        host = url.split('/')[2]
+        worker_free = heapq.heappop(free_workers)
+        start = max(worker_free, host_ready.get(host, 0.0))
+        host_ready[host] = start + host_interval
+        finished[url] = start + fetch_time
+        heapq.heappush(free_workers, finished[url])
+    return finished
+
+
+def report(name, finished, fresh_urls):
+    fresh_times = [finished[url] for url in fresh_urls]
+    print(f"{name:>10}: fresh links fetched after {sum(fresh_times) / len(fresh_times):.1f} s on average "
+          f"(last at {max(fresh_times):.1f} s), all links after {max(finished.values()):.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the file order and the frontier order of a crawl.')
+    parser.add_argument('--links', type=int, default=20000, help='Number of links')
+    parser.add_argument('--sites', type=int, default=8, help='Number of sites')
+    parser.add_argument('--fresh', type=float, default=0.05, help='Share of links modified within the last day')
+    parser.add_argument('--workers', type=int, default=16, help='Number of crawl workers')
+    parser.add_argument('--rate', type=float, default=5.0, help='Requests per second allowed per host')
+    parser.add_argument('--fetch-time', type=float, default=0.3, help='Seconds a page fetch takes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    now = current_time()
+    rows = make_rows(args.links, args.sites, args.fresh, now, random.Random(args.seed))
+    fresh_urls = [row[0] for row in rows if now - float(row[1]) < 86400]
+    frontier = CrawlFrontier(now=now)
+    for row in rows:
+        frontier.push(row[0], float(row[1]), float(row[2]), row[3], row)
+    print(f"{len(rows)} links on {args.sites} sites, {len(fresh_urls)} fresh, {args.workers} workers, "
+          f"{args.rate:g} requests/s per host")
+    report('file order', simulate(rows, args.workers, 1 / args.rate, args.fetch_time), fresh_urls)
+    report('frontier', simulate(list(frontier), args.workers, 1 / args.rate, args.fetch_time), fresh_urls)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import pickle
+import random
+import time
+
+from latency_sketch import DEFAULT_MAX_BUCKETS, DEFAULT_RELATIVE_ACCURACY, SUMMARY_QUANTILES, QuantileSketch
+
+# Benchmark of the latency sketches against exact percentiles
+# Usage: python benchmark_latency_sketch.py --samples 1000000 --shards 4
+# Latencies are drawn from a log-normal distribution with a slow tail, split across shards, sketched per
+# shard and merged, as the crawl does with the sketches of its shard processes.
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare merged latency sketches with exact percentiles.')
+    parser.add_argument('--samples', type=int, default=1000000, help='Number of latencies')
+    parser.add_argument('--shards', type=int, default=4, help='Number of sketches merged together')
+    parser.add_argument('--relative-accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY)
+    parser.add_argument('--max-buckets', type=int, default=DEFAULT_MAX_BUCKETS)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latencies = [rng.lognormvariate(-1.5, 0.6) * (20 if rng.random() < 0.02 else 1) for _ in range(args.samples)]
+
+    shards = [QuantileSketch(args.relative_accuracy, args.max_buckets) for _ in range(args.shards)]
+    start_time = time.perf_counter()
+    for index, seconds in enumerate(latencies):
+        shards[index % args.shards].add(seconds)
+    add_time = time.perf_counter() - start_time
+
+    merged = QuantileSketch(args.relative_accuracy, args.max_buckets)
+    start_time = time.perf_counter()
+    for shard in shards:
+        merged.merge(pickle.loads(pickle.dumps(shard)))
+    merge_time = time.perf_counter() - start_time
+
+    exact = sorted(latencies)
+    print(f"{args.samples} latencies in {args.shards} sketches: {add_time / args.samples * 1e9:.0f} ns per add, "
+          f"merged in {merge_time * 1000:.1f} ms, {len(merged.buckets)} buckets, "
+          f"{len(pickle.dumps(merged))} bytes pickled")
+    for name, q in SUMMARY_QUANTILES + (('p99.9', 0.999),):
+        true_value = exact[int(q * (len(exact) - 1))]
+        estimate = merged.quantile(q)
+        print(f"{name:>6}: exact {true_value * 1000:8.1f} ms, sketch {estimate * 1000:8.1f} ms, "
+              f"error {abs(estimate - true_value) / true_value:.2%}")
+
+
+if __name__ == '__main__':
+    main()
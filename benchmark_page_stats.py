@@ -0,0 +1,119 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import page_stats
+from page_stats import CHUNK_SIZE, PageStatsStream
+
+# Benchmark of the streaming page stats against the BeautifulSoup path of crawl_url, on synthetic product pages
+# Usage: python benchmark_page_stats.py --pages 200 --products 40
+
+
+# Function to build a synthetic product page with a menu, a gallery, a description and related products
+def build_product_page(index, related_count):
+    parts = ['<!DOCTYPE html>\n<html lang="el"><head><meta charset="utf-8">',
+             f'<title>Benchmark product {index} | Vape Travellers</title>',
+             '<meta name="viewport" content="width=device-width, initial-scale=1">',
+             '<link rel="stylesheet" href="/wp-content/themes/store/style.css">',
+             '<style>' + '.product-card{display:flex;margin:0 auto;padding:8px}' * 40 + '</style>',
+             '<script type="application/ld+json">{"@type":"Product","name":"Benchmark product",'
+             '"offers":{"price":"19.90","priceCurrency":"EUR"}}</script>',
+             '<script>var menu = "<a href=\\"/\\">not a link</a>";' + 'window.dataLayer.push({});' * 80 + '</script>',
+             '</head><body class="product-template-default">']
+    parts.append('<header><nav><ul>')
+    for i in range(60):
+        parts.append(f'<li class="menu-item"><a href="/product-category/category-{i}/">Category {i}</a></li>')
+    parts.append('</ul></nav></header><main><div class="product">')
+    for i in range(8):
+        parts.append(f'<figure><a href="/wp-content/uploads/product-{index}-{i}.jpg">'
+                     f'<img src="/wp-content/uploads/product-{index}-{i}-300x300.jpg" alt="Gallery {i}" '
+                     f'srcset="/wp-content/uploads/product-{index}-{i}-600x600.jpg 600w"></a></figure>')
+    parts.append('<div class="description">')
+    for i in range(30):
+        parts.append(f'<p>Paragraph {i} of the product description with <strong>details</strong> &amp; '
+                     f'specifications, <em>shipping</em> information and a <a href="/faq/#q{i}">FAQ link</a>.</p>')
+    parts.append('<!-- <img src="/commented-out.png"> --></div></div><section class="related"><ul>')
+    for i in range(related_count):
+        parts.append(f'<li class="product-card"><a href="/product/related-{index}-{i}/">'
+                     f'<img src="/wp-content/uploads/related-{i}-300x300.jpg" alt="Related {i}" loading="lazy">'
+                     f'<h2>Related product {i}</h2><span class="price">{i + 9}.90&euro;</span></a>'
+                     f'<a class="button" href="/?add-to-cart={i}">Add to cart</a></li>')
+    parts.append('</ul></section></main><footer>')
+    for i in range(20):
+        parts.append(f'<a href="/page-{i}/">Footer link {i}</a> ')
+    parts.append('</footer></body></html>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+# Function to split a page into chunks like a streamed response body
+def iter_chunks(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+# The previous BeautifulSoup path of crawl_url
+def stats_with_beautifulsoup(content):
+    text = content.decode('utf-8')
+    soup = BeautifulSoup(text, 'html.parser')
+    return soup.title.string, len(soup.find_all('img')), len(soup.find_all('a'))
+
+
+# The streaming path of crawl_url
+def stats_with_stream(content):
+    stats = PageStatsStream('utf-8')
+    for chunk in iter_chunks(content):
+        stats.feed(chunk)
+    stats = stats.close()
+    return stats.title, stats.num_images, stats.num_links
+
+
+# The streaming path without lxml, tokenized by html.parser
+def stats_with_tokenizer(content):
+    etree, page_stats.etree = page_stats.etree, None
+    try:
+        return stats_with_stream(content)
+    finally:
+        page_stats.etree = etree
+
+
+# Function to measure the CPU time of a method over every page, then its peak traced memory on one page
+def measure(get_stats, pages):
+    gc.collect()
+    start_time = time.process_time()
+    results = [get_stats(content) for content in pages]
+    cpu_time = time.process_time() - start_time
+    tracemalloc.start()
+    get_stats(pages[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return results, cpu_time, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the streaming page stats with BeautifulSoup.')
+    parser.add_argument('--pages', type=int, default=200, help='Number of product pages to read')
+    parser.add_argument('--products', type=int, default=40, help='Number of related products on every page')
+    args = parser.parse_args()
+
+    pages = [build_product_page(i, args.products) for i in range(args.pages)]
+    print(f"Pages: {args.pages} product pages of {len(pages[0]) / 1024:.0f} KB")
+
+    methods = [('BeautifulSoup', stats_with_beautifulsoup), ('Tokenizer', stats_with_tokenizer)]
+    if page_stats.etree is not None:
+        methods.append(('Streaming', stats_with_stream))
+    results = {}
+    for name, get_stats in methods:
+        stats, cpu_time, peak = measure(get_stats, pages)
+        results[name] = stats
+        print(f"{name:>13}: {cpu_time / len(pages) * 1000:.2f} ms CPU per page, "
+              f"peak memory {peak / 1024:.0f} KB per page, stats of the first page {stats[0]}")
+
+    if any(stats != results['BeautifulSoup'] for stats in results.values()):
+        print("Warning: the methods returned different stats")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from sitemap_parser import CHUNK_SIZE, iter_sitemap_entries
+
+# Benchmark of the streaming sitemap parser against the BeautifulSoup(r.content, 'xml') path
+# Usage: python benchmark_sitemap_parser.py --urls 50000
+
+
+# Function to build a synthetic sitemap document
+def build_sitemap(url_count):
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for i in range(url_count):
+        parts.append(f'<url><loc>https://vapetravellers.eu/product/benchmark-product-{i}/</loc>'
+                     f'<lastmod>2023-09-{1 + i % 28:02d}T12:{i % 60:02d}:00+03:00</lastmod>'
+                     f'<changefreq>daily</changefreq><priority>0.{1 + i % 9}</priority></url>\n')
+    parts.append('</urlset>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+# Function to split a document into chunks like a streamed response body
+def iter_chunks(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+# The former BeautifulSoup path of get_sitemap_links
+def parse_with_beautifulsoup(content, current_datetime):
+    soup = BeautifulSoup(content, 'xml')
+    links = []
+    for url in soup.find_all('url'):
+        loc = url.find('loc')
+        lastmod = url.find('lastmod')
+        if loc and lastmod:
+            if lastmod.string >= current_datetime:
+                links.append(loc.string)
+    return links
+
+
+# The streaming path of get_sitemap_links
+def parse_with_stream(content, current_datetime):
+    links = []
+    for entry in iter_sitemap_entries(iter_chunks(content), 'url'):
+        if entry.loc and entry.lastmod and entry.lastmod >= current_datetime:
+            links.append(entry.loc)
+    return links
+
+
+# Function to time a parser and record its peak traced memory
+def measure(parse, content, current_datetime):
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    links = parse(content, current_datetime)
+    duration = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return links, duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the streaming sitemap parser with BeautifulSoup.')
+    parser.add_argument('--urls', type=int, default=50000, help='Number of <url> entries in the synthetic sitemap')
+    parser.add_argument('--cutoff', default='2023-09-15T00:00:00+03:00', help='lastmod cutoff used for filtering')
+    args = parser.parse_args()
+
+    content = build_sitemap(args.urls)
+    print(f"Sitemap: {args.urls} URLs, {len(content) / 1024 / 1024:.1f} MB")
+
+    results = {}
+    for name, parse in (('BeautifulSoup', parse_with_beautifulsoup), ('Streaming', parse_with_stream)):
+        links, duration, peak = measure(parse, content, args.cutoff)
+        results[name] = links
+        print(f"{name:>13}: {duration:.2f} seconds, peak memory {peak / 1024 / 1024:.1f} MB, {len(links)} links")
+
+    if results['BeautifulSoup'] != results['Streaming']:
+        print("Warning: the two parsers returned different links")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from adaptive_concurrency import percentile
+from crawl_queue import run_crawl_queue
+from crawler_client import create_crawler_session
+from http_transport import TRANSPORTS, response_protocol
+from page_stats import read_page_stats
+
+# Benchmark of the crawler transports (aiohttp HTTP/1.1, httpx HTTP/2, HTTP/3) through the same fetch path as crawl_url
+# Usage: python benchmark_transports.py --url https://vapetravellers.eu/ --requests 200 --concurrency 16
+# Every transport fetches the same pages; the protocol column shows what was actually negotiated.
+
+
+# Function to fetch every job through the crawl queue on one transport
+async def run_transport(transport, urls, request_count, concurrency):
+    latencies = []
+    protocols = Counter()
+    errors = Counter()
+    page_bytes = 0
+
+    async def fetch(url):
+        nonlocal page_bytes
+        start_time = time.perf_counter()
+        try:
+            async with session.get(url, headers={'User-Agent': 'benchmark_transports'}) as response:
+                response.raise_for_status()
+                stats = await read_page_stats(response)
+                protocols[response_protocol(response)] += 1
+            page_bytes += stats.page_length
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+
+    jobs = ((urls[i % len(urls)],) for i in range(request_count))
+    async with create_crawler_session(transport=transport, max_connections_per_host=concurrency) as session:
+        start_time = time.perf_counter()
+        await run_crawl_queue(jobs, fetch, workers=concurrency)
+        duration = time.perf_counter() - start_time
+    return duration, sorted(latencies), protocols, errors, page_bytes
+
+
+async def run_benchmark(args):
+    for transport in args.transports:
+        duration, latencies, protocols, errors, page_bytes = await run_transport(transport, args.url, args.requests,
+                                                                                 args.concurrency)
+        p50, p90, p99 = (percentile(latencies, fraction) for fraction in (0.5, 0.9, 0.99))
+        latency = f"p50 {p50 * 1000:.0f} ms, p90 {p90 * 1000:.0f} ms, p99 {p99 * 1000:.0f} ms" if latencies else "no pages"
+        print(f"{transport:>8}: {len(latencies) / duration:.1f} pages/s, {page_bytes / duration / 1024 / 1024:.2f} MB/s, "
+              f"{latency}, protocols {dict(protocols)}, errors {dict(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the crawler transports on the same pages.')
+    parser.add_argument('--url', action='append', required=True, help='Page to fetch, may be given several times')
+    parser.add_argument('--requests', type=int, default=200, help='Number of page fetches per transport')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of fetches in flight')
+    parser.add_argument('--transports', default=','.join(TRANSPORTS), help='Comma-separated transports to compare')
+    args = parser.parse_args()
+    args.transports = [transport.strip() for transport in args.transports.split(',') if transport.strip()]
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == '__main__':
+    main()
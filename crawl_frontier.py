@@ -0,0 +1,128 @@
+import heapq
+import itertools
+from time import time as current_time
+from urllib.parse import urlsplit
+
+# Defaults of the frontier scoring
+DEFAULT_RECENCY_HALF_LIFE_HOURS = 24
+DEFAULT_RECENCY_WEIGHT = 1.0
+DEFAULT_PRIORITY_WEIGHT = 0.5
+DEFAULT_CHANGEFREQ_WEIGHT = 0.25
+DEFAULT_SITE_WEIGHT = 1.0
+
+# Default number of links a frontier holds at once while it orders a links file
+DEFAULT_MAX_LINKS = 100000
+
+# Sitemap <priority> of an entry that gives none, as in the sitemap protocol
+DEFAULT_PRIORITY = 0.5
+
+# Score of each sitemap <changefreq>, higher for pages that change more often
+CHANGEFREQ_SCORES = {'always': 1.0, 'hourly': 0.9, 'daily': 0.8, 'weekly': 0.6, 'monthly': 0.4, 'yearly': 0.2,
+                     'never': 0.0}
+DEFAULT_CHANGEFREQ_SCORE = 0.5
+
+
+# Function to read the [Frontier] settings, falling back to the defaults above
+# Site weights are listed as host=weight pairs in site_weights
+def frontier_settings(config):
+    site_weights = {}
+    for item in config.get('Frontier', 'site_weights', fallback='').split(','):
+        host, _, weight = item.partition('=')
+        if host.strip() and weight.strip():
+            site_weights[host.strip().lower()] = float(weight)
+    return {
+        'recency_half_life': config.getfloat('Frontier', 'recency_half_life_hours', fallback=DEFAULT_RECENCY_HALF_LIFE_HOURS) * 3600,
+        'recency_weight': config.getfloat('Frontier', 'recency_weight', fallback=DEFAULT_RECENCY_WEIGHT),
+        'priority_weight': config.getfloat('Frontier', 'priority_weight', fallback=DEFAULT_PRIORITY_WEIGHT),
+        'changefreq_weight': config.getfloat('Frontier', 'changefreq_weight', fallback=DEFAULT_CHANGEFREQ_WEIGHT),
+        'site_weights': site_weights,
+        'max_links': config.getint('Frontier', 'max_links', fallback=DEFAULT_MAX_LINKS),
+    }
+
+
+# Function to read a number from a CSV field, None when it is empty or malformed
+def parse_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Priority frontier of the links queued for crawling and submission
+# Each link is scored on the recency of its lastmod (halving every recency_half_life seconds), its sitemap
+# <priority> and its <changefreq>, and kept in a heap of its own site. Popping the frontier takes the
+# links best first within each site, while the sites take turns in proportion to their weights, so one
+# busy site never holds the workers up behind its own rate limit. Links can be pushed between pops.
+class CrawlFrontier:
+    def __init__(self, recency_half_life=DEFAULT_RECENCY_HALF_LIFE_HOURS * 3600,
+                 recency_weight=DEFAULT_RECENCY_WEIGHT, priority_weight=DEFAULT_PRIORITY_WEIGHT,
+                 changefreq_weight=DEFAULT_CHANGEFREQ_WEIGHT, site_weights=None, now=None):
+        self.recency_half_life = recency_half_life
+        self.recency_weight = recency_weight
+        self.priority_weight = priority_weight
+        self.changefreq_weight = changefreq_weight
+        self.site_weights = site_weights or {}
+        self.now = now or current_time()
+        self.sites = {}
+        self.turns = []  # (turn, site) of every site with links queued, the lowest turn popped next
+        self.turn = 0.0  # Turn of the last link popped
+        self.sequence = itertools.count()  # Keeps links of equal score in their original order
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    # Function to score a link from its lastmod epoch, priority and changefreq
+    def score(self, lastmod=None, priority=None, changefreq=None):
+        recency = 0.0
+        if lastmod is not None:
+            recency = 0.5 ** (max(0.0, self.now - lastmod) / self.recency_half_life)
+        if priority is None:
+            priority = DEFAULT_PRIORITY
+        changefreq_score = CHANGEFREQ_SCORES.get((changefreq or '').strip().lower(), DEFAULT_CHANGEFREQ_SCORE)
+        return (self.recency_weight * recency + self.priority_weight * min(1.0, max(0.0, priority))
+                + self.changefreq_weight * changefreq_score)
+
+    # Function to queue a link, keeping the row it came with to hand back
+    def push(self, url, lastmod=None, priority=None, changefreq=None, row=None):
+        site = (urlsplit(url).hostname or '').lower()
+        links = self.sites.get(site)
+        if links is None:
+            # A site queued late takes its first turn now, not ahead of the sites already taking turns
+            links = self.sites[site] = []
+            heapq.heappush(self.turns, (self.turn, site))
+        heapq.heappush(links, (-self.score(lastmod, priority, changefreq), next(self.sequence), row or [url]))
+        self.size += 1
+
+    # Function to pop the next link, best first within its site, sites interleaved by weight (stride scheduling)
+    def pop(self):
+        self.turn, site = heapq.heappop(self.turns)
+        links = self.sites[site]
+        row = heapq.heappop(links)[2]
+        self.size -= 1
+        if links:
+            heapq.heappush(self.turns, (self.turn + 1 / max(self.site_weights.get(site, DEFAULT_SITE_WEIGHT), 1e-6), site))
+        else:
+            del self.sites[site]
+        return row
+
+    # Pops every link in frontier order
+    def __iter__(self):
+        while self.size:
+            yield self.pop()
+
+
+# Function to order the rows of a links CSV (url, lastmod epoch, priority, changefreq) through a frontier
+# The frontier holds max_links rows at most: each row popped makes room for the next one read, so memory
+# stays flat however long the file is, and the links are ordered within that window of the file.
+# Rows holding only the URL get the default score
+def iter_frontier(rows, max_links=DEFAULT_MAX_LINKS, **settings):
+    frontier = CrawlFrontier(**settings)
+    for row in rows:
+        if not row:
+            continue
+        fields = row + [None] * (4 - len(row))
+        frontier.push(row[0], parse_number(fields[1]), parse_number(fields[2]), fields[3], row)
+        if len(frontier) >= max_links:
+            yield frontier.pop()
+    yield from frontier
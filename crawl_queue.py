@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+# Default size of the crawl worker pool
+DEFAULT_WORKERS = 16
+
+# Default number of queued jobs per worker before the producer has to wait
+DEFAULT_QUEUE_DEPTH = 4
+
+# Marker telling a worker that no more jobs will come
+STOP = object()
+
+
+# Function to run handle(*job) for every job through a fixed pool of worker coroutines
+# Jobs are pulled lazily from the iterable into a bounded asyncio.Queue, so the producer waits
+# whenever the workers fall behind and only a bounded number of jobs is alive at any time.
+# With a delay, the producer waits that long before queueing each job to keep the request rate.
+# With a RetryScheduler, the jobs handle() scheduled for a retry are fed back into the queue as they
+# come due, and the run only ends once none is left.
+# Returns the number of jobs handled.
+async def run_crawl_queue(jobs, handle, workers=DEFAULT_WORKERS, queue_size=None, delay=0, retries=None):
+    queue = asyncio.Queue(maxsize=queue_size or workers * DEFAULT_QUEUE_DEPTH)
+    handled = 0
+
+    async def worker():
+        nonlocal handled
+        while True:
+            job = await queue.get()
+            try:
+                if job is STOP:
+                    return
+                await handle(*job)
+                handled += 1
+            except Exception as e:
+                logging.error(f"Failed to handle crawl job {job}. Exception: {e}")
+            finally:
+                queue.task_done()
+
+    worker_tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        for job in jobs:
+            if retries is not None:
+                for retry_job in retries.pop_due():
+                    await queue.put(retry_job)
+            if delay:
+                await asyncio.sleep(delay)
+            await queue.put(job)
+
+        # Keep feeding the retries until the queue is idle and none is left
+        while retries is not None:
+            await queue.join()
+            if not retries:
+                break
+            await asyncio.sleep(retries.next_delay())
+            for retry_job in retries.pop_due():
+                await queue.put(retry_job)
+    except BaseException:
+        for worker_task in worker_tasks:
+            worker_task.cancel()
+        await asyncio.gather(*worker_tasks, return_exceptions=True)
+        raise
+    for _ in worker_tasks:
+        await queue.put(STOP)
+    await asyncio.gather(*worker_tasks)
+    return handled
@@ -0,0 +1,66 @@
+import logging
+
+import aiohttp
+
+from http_transport import TRANSPORT_AIOHTTP, TRANSPORT_FALLBACKS, TRANSPORTS, create_transport_session
+from request_timings import create_trace_config
+from transfer_stats import accept_encoding
+
+# Default connection settings of the crawl and submission session
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 8
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_REQUEST_TIMEOUT = 60
+DEFAULT_TRANSPORT = TRANSPORT_AIOHTTP
+
+
+# Function to read the [Crawler] connection settings, falling back to the defaults above
+def crawler_settings(config):
+    return {
+        'transport': config.get('Crawler', 'transport', fallback=DEFAULT_TRANSPORT).strip().lower(),
+        'max_connections': config.getint('Crawler', 'max_connections', fallback=DEFAULT_MAX_CONNECTIONS),
+        'max_connections_per_host': config.getint('Crawler', 'max_connections_per_host', fallback=DEFAULT_MAX_CONNECTIONS_PER_HOST),
+        'keepalive_timeout': config.getfloat('Crawler', 'keepalive_timeout', fallback=DEFAULT_KEEPALIVE_TIMEOUT),
+        'dns_cache_ttl': config.getint('Crawler', 'dns_cache_ttl', fallback=DEFAULT_DNS_CACHE_TTL),
+        'connect_timeout': config.getfloat('Crawler', 'connect_timeout', fallback=DEFAULT_CONNECT_TIMEOUT),
+        'read_timeout': config.getfloat('Crawler', 'read_timeout', fallback=DEFAULT_READ_TIMEOUT),
+        'request_timeout': config.getfloat('Crawler', 'request_timeout', fallback=DEFAULT_REQUEST_TIMEOUT),
+    }
+
+
+# Function to create the session shared by every crawl and submission coroutine of a run
+# Connections are pooled and kept alive per host and DNS answers are cached, so each page fetch
+# after the first one to a host skips the DNS lookup and the TCP and TLS handshakes.
+# With transport 'httpx' (HTTP/2) or 'http3' the session comes from http_transport and takes the same
+# get() calls; a transport whose libraries are missing falls back to the next one down to aiohttp.
+# Every transport asks for the best content encoding it can inflate and inflates bodies as they stream in.
+# A RequestTimings passed to get() as trace_request_ctx gets the phase timings of the request.
+def create_crawler_session(transport=DEFAULT_TRANSPORT,
+                           max_connections=DEFAULT_MAX_CONNECTIONS,
+                           max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                           keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                           dns_cache_ttl=DEFAULT_DNS_CACHE_TTL,
+                           connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                           read_timeout=DEFAULT_READ_TIMEOUT,
+                           request_timeout=DEFAULT_REQUEST_TIMEOUT):
+    if transport not in TRANSPORTS:
+        logging.error(f"Unknown transport {transport}, crawling over {TRANSPORT_AIOHTTP} instead")
+        transport = TRANSPORT_AIOHTTP
+    while transport != TRANSPORT_AIOHTTP:
+        session = create_transport_session(transport, max_connections, max_connections_per_host, keepalive_timeout,
+                                           connect_timeout, read_timeout, request_timeout)
+        if session is not None:
+            return session
+        logging.error(f"The {transport} transport is not installed, trying {TRANSPORT_FALLBACKS[transport]} instead")
+        transport = TRANSPORT_FALLBACKS[transport]
+    connector = aiohttp.TCPConnector(limit=max_connections,
+                                     limit_per_host=max_connections_per_host,
+                                     keepalive_timeout=keepalive_timeout,
+                                     use_dns_cache=True,
+                                     ttl_dns_cache=dns_cache_ttl)
+    timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout, sock_read=read_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'Accept-Encoding': accept_encoding()},
+                                 trace_configs=[create_trace_config()])
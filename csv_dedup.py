@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import heapq
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+
+# Default memory ceiling of a full deduplication pass, in bytes
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Rough cost of one URL hash held in a Python set, used to keep full passes under the memory ceiling
+HASH_ENTRY_BYTES = 100
+
+# Size of the block sampled to estimate the number of rows of a file
+SAMPLE_SIZE = 64 * 1024
+
+# Upper bound on the partition files open at once in external mode
+MAX_PARTITIONS = 256
+
+
+# Function to hash a URL into a signed 64-bit integer for the SQLite index
+# At 64 bits a collision stays unlikely well into billions of URLs
+def url_hash(url):
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+# Function to estimate the number of rows of a CSV file from the line length of its first block
+def estimate_rows(filename):
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        head = f.read(SAMPLE_SIZE)
+    lines = head.count(b'\n')
+    if not lines:
+        return 1
+    return size * lines // len(head) + 1
+
+
+# Function to deduplicate a CSV file in one pass, keeping the first occurrence of each URL
+# Returns False without finishing when more than max_entries distinct URLs would have to be held
+def dedupe_in_memory(source, destination, max_entries):
+    seen = set()
+    with open(source, 'r', newline='', encoding='utf-8') as infile, \
+            open(destination, 'w', newline='', encoding='utf-8') as outfile:
+        reader = csv.reader(infile)
+        writer = csv.writer(outfile)
+        for row in reader:
+            if not row:
+                continue
+            key = url_hash(row[0])
+            if key in seen:
+                continue
+            if len(seen) >= max_entries:
+                return False
+            seen.add(key)
+            writer.writerow([row[0]])
+    return True
+
+
+# Function to read the (row number, url) pairs of a partition file
+def read_partition(filename):
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        for row_number, url in csv.reader(f):
+            yield int(row_number), url
+
+
+# Function to deduplicate a CSV file too large for memory, keeping the first occurrence of each URL
+# Rows are spread over hash partitions small enough to dedupe one at a time, tagged with their row
+# number, then the surviving rows of every partition are merged back in their original order.
+def dedupe_external(source, destination, max_entries):
+    partition_count = min(MAX_PARTITIONS, max(2, -(-estimate_rows(source) // max_entries) * 2))
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(destination))) as temp_folder:
+        partitions = [os.path.join(temp_folder, f'part{i}.csv') for i in range(partition_count)]
+        kept_partitions = [os.path.join(temp_folder, f'kept{i}.csv') for i in range(partition_count)]
+
+        # Spread the rows over the partitions by URL hash, so duplicates always land together
+        partition_files = [open(partition, 'w', newline='', encoding='utf-8') for partition in partitions]
+        try:
+            writers = [csv.writer(f) for f in partition_files]
+            with open(source, 'r', newline='', encoding='utf-8') as infile:
+                for row_number, row in enumerate(csv.reader(infile)):
+                    if row:
+                        writers[url_hash(row[0]) % partition_count].writerow([row_number, row[0]])
+        finally:
+            for f in partition_files:
+                f.close()
+
+        # Keep the first occurrence of each URL within every partition, still in row order
+        for partition, kept_partition in zip(partitions, kept_partitions):
+            seen = set()
+            with open(kept_partition, 'w', newline='', encoding='utf-8') as outfile:
+                writer = csv.writer(outfile)
+                for row_number, url in read_partition(partition):
+                    key = url_hash(url)
+                    if key not in seen:
+                        seen.add(key)
+                        writer.writerow([row_number, url])
+            os.remove(partition)
+
+        # Merge the partitions back by row number to restore the first-seen order
+        with open(destination, 'w', newline='', encoding='utf-8') as outfile:
+            writer = csv.writer(outfile)
+            for row_number, url in heapq.merge(*(read_partition(kept) for kept in kept_partitions)):
+                writer.writerow([url])
+
+
+# Deduplication of append-only URL CSV files against a persistent hash index kept in SQLite
+# New URLs are filtered at insert time, so each cycle only costs as much as the data it adds, and
+# rows keep the order they were first seen in. Rows appended by other writers are caught up from
+# the byte offset indexed last time. A file seen for the first time (or one that shrank) gets one
+# full pass, in memory when its distinct URLs fit under memory_limit, else through hash partitions on disk.
+class CsvDeduplicator:
+    def __init__(self, filename, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.filename = filename
+        self.memory_limit = memory_limit
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS dedup_files (
+                file_id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, indexed_size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dedup_hashes (
+                file_id INTEGER NOT NULL, hash INTEGER NOT NULL,
+                PRIMARY KEY (file_id, hash)
+            ) WITHOUT ROWID;
+        """)
+
+    # Function to get the id and indexed size of a CSV file, -1 when it was never indexed
+    def file_entry(self, csv_filename):
+        name = os.path.abspath(csv_filename)
+        row = self.connection.execute('SELECT file_id, indexed_size FROM dedup_files WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            return row
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO dedup_files (name, indexed_size) VALUES (?, -1)', (name,))
+        return cursor.lastrowid, -1
+
+    # Function to append to a CSV file the URLs that are not in it yet
+    # Returns the number of URLs appended
+    def append_unique(self, csv_filename, urls):
+        file_id = self.sync(csv_filename)
+        return self.append_rows(csv_filename, file_id, urls)
+
+    # Function to bring the index of a CSV file up to date with rows appended by other writers
+    # Only the tail written since the last sync is read, and duplicate rows in it are dropped from the file
+    # Returns the file id
+    def sync(self, csv_filename):
+        file_id, indexed_size = self.file_entry(csv_filename)
+        size = os.path.getsize(csv_filename) if os.path.exists(csv_filename) else 0
+        if size == indexed_size:
+            return file_id
+        if indexed_size < 0 or size < indexed_size:
+            self.rebuild(csv_filename, file_id)
+            return file_id
+
+        # Move the new tail aside, cut it off the file and append back only its unseen URLs
+        with tempfile.TemporaryFile() as tail:
+            with open(csv_filename, 'r+b') as f:
+                f.seek(indexed_size)
+                shutil.copyfileobj(f, tail)
+                f.truncate(indexed_size)
+            tail.seek(0)
+            reader = csv.reader(io.TextIOWrapper(tail, encoding='utf-8', newline=''))
+            self.append_rows(csv_filename, file_id, (row[0] for row in reader if row))
+        return file_id
+
+    # Function to append the unseen URLs to a CSV file and index them in one transaction
+    # The hashes are only committed once the rows are on disk, so an interrupted append is
+    # picked up again as an unindexed tail by the next sync.
+    def append_rows(self, csv_filename, file_id, urls):
+        appended = 0
+        with self.connection:
+            with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                for url in urls:
+                    cursor = self.connection.execute('INSERT OR IGNORE INTO dedup_hashes (file_id, hash) VALUES (?, ?)',
+                                                     (file_id, url_hash(url)))
+                    if cursor.rowcount == 1:
+                        writer.writerow([url])
+                        appended += 1
+            self.connection.execute('UPDATE dedup_files SET indexed_size = ? WHERE file_id = ?',
+                                    (os.path.getsize(csv_filename), file_id))
+        return appended
+
+    # Function to deduplicate a whole CSV file in first-seen order and index it from scratch
+    def rebuild(self, csv_filename, file_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM dedup_hashes WHERE file_id = ?', (file_id,))
+            size = 0
+            if os.path.exists(csv_filename):
+                temp_filename = f"{csv_filename}.tmp"
+                if not dedupe_in_memory(csv_filename, temp_filename, self.memory_limit // HASH_ENTRY_BYTES):
+                    dedupe_external(csv_filename, temp_filename, self.memory_limit // HASH_ENTRY_BYTES)
+                os.replace(temp_filename, csv_filename)
+                with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+                    self.connection.executemany('INSERT OR IGNORE INTO dedup_hashes (file_id, hash) VALUES (?, ?)',
+                                                ((file_id, url_hash(row[0])) for row in csv.reader(csvfile) if row))
+                size = os.path.getsize(csv_filename)
+            self.connection.execute('UPDATE dedup_files SET indexed_size = ? WHERE file_id = ?', (size, file_id))
+
+    def close(self):
+        self.connection.close()
@@ -1,10 +1,14 @@
 import asyncio
-import httpx
 from bs4 import BeautifulSoup
 import csv
 import logging
 import configparser
 from datetime import datetime
+from crawl_queue import DEFAULT_QUEUE_DEPTH, DEFAULT_WORKERS, run_crawl_queue
+from crawler_client import crawler_settings, create_crawler_session
+from http_transport import TRANSPORT_HTTP3, response_protocol
+from page_stats import read_page_stats
+from rate_limiter import HostRateLimiter, rate_limit_settings
 
 # Initialize logging for loop
 logging.basicConfig(filename='Loop_Log.txt', level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,29 +32,38 @@ async def write_last_loop_time(filename, datetime_str):
     except Exception as e:
         logging.error(f"Failed to write to {filename}. Exception: {e}")
 
-async def get_sitemap_index(url):
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url)
+async def get_sitemap_index(url, session):
+    async with session.get(url) as r:
         r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
+        soup = BeautifulSoup(await r.read(), 'xml')
         sitemaps = [loc.string for loc in soup.find_all('loc')]
         return sitemaps
 
-async def get_sitemap_links(sitemap_url, current_datetime):
-    async with httpx.AsyncClient() as client:
-        r = await client.get(sitemap_url)
+async def get_sitemap_links(sitemap_url, current_datetime, session):
+    async with session.get(sitemap_url) as r:
         r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
+        soup = BeautifulSoup(await r.read(), 'xml')
         links = [url.find('loc').string for url in soup.find_all('url') if url.find('lastmod').string >= current_datetime]
         return links
 
-async def crawl_url(url, user_agent):
+async def crawl_url(url, user_agent, session, limiter):
     headers = {'User-Agent': user_agent}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, headers=headers)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, 'html.parser')
-        logging.info(f'Successfully crawled {url} with {user_agent}. Title: {soup.title.string}')
+    try:
+        # Wait for the host's rate limit and adaptive concurrency limit, then report the response back to it
+        async with limiter.limit(url) as slot:
+            async with session.get(url, headers=headers) as r:
+                slot.record(r.status, r.headers.get('Retry-After'))
+                r.raise_for_status()
+                stats = await read_page_stats(r)
+                logging.info(f'Successfully crawled {url} with {user_agent} over {response_protocol(r)}. Title: {stats.title}')
+    except Exception as e:
+        logging.error(f"Failed to crawl {url}. Exception: {e}")
+
+# Function to list the (url, user agent) crawl jobs of the links
+def crawl_jobs(links, desktop_agents, mobile_agents):
+    for link in links:
+        for user_agent in desktop_agents + mobile_agents:
+            yield link, user_agent
 
 async def main():
     current_datetime = await read_last_loop_time('datetime.txt')
@@ -61,16 +74,29 @@ async def main():
     mobile_agents = config['UserAgents']['mobile_agents'].split(',')
     sitemap_index_urls = config['Sitemaps']['sitemap_index_urls'].split(',')
 
-    async with aiofiles.open('sitemap_links.csv', mode='a', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        
-        for sitemap_index_url in sitemap_index_urls:
-            sitemaps = await get_sitemap_index(sitemap_index_url)
-            for sitemap in sitemaps:
-                links = await get_sitemap_links(sitemap, current_datetime)
-                for link in links:
-                    writer.writerow([link])
-                    await csvfile.flush()
+    # One session for the whole run, over HTTP/3 where the hosts offer it and HTTP/2 otherwise
+    settings = crawler_settings(config)
+    settings['transport'] = TRANSPORT_HTTP3
+    workers = config.getint('Crawler', 'workers', fallback=DEFAULT_WORKERS)
+    queue_size = config.getint('Crawler', 'queue_size', fallback=workers * DEFAULT_QUEUE_DEPTH)
+    limiter = HostRateLimiter(*rate_limit_settings(config))
+    async with create_crawler_session(**settings) as session:
+        all_links = []
+        with open('sitemap_links.csv', mode='a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+
+            for sitemap_index_url in sitemap_index_urls:
+                sitemaps = await get_sitemap_index(sitemap_index_url.strip(), session)
+                for sitemap in sitemaps:
+                    links = await get_sitemap_links(sitemap, current_datetime, session)
+                    for link in links:
+                        writer.writerow([link])
+                    all_links.extend(links)
+
+        # Crawl the new links with every user agent
+        await run_crawl_queue(crawl_jobs(all_links, desktop_agents, mobile_agents),
+                              lambda url, user_agent: crawl_url(url, user_agent, session, limiter),
+                              workers=workers, queue_size=queue_size)
 
     await write_last_loop_time('datetime.txt', datetime.now().strftime('%Y-%m-%dT%H:%M:%S+02:00'))
 
@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
 import time
 import logging
@@ -11,7 +9,10 @@ import random
 from datetime import datetime
 from datetime import timedelta
 from time import time as current_time
-from pytz import timezone
+from crawler_client import crawler_settings, create_crawler_session
+from page_stats import read_page_stats
+from lastmod_watermarks import WatermarkStore, parse_lastmod_epoch
+from sitemap_discovery import discover_sitemap_links
 
 # Initialize logging
 logging.basicConfig(filename='crawling_log.txt', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -43,49 +44,6 @@ def write_last_loop_time(filename, datetime_str):
     except Exception as e:
         logging.error(f"Failed to write to {filename}. Exception: {e}")
 
-# Function to get sitemap index
-def get_sitemap_index(url):
-    logging.debug(f"url def: {url}")
-    try:
-        r = requests.get(url)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
-        sitemaps = []
-        lastmod_times = []  # Added to store lastmod times
-        for sitemap in soup.find_all('sitemap'):  # Loop through each sitemap element
-            loc = sitemap.find('loc')
-            lastmod = sitemap.find('lastmod')
-            if loc:
-                sitemaps.append(loc.string)
-            if lastmod:
-                lastmod_str = lastmod.string.replace("<![CDATA[", "").replace("]]>", "")  # Remove CDATA
-                lastmod_time = datetime.fromisoformat(lastmod_str)  # Parse to datetime object
-                lastmod_time = lastmod_time.astimezone(timezone('Europe/Athens'))  # Convert to Athens time
-                lastmod_time_str = lastmod_time.strftime('%Y-%m-%dT%H:%M:%S+02:00')  # Convert to string in desired format
-                lastmod_times.append(lastmod_time_str)
-                logging.debug(f"Sitemap def: {sitemaps}, Last Modified Time def: {lastmod_times}")
-        return sitemaps, lastmod_times  # Modified to return lastmod times as well
-    except requests.RequestException as e:
-        logging.error(f"Failed to fetch sitemap index for {url}. Exception: {e}")
-        return [], []  # Modified to return empty lists for both
-
-# Function to get sitemap links
-def get_sitemap_links(sitemap_url, current_datetime):
-    try:
-        r = requests.get(sitemap_url)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
-        links = []
-        for url in soup.find_all('url'):
-            loc = url.find('loc')
-            lastmod = url.find('lastmod')
-            if loc and lastmod:
-                if lastmod.string >= current_datetime:
-                    links.append(loc.string)
-        return links
-    except requests.RequestException as e:
-        logging.error(f"Failed to fetch sitemap links for {sitemap_url}. Exception: {e}")
-        return []
 import csv
 
 def remove_duplicates_from_csv(filename):
@@ -111,60 +69,57 @@ def remove_duplicates_from_csv(filename):
         print(f"Failed to write to {filename}. Exception: {e}")
 
 # Asynchronous crawl_url function
-async def crawl_url(url, user_agent):
+async def crawl_url(url, user_agent, session):
     headers = {'User-Agent': user_agent}
     start_time = current_time()
     # Read the Bing IndexNow key from the configuration file
     bing_key = config['BingIndexNow']['key']
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                end_time = current_time()
-                duration = end_time - start_time
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                page_length = len(text)
-                num_images = len(soup.find_all('img'))
-                num_links = len(soup.find_all('a'))
-                logging.info(f'Successfully crawled {url} with {user_agent}. Title: {soup.title.string}, Page Length: {page_length}, Images: {num_images}, Links: {num_links}, Duration: {duration:.2f} seconds')
-
-                # Check if the URL exists in Bing_Submission.csv
-                with open('Bing_Submission.csv', 'r', newline='', encoding='utf-8') as csvfile:
-                    reader = csv.reader(csvfile)
-                    if url not in [row[0] for row in reader]:
-                        # Submit the URL to Bing IndexNow
-                        bing_url = f"https://www.bing.com/indexnow?url={url}&key={bing_key}"
-                        async with session.get(bing_url) as bing_response:
-                            bing_response.raise_for_status()
-                            logging.info(f"Successfully submitted {url} to Bing IndexNow.")
-                        
-                        # Append the URL to Bing_Submission.csv
-                        with open('Bing_Submission.csv', 'a', newline='', encoding='utf-8') as csvfile:
-                            writer = csv.writer(csvfile)
-                            writer.writerow([url])
-
-        except Exception as e:
+    try:
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
             end_time = current_time()
             duration = end_time - start_time
-            logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
+            stats = await read_page_stats(response)
+            logging.info(f'Successfully crawled {url} with {user_agent}. Title: {stats.title}, Page Length: {stats.page_length}, Images: {stats.num_images}, Links: {stats.num_links}, Duration: {duration:.2f} seconds')
+
+            # Check if the URL exists in Bing_Submission.csv
+            with open('Bing_Submission.csv', 'r', newline='', encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                if url not in [row[0] for row in reader]:
+                    # Submit the URL to Bing IndexNow
+                    bing_url = f"https://www.bing.com/indexnow?url={url}&key={bing_key}"
+                    async with session.get(bing_url) as bing_response:
+                        bing_response.raise_for_status()
+                        logging.info(f"Successfully submitted {url} to Bing IndexNow.")
+                    
+                    # Append the URL to Bing_Submission.csv
+                    with open('Bing_Submission.csv', 'a', newline='', encoding='utf-8') as csvfile:
+                        writer = csv.writer(csvfile)
+                        writer.writerow([url])
+
+    except Exception as e:
+        end_time = current_time()
+        duration = end_time - start_time
+        logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
 
 async def crawl_all_urls(desktop_agents, mobile_agents, rate_limit):
     delay = 1 / rate_limit  # time to wait between requests
-    with open('sitemap_links.csv', 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        tasks = []
-        for row in reader:
-            url = row[0]
-            for user_agent in desktop_agents:  # Loop through desktop user agents
-                await asyncio.sleep(delay)  # Introduce delay for rate limiting
-                task = asyncio.ensure_future(crawl_url(url, user_agent))
-                tasks.append(task)
-            for user_agent in mobile_agents:  # Loop through mobile user agents (if you want to use them)
-                await asyncio.sleep(delay)  # Introduce delay for rate limiting
-                task = asyncio.ensure_future(crawl_url(url, user_agent))
-                tasks.append(task)
-        await asyncio.gather(*tasks)
+    # One pooled session shared by every page fetch and Bing submission of the run
+    async with create_crawler_session(**crawler_settings(config)) as session:
+        with open('sitemap_links.csv', 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            tasks = []
+            for row in reader:
+                url = row[0]
+                for user_agent in desktop_agents:  # Loop through desktop user agents
+                    await asyncio.sleep(delay)  # Introduce delay for rate limiting
+                    task = asyncio.ensure_future(crawl_url(url, user_agent, session))
+                    tasks.append(task)
+                for user_agent in mobile_agents:  # Loop through mobile user agents (if you want to use them)
+                    await asyncio.sleep(delay)  # Introduce delay for rate limiting
+                    task = asyncio.ensure_future(crawl_url(url, user_agent, session))
+                    tasks.append(task)
+            await asyncio.gather(*tasks)
 
 
 # Main function
@@ -191,28 +146,21 @@ def main():
             loop_start_datetime = datetime.now().strftime('%Y-%m-%dT%H:%M:%S+02:00')
             loop_log.write(f'Start Time: {loop_start_datetime}\n')
 
+            # Timer for 'Get all links'
+            start_time = current_time()
+
+            # Expand every sitemap index and child sitemap concurrently
+            watermarks = WatermarkStore(default_epoch=parse_lastmod_epoch(current_datetime))
+            links = asyncio.run(discover_sitemap_links(sitemap_index_urls, watermarks))
+
             # Open a CSV file to append links
             with open('sitemap_links.csv', 'a', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
+                for link in links:
+                    writer.writerow([link])
 
-            # Timer for 'Get individual sitemaps'
-            start_time = current_time()
-            for sitemap_index_url in sitemap_index_urls:
-                sitemaps, lastmod_times = get_sitemap_index(sitemap_index_url)
-                elapsed_time = timedelta(seconds=int(current_time() - start_time))
-                print(f"Get individual sitemaps: {elapsed_time}")
-
-                # Timer for 'Get all links'
-                start_time = current_time()
-                for sitemap, lastmod_time in zip(sitemaps, lastmod_times):
-                    logging.debug(f"Sitemap: {sitemap}, Last Modified Time: {lastmod_time}")
-                    if lastmod_time >= current_datetime:
-                        links = get_sitemap_links(sitemap, lastmod_time)
-                        for link in links:
-                            writer.writerow([link])
-                            csvfile.flush()
-                elapsed_time = timedelta(seconds=int(current_time() - start_time))
-                print(f"Get all links: {elapsed_time}")
+            elapsed_time = timedelta(seconds=int(current_time() - start_time))
+            print(f"Get all links: {elapsed_time}")
 
             # Timer for 'Remove all the duplicate URLs'
             start_time = current_time()
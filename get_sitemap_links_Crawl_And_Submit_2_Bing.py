@@ -1,3 +1,4 @@
+import argparse
 import requests
 from bs4 import BeautifulSoup
 import csv
@@ -9,6 +10,7 @@ import aiohttp
 import asyncio
 import random
 import json
+import hashlib
 import google.auth
 import requests_oauth2
 import httplib2
@@ -19,6 +21,27 @@ from time import time as current_time
 from google.oauth2 import service_account
 from google.auth.transport.requests import AuthorizedSession
 from oauth2client.service_account import ServiceAccountCredentials
+from crawl_frontier import frontier_settings, iter_frontier
+from crawl_queue import DEFAULT_QUEUE_DEPTH, DEFAULT_WORKERS, run_crawl_queue
+from crawler_client import crawler_settings, create_crawler_session
+from csv_dedup import CsvDeduplicator
+from lastmod_filter import LastmodDecoder
+from latency_sketch import LatencyMetrics, metrics_settings
+from lastmod_watermarks import WatermarkStore, parse_lastmod_epoch
+from page_parser import PageParserPool, parser_settings
+from page_stats import PageStats, body_limit_settings, content_type_allowed, read_page_body, read_page_stats
+from rate_limiter import HostRateLimiter, rate_limit_settings
+from retry_scheduler import RetryScheduler, is_retryable, retry_settings
+from request_timings import RequestTimings, format_timings
+from robots_sitemaps import RobotsCache
+from sharded_crawl import (DEFAULT_SHARD_BY, CrawlReport, create_shared_buckets, current_shard_buckets, merge_reports,
+                           run_shards, shard_of, split_rate_limits)
+from sitemap_cache import SitemapValidatorCache
+from sitemap_discovery import discover_sitemap_links
+from sitemap_snapshots import SnapshotStore
+from transfer_stats import TransferStats, response_encoding, response_wire_bytes
+from ua_variants import UaVariantPlanner, variant_settings
+from url_state_store import STATE_FAILED, STATE_REJECTED, STATE_SUBMITTED, UrlStateStore
 
 #athens_dt_pytz = utc_dt.astimezone(athens_tz)  # Convert to Athens time, automatically accounting for DST
 #print("Using datetime.timezone:", athens_timezone) # Debug Print
@@ -55,7 +78,18 @@ csv_Bing_Submission = os.path.join(data_folder_absolute, 'Bing_Submission.csv')
 csv_Bing_Submission_Errors = os.path.join(data_folder_absolute, 'Bing_Submission_Errors.csv')
 csv_Google_Submission = os.path.join(data_folder_absolute, 'Google_Submission.csv')
 csv_sitemap_links = os.path.join(data_folder_absolute, 'sitemap_links.csv')
+csv_sitemap_delta = os.path.join(data_folder_absolute, 'sitemap_delta.csv')
+csv_sitemap_removed = os.path.join(data_folder_absolute, 'sitemap_removed_links.csv')
+csv_sitemap_frontier = os.path.join(data_folder_absolute, 'sitemap_frontier.csv')
 txt_datetime = os.path.join(data_folder_absolute, 'datetime.txt')
+json_sitemap_cache = os.path.join(data_folder_absolute, 'sitemap_cache.json')
+json_watermarks = os.path.join(data_folder_absolute, 'watermarks.json')
+json_robots_cache = os.path.join(data_folder_absolute, 'robots_cache.json')
+json_ua_variants = os.path.join(data_folder_absolute, 'ua_variants.json')
+json_latency_summary = os.path.join(data_folder_absolute, 'latency_summary.json')
+db_sitemap_snapshots = os.path.join(data_folder_absolute, 'sitemap_snapshots.db')
+db_url_states = os.path.join(data_folder_absolute, 'url_states.db')
+db_url_dedup = os.path.join(data_folder_absolute, 'url_dedup.db')
 txt_crawling_log = os.path.join(data_folder_absolute, 'crawling_log.txt')
 txt_loop_log = os.path.join(data_folder_absolute, 'Loop_Log.txt')
 
@@ -83,106 +117,65 @@ def write_last_loop_time(filename, datetime_obj):
     except Exception as e:
         logging.error(f"Failed to write to {filename}. Exception: {e}")
 
-# Function to get sitemap index
-def get_sitemap_index(url):
-    logging.debug(f"url def: {url}")
-    try:
-        r = requests.get(url)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
-        sitemaps = []
-        lastmod_times = []  # Added to store lastmod times
-        for sitemap in soup.find_all('sitemap'):  # Loop through each sitemap element
-            loc = sitemap.find('loc')
-            lastmod = sitemap.find('lastmod')
-            if loc:
-                sitemaps.append(loc.string)
-            if lastmod:
-                lastmod_str = lastmod.string.replace("<![CDATA[", "").replace("]]>", "")  # Remove CDATA
-                lastmod_time = datetime.fromisoformat(lastmod_str)  # Parse to datetime object
-                lastmod_time = lastmod_time.astimezone(program_timezone)  # Convert to Athens time
-                lastmod_time_str = lastmod_time.strftime('%Y-%m-%dT%H:%M:%S+02:00')  # Convert to string in desired format
-                lastmod_times.append(lastmod_time_str)
-                logging.debug(f"Sitemap def: {sitemaps}, Last Modified Time def: {lastmod_times}")
-        return sitemaps, lastmod_times  # Modified to return lastmod times as well
-    except requests.RequestException as e:
-        logging.error(f"Failed to fetch sitemap index for {url}. Exception: {e}")
-        return [], []  # Modified to return empty lists for both
-
-# Function to get sitemap links
-def get_sitemap_links(sitemap_url, current_datetime):
-    try:
-        r = requests.get(sitemap_url)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.content, 'xml')
-        links = []
-        for url in soup.find_all('url'):
-            loc = url.find('loc')
-            lastmod = url.find('lastmod')
-            if loc and lastmod:
-                if lastmod.string >= current_datetime:
-                    links.append(loc.string)
-        return links
-    except requests.RequestException as e:
-        logging.error(f"Failed to fetch sitemap links for {sitemap_url}. Exception: {e}")
-        return []
 import csv
 
-def remove_duplicates_from_csv(filename):
-    unique_links = set()
-    
-    # Read the CSV and store unique links in a set
-    try:
-        with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            for row in reader:
-                unique_links.add(row[0])
-    except FileNotFoundError:
-        print(f"File {filename} not found.")
-        return
-    
-    # Write the unique links back to the CSV
-    try:
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            for link in unique_links:
-                writer.writerow([link])
-    except Exception as e:
-        print(f"Failed to write to {filename}. Exception: {e}")
-
-async def submit_to_bing(url, session):
+async def submit_to_bing(url, session, url_states, limiter, retries=None, metrics=None):
     try:
         bing_key = config['BingIndexNow']['key']
-        # Check if the URL exists in Bing_Submission.csv
-        with open(csv_Bing_Submission, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            if url not in [row[0] for row in reader]:
-                # Submit the URL to Bing IndexNow
-                bing_url = f"https://www.bing.com/indexnow?url={url}&key={bing_key}"
+        # Check if the URL was already submitted to Bing
+        if not url_states.is_submitted('bing', url):
+            # Submit the URL to Bing IndexNow
+            bing_url = f"https://www.bing.com/indexnow?url={url}&key={bing_key}"
+            async with limiter.limit(bing_url) as slot:
+                request_start = current_time()
                 async with session.get(bing_url) as bing_response:
+                    slot.record(bing_response.status, bing_response.headers.get('Retry-After'))
                     bing_response.raise_for_status()
+                    if metrics is not None:
+                        metrics.observe('submission', 'bing', current_time() - request_start)
                     logging.info(f"Successfully submitted {url} to Bing IndexNow.")
-                
-                # Append the URL to Bing_Submission.csv
-                with open(csv_Bing_Submission, 'a', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow([url])
+            url_states.set_state('bing', url, STATE_SUBMITTED)
+            if retries is not None:
+                retries.forget((url,))
+
+            # Append the URL to Bing_Submission.csv
+            with open(csv_Bing_Submission, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow([url])
     except Exception as e:
         logging.error(f"Failed to submit {url} to Bing IndexNow. Exception: {e}")
-        with open(csv_Bing_Submission_Errors, 'a', newline='', encoding='utf-8') as csvfile:
+        if metrics is not None:
+            metrics.observe('submission', 'bing')
+        # A URL Bing answered with a final status, such as a 4xx other than 408, 425 and 429, is never retried
+        rejected = isinstance(e, aiohttp.ClientResponseError) and not is_retryable(e)
+        url_states.set_state('bing', url, STATE_REJECTED if rejected else STATE_FAILED)
+        # Retry later while the URL has retries left, else keep it for the next run
+        if retries is None or not retries.retry((url,), e):
+            with open(csv_Bing_Submission_Errors, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow([url])
+
+# Function to queue the Bing submissions that failed in the previous runs for another attempt, once per process
+# They come from the URL state store, where a URL stays failed until a submission of it succeeds, so a run
+# that stops before its retries are over loses none of them. The attempts stored with a URL count against
+# its retry budget, and the URLs that used it up or were rejected are not loaded again.
+def load_bing_submission_errors(url_states, retries):
+    for url, attempts in url_states.urls_with_attempts('bing', STATE_FAILED, retries.max_attempts):
+        retries.schedule((url,), attempts=attempts)
+
+# Function to rewrite Bing_Submission_Errors.csv with the URLs still failing, once the retries are over
+def save_bing_submission_errors(url_states):
+    temp_filename = f"{csv_Bing_Submission_Errors}.tmp"
+    try:
+        with open(temp_filename, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow([url])
-            await countdown_timer(300.00)  # call the countdown function and request a 300 seconds delay for rate limiting
-
-async def countdown_timer(seconds):
-    print("\n")  # This will move the cursor to a new line
-    for i in range(seconds, 0, -1):
-        print(f'\rCountdown: {i} seconds remaining', end='', flush=True)
-        await asyncio.sleep(1)
-    print('\rCountdown complete!                   ', end='', flush=True)
-    print("\n")  # This will move the cursor to a new line
-					
-def submit_to_google(url):
+            for url in url_states.urls('bing', STATE_FAILED):
+                writer.writerow([url])
+        os.replace(temp_filename, csv_Bing_Submission_Errors)
+    except OSError as e:
+        logging.error(f"Failed to write {csv_Bing_Submission_Errors}. Exception: {e}")
+
+def submit_to_google(url, url_states, metrics=None):
     try:
         service_account_email = config['GoogleIndexAPIjson']['Google_service_account_email']
         google_json_file = config['GoogleIndexAPIjson']['file']
@@ -195,102 +188,223 @@ def submit_to_google(url):
         # Initialize http Variable with the credentials
         http = credentials.authorize(httplib2.Http())
 
-        with open(csv_Google_Submission, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            if url not in [row[0] for row in reader]:
-                # Prepare the request data for URL notification
-                url_notification_data = {
-                    "url": url,
-                    "type": "URL_UPDATED"
-                }
-
-                # Send the request to the Google Indexing API
-                response, content = http.request(ENDPOINT, method="POST", body=json.dumps(url_notification_data))
-
-                # Check if the response contains a status code
-                if 'status' in response:
-                    status_code = response['status']
-                    if status_code == '200':
-                        logging.info(f"Successfully submitted {url} to Google Indexing API")
-
-                        # Append the URL to Google_Submission.csv only if successful
-                        with open(csv_Google_Submission, 'a', newline='', encoding='utf-8') as csvfile:
-                            writer = csv.writer(csvfile)
-                            writer.writerow([url])
-                    else:
-                        # Log the HTTP status code and the response content
-                        logging.error(f"Failed to submit {url} to Google Indexing API. HTTP Status Code: {status_code}")
-                        logging.error(f"API Response Content: {content}")
+        # Check if the URL was already submitted to Google
+        if not url_states.is_submitted('google', url):
+            # Prepare the request data for URL notification
+            url_notification_data = {
+                "url": url,
+                "type": "URL_UPDATED"
+            }
+
+            # Send the request to the Google Indexing API
+            request_start = current_time()
+            response, content = http.request(ENDPOINT, method="POST", body=json.dumps(url_notification_data))
+            if metrics is not None:
+                metrics.observe('submission', 'google', current_time() - request_start
+                                if response.get('status') == '200' else None)
+
+            # Check if the response contains a status code
+            if 'status' in response:
+                status_code = response['status']
+                if status_code == '200':
+                    logging.info(f"Successfully submitted {url} to Google Indexing API")
+                    url_states.set_state('google', url, STATE_SUBMITTED)
+
+                    # Append the URL to Google_Submission.csv only if successful
+                    with open(csv_Google_Submission, 'a', newline='', encoding='utf-8') as csvfile:
+                        writer = csv.writer(csvfile)
+                        writer.writerow([url])
                 else:
-                    # Log a message when the response does not contain a status code
-                    logging.error(f"Failed to submit {url} to Google Indexing API. No HTTP status code in the response.")
+                    # Log the HTTP status code and the response content
+                    logging.error(f"Failed to submit {url} to Google Indexing API. HTTP Status Code: {status_code}")
+                    logging.error(f"API Response Content: {content}")
+                    url_states.set_state('google', url, STATE_FAILED)
+            else:
+                # Log a message when the response does not contain a status code
+                logging.error(f"Failed to submit {url} to Google Indexing API. No HTTP status code in the response.")
     except Exception as e:
         # Log any other exceptions that may occur
         logging.error(f"Failed to submit {url} to Google Indexing API. Exception: {e}")
 
 # Asynchronous crawl_url function
-async def crawl_url(url, user_agent):
+async def crawl_url(url, user_agent, session, limiter, page_parser, retries=None, planner=None, body_limits=None,
+                    transfers=None, metrics=None):
     headers = {'User-Agent': user_agent}
     start_time = current_time()
     # Read the Bing IndexNow key from the configuration file
     bing_key = config['BingIndexNow']['key']
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
+    try:
+        # Wait for the host's rate limit and adaptive concurrency limit, then report the response back to it
+        async with limiter.limit(url) as slot:
+            # The transport's trace hooks time the queueing, DNS, connect, TLS and first byte of the request
+            timings = RequestTimings()
+            async with session.get(url, headers=headers, trace_request_ctx=timings) as response:
+                slot.record(response.status, response.headers.get('Retry-After'))
                 response.raise_for_status()
                 end_time = current_time()
                 duration = end_time - start_time
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-                page_length = len(text)
-                num_images = len(soup.find_all('img'))
-                num_links = len(soup.find_all('a'))
-                logging.info(f'Successfully crawled {url} with {user_agent}. Title: {soup.title.string}, Page Length: {page_length}, Images: {num_images}, Links: {num_links}, Duration: {duration:.2f} seconds')
+                # Hash the body for the user agent planner
+                digest = hashlib.blake2b() if planner is not None else None
+                # Read at most max_bytes of the body, and only of the allowed content types; leaving the
+                # response then hands the connection back without waiting for the rest of the body
+                body_limits = body_limits or {}
+                text = None
+                if page_parser is None:
+                    # Count the title, images and links as the body streams in
+                    stats = await read_page_stats(response, digest, **body_limits)
+                elif content_type_allowed(response, body_limits.get('content_types')):
+                    body, truncated = await read_page_body(response, body_limits.get('max_bytes'))
+                    text = body.decode(response.charset or 'utf-8', errors='replace')
+                    if digest is not None:
+                        digest.update(body)
+                else:
+                    stats = PageStats(None, 0, 0, 0, skipped=True)
+                # A skipped body has no hash to tell the agents apart by
+                if planner is not None and (text is not None or not stats.skipped):
+                    planner.observe(url, user_agent, response.headers.get('Vary'), digest.hexdigest())
+                content_type = response.headers.get('Content-Type')
+                # Bytes the body took on the wire, before the transport inflated it
+                wire_bytes = response_wire_bytes(response)
+                content_encoding = response_encoding(response)
+                if transfers is not None and (text is not None or not stats.skipped):
+                    transfers.record(url, response, len(body) if text is not None else stats.page_length)
+                phase_timings = timings.finish()
+
+        if text is not None:
+            # Parse the page in the executor, with the connection and the host's slot already released
+            stats = (await page_parser.parse(text))._replace(truncated=truncated)
+        stats = stats._replace(timings=phase_timings)
+        if metrics is not None:
+            metrics.observe_fetch(url, user_agent, phase_timings['total'])
+        if stats.skipped:
+            logging.info(f'Skipped the body of {url} with {user_agent}. Content-Type: {content_type}, Duration: {duration:.2f} seconds')
+            return stats
+        logging.info(f'Successfully crawled {url} with {user_agent}. Title: {stats.title}, Page Length: {stats.page_length}, Images: {stats.num_images}, Links: {stats.num_links}, Truncated: {stats.truncated}, Wire Bytes: {wire_bytes}, Content-Encoding: {content_encoding}, Duration: {duration:.2f} seconds, Timings: {format_timings(phase_timings)}')
+        return stats
 
-        except Exception as e:
-            end_time = current_time()
-            duration = end_time - start_time
-            logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
-            await countdown_timer(300.00)  # call the countdown function and request a 300 seconds delay for rate limiting
+    except Exception as e:
+        end_time = current_time()
+        duration = end_time - start_time
+        logging.error(f"Failed to crawl {url}. Exception: {e}, Duration: {duration:.2f} seconds")
+        if metrics is not None:
+            metrics.observe_fetch(url, user_agent)
+        if retries is not None:
+            retries.retry((url, user_agent), e)
+        return None
 
 async def write_to_csv(counter, current_date):
     with open(csv_bing_iterations, 'w') as f:
         f.write(f"{current_date},{counter}")
 
-async def crawl_all_urls_2(desktop_agents, mobile_agents, delay, crawl_counter, session,sitemap_links_reader):
+# Function to list the (url, user agent) crawl jobs of the links, alternating desktop and mobile agents
+# With a UaVariantPlanner the desktop and mobile fetch are one when both agents get the same page, and
+# its verification samples are fetched with every agent
+def crawl_jobs(desktop_agents, mobile_agents, sitemap_links_reader, planner=None):
+    user_agent_index = 0  # Initialize an index variable to keep track of the user agents
+    for row in sitemap_links_reader:
+        url = row[0]
+        # Cycle through desktop and mobile user agents
+        user_agents = [desktop_agents[user_agent_index % len(desktop_agents)],
+                       mobile_agents[user_agent_index % len(mobile_agents)]]
+        if planner is not None:
+            user_agents = planner.plan(url, user_agents, desktop_agents + mobile_agents)
+        for user_agent in user_agents:
+            yield url, user_agent
+        user_agent_index += 1  # Increment the user agent index
+
+# Returns the CrawlReport of the fetches
+async def crawl_all_urls_2(desktop_agents, mobile_agents, limiter, crawl_counter, session,sitemap_links_reader, planner=None):
+    report = CrawlReport()
+    report.metrics = LatencyMetrics(**metrics_settings(config))
+    start_time = current_time()
     try:
-        tasks = []
         print("\n")  # This will move the cursor to a new line
-        user_agent_index = 0  # Initialize an index variable to keep track of the user agents
-        row = next(sitemap_links_reader, None)
-        while row:
-            url = row[0]
-    
-            # Cycle through desktop user agents
-            selected_desktop_agent = desktop_agents[user_agent_index % len(desktop_agents)]
-            await asyncio.sleep(delay)
-            task = asyncio.ensure_future(crawl_url(url, selected_desktop_agent))
-            tasks.append(task)
-            crawl_counter += 1
-            print(f'\rCrawled URLs: {crawl_counter}', end='', flush=True)
-    
-            # Cycle through mobile user agents
-            selected_mobile_agent = mobile_agents[user_agent_index % len(mobile_agents)]
-            await asyncio.sleep(delay)
-            task = asyncio.ensure_future(crawl_url(url, selected_mobile_agent))
-            tasks.append(task)
+        workers = config.getint('Crawler', 'workers', fallback=DEFAULT_WORKERS)
+        queue_size = config.getint('Crawler', 'queue_size', fallback=workers * DEFAULT_QUEUE_DEPTH)
+
+        # Failed fetches come back through the queue once their backoff is over
+        retries = RetryScheduler(**retry_settings(config))
+
+        # With deep analysis on, whole pages are parsed in batches off the event loop, so fetching goes on
+        # while the parsers are busy; otherwise only their stats are read from the stream
+        page_parser = None
+        if config.getboolean('Parsing', 'deep_analysis', fallback=False):
+            page_parser = PageParserPool(**parser_settings(config))
+        body_limits = body_limit_settings(config)
+
+        # Count each fetch as it finishes
+        async def crawl_job(url, user_agent):
+            nonlocal crawl_counter
+            report.add(await crawl_url(url, user_agent, session, limiter, page_parser, retries, planner, body_limits,
+                                       report.transfers, report.metrics), url, user_agent)
             crawl_counter += 1
             print(f'\rCrawled URLs: {crawl_counter}', end='', flush=True)
-    
-            # Increment the user agent index
-            user_agent_index += 1
-    
-            row = next(sitemap_links_reader, None)  # Move to the next row
-        await asyncio.gather(*tasks)
+
+        # Feed the jobs lazily from the CSV reader to a fixed pool of workers
+        try:
+            await run_crawl_queue(crawl_jobs(desktop_agents, mobile_agents, sitemap_links_reader, planner), crawl_job,
+                                  workers=workers, queue_size=queue_size, retries=retries)
+        finally:
+            if page_parser is not None:
+                page_parser.close()
     except Exception as e:
         logging.error(f"An unexpected error occurred in crawl_all_urls_2. Exception: {e}") 
-
-async def crawl_all_urls(desktop_agents, mobile_agents, rate_limit, bing_rate_limit):
+    report.duration = current_time() - start_time
+    return report
+
+# Function to write the queued links in frontier order, once per cycle, for the Bing submitter and the crawler
+# The priority frontier puts fresh and important links first; with [Frontier] enabled = false, or when the
+# ordered file cannot be written, the links keep the file order. Returns the file to read the links from
+def order_links_file(links_filename):
+    if not config.getboolean('Frontier', 'enabled', fallback=True):
+        return links_filename
+    temp_filename = f"{csv_sitemap_frontier}.tmp"
+    try:
+        with open(links_filename, 'r', newline='', encoding='utf-8') as source, \
+                open(temp_filename, 'w', newline='', encoding='utf-8') as destination:
+            csv.writer(destination).writerows(iter_frontier(csv.reader(source), **frontier_settings(config)))
+        os.replace(temp_filename, csv_sitemap_frontier)
+    except OSError as e:
+        logging.error(f"Failed to order the links of {links_filename}. Exception: {e}")
+        return links_filename
+    return csv_sitemap_frontier
+
+# Function to crawl one shard of the links, run in its own process with its own event loop and connection pool
+def crawl_shard(shard, shard_count, desktop_agents, mobile_agents, rate_limits, links_filename):
+    return asyncio.run(crawl_shard_links(shard, shard_count, desktop_agents, mobile_agents, rate_limits, links_filename))
+
+async def crawl_shard_links(shard, shard_count, desktop_agents, mobile_agents, rate_limits, links_filename):
+    shard_by = config.get('Crawler', 'shard_by', fallback=DEFAULT_SHARD_BY)
+    # Every shard crawls every host when they are split by URL, so each gets a share of the in-flight limits
+    if shard_by != 'host':
+        rate_limits = split_rate_limits(rate_limits, shard_count)
+    # The token buckets are shared with the other processes, so the rates of every host hold across shards
+    limiter = HostRateLimiter(*rate_limits, shared_buckets=current_shard_buckets())
+    planner = open_variant_planner()
+    async with create_crawler_session(**crawler_settings(config)) as session:
+        with open(links_filename, 'r', newline='', encoding='utf-8') as sitemap_reader_csvfile:
+            shard_rows = (row for row in csv.reader(sitemap_reader_csvfile)
+                          if row and shard_of(row[0], shard_count, shard_by) == shard)
+            report = await crawl_all_urls_2(desktop_agents, mobile_agents, limiter, 0, session, shard_rows, planner)
+    limiter.log_limits()
+    # The classes learned here are merged and saved by the parent
+    if planner is not None:
+        planner.log_summary()
+        report.variants = planner.learn()
+    return report
+
+# Function to open the user agent classes, None when the variant planner is off
+def open_variant_planner():
+    if not config.getboolean('UserAgents', 'variant_planner', fallback=True):
+        return None
+    return UaVariantPlanner(json_ua_variants, **variant_settings(config))
+
+# Returns True once every link of links_filename has been handled, False when the Bing quota stopped it early
+# With processes above 1 the crawl is split into that many shards, each crawled by its own process
+# bing_retries is the retry queue of the Bing submissions, kept by main() across cycles
+async def crawl_all_urls(desktop_agents, mobile_agents, rate_limits, links_filename, url_states, processes=1,
+                         bing_retries=None):
+    completed = True
     try:
         counter = 0  # Initialize the counter
         crawl_counter = 0  # Initialize the crawl counter
@@ -313,12 +427,27 @@ async def crawl_all_urls(desktop_agents, mobile_agents, rate_limit, bing_rate_li
         else:
             counter = 0  # Initialize if the file doesn't exist
 		
-        delay = 1 / rate_limit  # time to wait between requests     
-        bing_delay = 1 / bing_rate_limit  # time to wait between requests to Bing IndexNow
-
-        async with aiohttp.ClientSession() as session:  # Create a session here
-            with open(csv_sitemap_links, 'r', newline='', encoding='utf-8') as sitemap_reader_csvfile:
-                sitemap_links_reader = csv.reader(sitemap_reader_csvfile)
+        # Token bucket and in-flight cap per host, shared by the crawler and the Bing submitter
+        # A sharded crawl keeps the token buckets in shared memory, for the shard processes to use as well
+        shared_buckets = create_shared_buckets() if processes > 1 and sitecrawler == True else None
+        limiter = HostRateLimiter(*rate_limits, shared_buckets=shared_buckets)
+
+        # Latency sketches of this cycle's submissions and page fetches, written to latency_summary.json at its end
+        metrics = LatencyMetrics(**metrics_settings(config))
+
+        # Failed Bing submissions of this cycle, after the ones left over from the previous runs
+        if bing_retries is None:
+            bing_retries = RetryScheduler(**retry_settings(config))
+
+        # Links in frontier order, read by the Bing loop and the crawl alike
+        if bingsubmit == True or sitecrawler == True:
+            links_filename = order_links_file(links_filename)
+
+        # One pooled session shared by the Bing submissions and every page fetch of the run
+        async with create_crawler_session(**crawler_settings(config)) as session:
+            with open(links_filename, 'r', newline='', encoding='utf-8') as sitemap_reader_csvfile:
+                # The Bing loop reads the links only when it submits them
+                sitemap_links_reader = csv.reader(sitemap_reader_csvfile) if bingsubmit == True else ()
                 #tasks = []
                 for row in sitemap_links_reader:
                     url = row[0]
@@ -326,8 +455,7 @@ async def crawl_all_urls(desktop_agents, mobile_agents, rate_limit, bing_rate_li
                     current_date = now.date()
                     # Check the counter
                     if bingsubmit == True and counter < 10000:
-                        await asyncio.sleep(bing_delay)  # Introduce delay for rate limiting
-                        await submit_to_bing(url, session)
+                        await submit_to_bing(url, session, url_states, limiter, bing_retries, metrics)
                         counter += 1  # Increment the counter
                         await write_to_csv(counter, now)
                         #print(counter) #display counter
@@ -338,23 +466,89 @@ async def crawl_all_urls(desktop_agents, mobile_agents, rate_limit, bing_rate_li
                         next_run += timedelta(days=1)
                         if now >= next_run:
                             #next_run += timedelta(days=1)
-                            await asyncio.sleep(bing_delay)  # Introduce delay for rate limiting
-                            await submit_to_bing(url, session)
+                            await submit_to_bing(url, session, url_states, limiter, bing_retries, metrics)
                             counter = 0  # Reset the counter
                             counter += 1  # Increment the counter
                             await write_to_csv(counter, now)
                             #print(counter) #display counter
                             print(f'\rSubmited to Bing URLs: {counter}', end='', flush=True) #display counter
                         else:
+                            completed = False
                             break
-                # Second loop to crawl URLs
+                # Retry the failed Bing submissions in the background while the crawl runs
+                async def retry_submission(url):
+                    nonlocal counter
+                    if counter >= 10000:  # Daily quota used up, keep it for the next run
+                        with open(csv_Bing_Submission_Errors, 'a', newline='', encoding='utf-8') as csvfile:
+                            csv.writer(csvfile).writerow([url])
+                        return
+                    await submit_to_bing(url, session, url_states, limiter, bing_retries, metrics)
+                    counter += 1
+                    await write_to_csv(counter, datetime.now(tz))
+
+                bing_retry_task = asyncio.create_task(bing_retries.drain(retry_submission))
+
+                # Second loop to crawl URLs, from the first link again since the Bing loop has read them
                 if sitecrawler == True:
-                    await crawl_all_urls_2(desktop_agents, mobile_agents, delay, crawl_counter, session, sitemap_links_reader)
+                    planner = open_variant_planner()
+                    if shared_buckets is not None:
+                        reports = await run_shards(crawl_shard, processes, shared_buckets, desktop_agents,
+                                                   mobile_agents, rate_limits, links_filename)
+                    else:
+                        sitemap_reader_csvfile.seek(0)
+                        reports = [await crawl_all_urls_2(desktop_agents, mobile_agents, limiter, crawl_counter, session,
+                                                          csv.reader(sitemap_reader_csvfile), planner)]
+                        if planner is not None:
+                            planner.log_summary()
+                            reports[0].variants = planner.learn()
+                    report = merge_reports(reports)
+                    # Keep the user agent classes learned by this cycle's verification runs for the next ones
+                    if planner is not None:
+                        for shard_report in reports:
+                            planner.merge(shard_report.variants)
+                        planner.save()
+                    logging.info(f"Crawl report: {report.summary()}")
+                    report.transfers.log_summary('Crawl')
+                    report.latencies.log_summary()
+                    print(f"\nCrawl report: {report.summary()}")
+                    metrics.merge(report.metrics)
+                await bing_retry_task
+                if bingsubmit == True:
+                    save_bing_submission_errors(url_states)
+                metrics.log_summary()
+                metrics.write_summary(json_latency_summary)
+
+            # Log where the adaptive concurrency limit of every host ended up
+            limiter.log_limits()
     except Exception as e:
         logging.error(f"An unexpected error occurred in crawl_all_urls. Exception: {e}")
+        completed = False
+    return completed
+
+# Function to open the URL state store, importing the submission CSVs the first time
+def open_url_state_store():
+    url_states = UrlStateStore(db_url_states)
+    if url_states.count('bing') == 0:
+        url_states.import_csv('bing', csv_Bing_Submission, STATE_SUBMITTED)
+        url_states.import_csv('bing', csv_Bing_Submission_Errors, STATE_FAILED)
+    if url_states.count('google') == 0:
+        url_states.import_csv('google', csv_Google_Submission, STATE_SUBMITTED)
+    return url_states
 
 # Main function
-def main():
+def main(processes=1):
+    # Per-URL submission state for Bing and Google
+    url_states = open_url_state_store()
+
+    # Retry queue of the failed Bing submissions, seeded with the ones left over from the previous runs at startup
+    bing_retries = RetryScheduler(**retry_settings(config))
+    if bingsubmit == True:
+        load_bing_submission_errors(url_states, bing_retries)
+
+    # Hash index of the URLs already in the CSV files
+    dedup_memory_limit = config.getint('Dedup', 'memory_limit_mb', fallback=256) * 1024 * 1024
+    dedup = CsvDeduplicator(db_url_dedup, dedup_memory_limit)
+
     while True:
         try:
             # Clear the previous crawling log
@@ -365,8 +559,15 @@ def main():
             desktop_agents = config['UserAgents']['desktop_agents'].split(',')
             mobile_agents = config['UserAgents']['mobile_agents'].split(',')
             sitemap_index_urls = config['Sitemaps']['sitemap_index_urls'].split(',')
-            rate_limit = float(config['RateLimit']['requests_per_second'])
-            bing_rate_limit = float(config['RateLimit']['bing_requests_per_second'])
+            rate_limits = rate_limit_settings(config)
+            discovery_connections_per_host = config.getint('Discovery', 'max_connections_per_host', fallback=4)
+            discovery_keepalive_timeout = config.getfloat('Discovery', 'keepalive_timeout', fallback=30)
+            discovery_request_timeout = config.getfloat('Discovery', 'request_timeout', fallback=60)
+            conditional_get = config.getboolean('Discovery', 'conditional_get', fallback=True)
+            discovery_max_depth = config.getint('Discovery', 'max_depth', fallback=5)
+            discovery_max_sitemaps = config.getint('Discovery', 'max_sitemaps', fallback=10000)
+            robots_cache_ttl = config.getfloat('Discovery', 'robots_cache_ttl', fallback=86400)
+            sitemap_diff = config.getboolean('Discovery', 'sitemap_diff', fallback=True)
 
             # Read the last loop time
             current_datetime = read_last_loop_time(txt_datetime)
@@ -379,42 +580,68 @@ def main():
             #print(loop_start_datetime) #debug Print
             loop_log.write(f'Start Time: {loop_start_datetime}\n')
 
-            # Open a CSV file to append links
-            with open(csv_sitemap_links, 'a', newline='', encoding='utf-8') as csvfile:
+            # Timer for 'Get all links'
+            start_time = current_time()
+
+            # Load the ETag / Last-Modified validators of the previous cycles
+            sitemap_cache = SitemapValidatorCache(json_sitemap_cache) if conditional_get else None
+
+            # Load the per-site and per-sitemap lastmod watermarks, seeded from the legacy datetime.txt cutoff
+            watermarks = WatermarkStore(json_watermarks, default_epoch=parse_lastmod_epoch(current_datetime))
+
+            # Open the (url, lastmod) snapshots each sitemap is diffed against
+            snapshots = SnapshotStore(db_sitemap_snapshots) if sitemap_diff else None
+
+            # Expand every sitemap index and child sitemap concurrently
+            link_info = {}
+            sitemap_transfers = TransferStats()
+            links = asyncio.run(discover_sitemap_links(sitemap_index_urls, watermarks,
+                                                       max_connections_per_host=discovery_connections_per_host,
+                                                       keepalive_timeout=discovery_keepalive_timeout,
+                                                       request_timeout=discovery_request_timeout,
+                                                       cache=sitemap_cache,
+                                                       decoder=LastmodDecoder(program_timezone),
+                                                       robots_cache=RobotsCache(json_robots_cache, robots_cache_ttl),
+                                                       max_depth=discovery_max_depth,
+                                                       max_sitemaps=discovery_max_sitemaps,
+                                                       snapshots=snapshots,
+                                                       link_info=link_info,
+                                                       transfers=sitemap_transfers))
+            sitemap_transfers.log_summary('Sitemap')
+
+            # Append the links not seen before to the CSV file, in first-seen order
+            dedup.append_unique(csv_sitemap_links, links)
+
+            # Queue this cycle's added and changed links for the crawl and submission stages, with the
+            # lastmod epoch, priority and changefreq the frontier orders them by
+            with open(csv_sitemap_delta, 'a', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
+                for link in links:
+                    writer.writerow([link, *link_info.get(link, ())])
 
-            # Timer for 'Get individual sitemaps'
-            start_time = current_time()
-            #print(start_time) # Debug Print
-
-            for sitemap_index_url in sitemap_index_urls:
-                sitemaps, lastmod_times = get_sitemap_index(sitemap_index_url)
-                elapsed_time = timedelta(seconds=int(current_time() - start_time))
-                print(f"Get individual sitemaps: {elapsed_time}")
-	            
-                # Timer for 'Get all links'
-                start_time = current_time()
-                
-                # Open a CSV file to append links
-                with open(csv_sitemap_links, 'a', newline='', encoding='utf-8') as csvfile:
+            # Keep a record of the links dropped from the sitemaps
+            if snapshots:
+                with open(csv_sitemap_removed, 'a', newline='', encoding='utf-8') as csvfile:
                     writer = csv.writer(csvfile)
-                    
-                    for sitemap, lastmod_time in zip(sitemaps, lastmod_times):
-                        logging.debug(f"Sitemap: {sitemap}, Last Modified Time: {lastmod_time}")
-                        if lastmod_time >= current_datetime:
-                            links = get_sitemap_links(sitemap, lastmod_time)
-                            for link in links:
-                                writer.writerow([link])
-                                csvfile.flush()  # Now this should work, as csvfile is still open
-    
+                    for link in snapshots.removed:
+                        writer.writerow([link])
+                print(f"Sitemap delta: {len(snapshots.added)} added, {len(snapshots.changed)} changed, {len(snapshots.removed)} removed")
+
+            # Advance the watermarks and snapshots and persist the validators only once the links are committed
+            watermarks.commit()
+            if snapshots:
+                snapshots.commit()
+                snapshots.close()
+            if sitemap_cache:
+                sitemap_cache.save()
+
             elapsed_time = timedelta(seconds=int(current_time() - start_time))
             print(f"Get all links: {elapsed_time}")
 
             # Timer for 'Remove all the duplicate URLs'
             start_time = current_time()
-            remove_duplicates_from_csv(csv_sitemap_links)
-            remove_duplicates_from_csv(csv_Bing_Submission)
-            remove_duplicates_from_csv(csv_Google_Submission)
+            dedup.sync(csv_Bing_Submission)
+            dedup.sync(csv_Google_Submission)
             elapsed_time = timedelta(seconds=int(current_time() - start_time))
             print(f"Remove all the duplicate URLs: {elapsed_time}")
 
@@ -423,7 +650,14 @@ def main():
 
             # Timer for 'Asynchronous crawling'
             start_time = current_time()
-            asyncio.run(crawl_all_urls(desktop_agents, mobile_agents, rate_limit, bing_rate_limit))
+            completed = asyncio.run(crawl_all_urls(desktop_agents, mobile_agents, rate_limits, csv_sitemap_delta, url_states,
+                                                   processes, bing_retries))
+            url_states.flush()
+
+            # Clear the queued delta once it has been handled in full, otherwise it carries over to the next cycle
+            if completed:
+                with open(csv_sitemap_delta, 'w'):
+                    pass
             elapsed_time = timedelta(seconds=int(current_time() - start_time))
             print(f"Asynchronous crawling: {elapsed_time}")
 
@@ -447,4 +681,8 @@ def main():
             logging.error(f"An unexpected error occurred in the main function. Exception: {e}")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Collect the sitemap links, submit them to Bing and crawl them.')
+    parser.add_argument('--workers', type=int, default=config.getint('Crawler', 'processes', fallback=1),
+                        help='Number of processes the crawl is sharded across')
+    args = parser.parse_args()
+    main(max(1, args.workers))
@@ -0,0 +1,192 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from request_timings import httpx_trace, niquests_timings
+
+try:
+    import httpx
+except ImportError:  # httpx is optional, only needed by the HTTP/2 transport
+    httpx = None
+
+try:
+    import niquests
+except ImportError:  # niquests is optional, only needed by the HTTP/3 transport
+    niquests = None
+
+# Transports the crawler session can run on
+TRANSPORT_AIOHTTP = 'aiohttp'  # HTTP/1.1, a pool of keep-alive connections per host
+TRANSPORT_HTTPX = 'httpx'  # HTTP/2, one multiplexed connection per host
+TRANSPORT_HTTP3 = 'http3'  # HTTP/3 over QUIC once a host advertises it through Alt-Svc, HTTP/2 until then
+TRANSPORTS = (TRANSPORT_AIOHTTP, TRANSPORT_HTTPX, TRANSPORT_HTTP3)
+
+# Transport tried next when the libraries of one are not installed
+TRANSPORT_FALLBACKS = {TRANSPORT_HTTP3: TRANSPORT_HTTPX, TRANSPORT_HTTPX: TRANSPORT_AIOHTTP}
+
+# Names of the HTTP versions reported by niquests
+NIQUESTS_VERSIONS = {10: 'HTTP/1.0', 11: 'HTTP/1.1', 20: 'HTTP/2', 30: 'HTTP/3'}
+
+
+# Function to get the charset of a Content-Type header
+def content_type_charset(content_type):
+    for parameter in (content_type or '').split(';')[1:]:
+        name, _, value = parameter.partition('=')
+        if name.strip().lower() == 'charset':
+            return value.strip().strip('"\'') or None
+    return None
+
+
+# Function to get the HTTP version a response came over, as in 'HTTP/2'
+def response_protocol(response):
+    version = response.version
+    if isinstance(version, str):
+        return version
+    return f"HTTP/{version.major}.{version.minor}"
+
+
+# Body of a TransportResponse, read like the aiohttp StreamReader
+# total_raw_bytes counts the body bytes received so far before decompression, as in aiohttp
+class TransportContent:
+    def __init__(self, read_chunks, raw_bytes):
+        self.read_chunks = read_chunks
+        self.raw_bytes = raw_bytes
+
+    def iter_chunked(self, size):
+        return self.read_chunks(size)
+
+    @property
+    def total_raw_bytes(self):
+        return self.raw_bytes()
+
+
+# Response of the httpx and HTTP/3 transports, offering the part of the aiohttp ClientResponse the
+# crawl and submission coroutines use
+class TransportResponse:
+    def __init__(self, url, status, reason, headers, version, read_chunks, raw_bytes):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.version = version
+        self.charset = content_type_charset(headers.get('Content-Type'))
+        self.content = TransportContent(read_chunks, raw_bytes)
+
+    # Function to raise the aiohttp error of a failed response, so the retry and concurrency code reads it as usual
+    def raise_for_status(self):
+        if self.status >= 400:
+            headers = CIMultiDictProxy(CIMultiDict(self.headers.items()))
+            request_info = aiohttp.RequestInfo(URL(self.url), 'GET', CIMultiDictProxy(CIMultiDict()), URL(self.url))
+            raise aiohttp.ClientResponseError(request_info, (), status=self.status, message=self.reason or '',
+                                              headers=headers)
+
+    async def read(self):
+        return b''.join([chunk async for chunk in self.content.iter_chunked(64 * 1024)])
+
+    async def text(self):
+        return (await self.read()).decode(self.charset or 'utf-8', errors='replace')
+
+
+# Session running every request of the crawl over HTTP/2 with httpx
+# Requests to a host share one connection as concurrent streams, so max_connections_per_host is not needed.
+# Errors are raised as the aiohttp errors they stand for.
+class HttpxSession:
+    def __init__(self, max_connections, keepalive_timeout, connect_timeout, read_timeout, request_timeout):
+        self.client = httpx.AsyncClient(http2=True,
+                                        limits=httpx.Limits(max_connections=max_connections,
+                                                            keepalive_expiry=keepalive_timeout),
+                                        timeout=httpx.Timeout(request_timeout, connect=connect_timeout,
+                                                              read=read_timeout))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    @asynccontextmanager
+    async def get(self, url, headers=None, trace_request_ctx=None):
+        extensions = {'trace': httpx_trace(trace_request_ctx)} if trace_request_ctx is not None else None
+        try:
+            async with self.client.stream('GET', url, headers=headers, extensions=extensions) as response:
+                yield TransportResponse(url, response.status_code, response.reason_phrase, response.headers,
+                                        response.http_version, response.aiter_bytes,
+                                        lambda: response.num_bytes_downloaded)
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(f"{type(e).__name__}: {e}") from e
+        except httpx.NetworkError as e:
+            raise aiohttp.ClientConnectionError(f"{type(e).__name__}: {e}") from e
+        except (httpx.TransportError, httpx.DecodingError) as e:
+            raise aiohttp.ClientPayloadError(f"{type(e).__name__}: {e}") from e
+
+
+# Session running the crawl with niquests, which moves a host to HTTP/3 over QUIC once it advertises it
+# through Alt-Svc and uses HTTP/2 until then. The session is multiplexed: a request goes out as one more
+# stream of a pooled connection and its response stays lazy until gathered, so the connections of a host
+# carry many requests at once. Errors are raised as the aiohttp errors they stand for.
+class Http3Session:
+    def __init__(self, max_connections, max_connections_per_host, keepalive_timeout, connect_timeout, read_timeout):
+        self.session = niquests.AsyncSession(multiplexed=True,
+                                             pool_connections=max_connections, pool_maxsize=max_connections_per_host,
+                                             keepalive_idle_window=keepalive_timeout,
+                                             timeout=(connect_timeout, read_timeout))
+        self.connections = weakref.WeakSet()  # Connection infos whose setup times were already counted
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.session.close()
+
+    @asynccontextmanager
+    async def get(self, url, headers=None, trace_request_ctx=None):
+        try:
+            response = await self.session.get(url, headers=headers, stream=True)
+            # Wait for the response headers of this stream only, the other requests go on meanwhile
+            if response.lazy:
+                await self.session.gather(response)
+            if trace_request_ctx is not None:
+                conn_info = response.conn_info
+                first_use = conn_info is not None and conn_info not in self.connections
+                if first_use:
+                    self.connections.add(conn_info)
+                niquests_timings(trace_request_ctx, conn_info, first_use)
+            try:
+                async def read_chunks(size):
+                    async for chunk in await response.iter_content(size):
+                        yield chunk
+
+                yield TransportResponse(url, response.status_code, response.reason, response.headers,
+                                        NIQUESTS_VERSIONS.get(response.http_version, 'HTTP/1.1'), read_chunks,
+                                        response.raw.tell)
+            finally:
+                await response.close()
+        except niquests.exceptions.Timeout as e:
+            raise asyncio.TimeoutError(f"{type(e).__name__}: {e}") from e
+        except niquests.exceptions.ConnectionError as e:
+            raise aiohttp.ClientConnectionError(f"{type(e).__name__}: {e}") from e
+        except (niquests.exceptions.ChunkedEncodingError, niquests.exceptions.ContentDecodingError) as e:
+            raise aiohttp.ClientPayloadError(f"{type(e).__name__}: {e}") from e
+
+
+# Function to create a session on the httpx or HTTP/3 transport
+# Returns None when the libraries of the transport are not installed
+def create_transport_session(transport, max_connections, max_connections_per_host, keepalive_timeout,
+                             connect_timeout, read_timeout, request_timeout):
+    if transport == TRANSPORT_HTTPX and httpx is not None:
+        try:
+            return HttpxSession(max_connections, keepalive_timeout, connect_timeout, read_timeout, request_timeout)
+        except ImportError:  # httpx without the h2 package
+            return None
+    if transport == TRANSPORT_HTTP3 and niquests is not None:
+        return Http3Session(max_connections, max_connections_per_host, keepalive_timeout, connect_timeout, read_timeout)
+    return None
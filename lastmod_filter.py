@@ -0,0 +1,158 @@
+from datetime import datetime
+
+from lastmod_watermarks import parse_lastmod_epoch
+from sitemap_parser import clean_text
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, batches are then filtered in pure Python
+    np = None
+
+# Number of sitemap entries decoded and filtered together
+BATCH_SIZE = 4096
+
+# Stand-in epoch for missing lastmod values in NumPy batches
+MISSING_EPOCH = -(2 ** 62)
+
+# Width of the YYYY-MM-DDThh:mm:ss+hh:mm form decoded column-wise with NumPy
+FIXED_WIDTH = 25
+DIGIT_COLUMNS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+# Days of each month in a common year
+DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+# Function to count the days since 1970-01-01 for a proleptic Gregorian date
+# Works on plain integers and on NumPy integer arrays alike
+def days_from_civil(year, month, day):
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    month_index = (month + 9) % 12  # March is 0, February is 11
+    day_of_year = (153 * month_index + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+# Decoder turning lastmod strings into UTC epoch integers
+# Timestamps without an offset are read in naive_timezone (UTC when not given) on every path, with its
+# offset memoized per date and hour so DST is honoured without a timezone conversion per entry.
+# With NumPy, batches in the common fixed-width forms are decoded column-wise in one pass.
+class LastmodDecoder:
+    def __init__(self, naive_timezone=None):
+        self.naive_timezone = naive_timezone
+        self.naive_offsets = {}
+
+    # Function to decode one lastmod value, None when it is missing or unparseable
+    def decode(self, lastmod):
+        lastmod = clean_text(lastmod)
+        if not lastmod:
+            return None
+        try:
+            lastmod_time = datetime.fromisoformat(lastmod)
+        except ValueError:
+            return parse_lastmod_epoch(lastmod)  # Basic-format offsets and friends, which always carry one
+        if lastmod_time.tzinfo is not None:
+            return int(lastmod_time.timestamp())
+        epoch = days_from_civil(lastmod_time.year, lastmod_time.month, lastmod_time.day) * 86400 + \
+            lastmod_time.hour * 3600 + lastmod_time.minute * 60 + lastmod_time.second
+        return epoch - self.naive_offset(lastmod_time.year, lastmod_time.month, lastmod_time.day, lastmod_time.hour)
+
+    # Function to get the UTC offset of naive_timezone for a date and hour
+    def naive_offset(self, year, month, day, hour):
+        if self.naive_timezone is None:
+            return 0
+        key = (year, month, day, hour)
+        seconds = self.naive_offsets.get(key)
+        if seconds is None:
+            local_time = datetime(year, month, day, hour)
+            if hasattr(self.naive_timezone, 'localize'):  # pytz timezones
+                local_time = self.naive_timezone.localize(local_time)
+            else:
+                local_time = local_time.replace(tzinfo=self.naive_timezone)
+            seconds = int(local_time.utcoffset().total_seconds())
+            self.naive_offsets[key] = seconds
+        return seconds
+
+    # Function to decode a batch of lastmod values, None or empty for entries without one
+    # Returns a NumPy int64 array (MISSING_EPOCH for missing values) when NumPy is available, else a list
+    def decode_batch(self, lastmods):
+        if np is None:
+            decode = self.decode
+            return [decode(lastmod) for lastmod in lastmods]
+        lastmods = [lastmod or '' for lastmod in lastmods]
+        epochs = np.full(len(lastmods), MISSING_EPOCH, dtype=np.int64)
+        if not lastmods:
+            return epochs
+        lengths = np.fromiter(map(len, lastmods), dtype=np.int64, count=len(lastmods))
+        codes = np.array(lastmods, dtype=f'U{FIXED_WIDTH}').view(np.uint32).reshape(len(lastmods), FIXED_WIDTH)
+        digits = codes.astype(np.int64) - 48
+
+        # Rows in the YYYY-MM-DDThh:mm:ssZ or YYYY-MM-DDThh:mm:ss+hh:mm form
+        with_z = (lengths == 20) & (codes[:, 19] == ord('Z'))
+        with_offset = (lengths == 25) & ((codes[:, 19] == ord('+')) | (codes[:, 19] == ord('-'))) & (codes[:, 22] == ord(':'))
+        valid = (with_z | with_offset) & (codes[:, 4] == ord('-')) & (codes[:, 7] == ord('-')) & \
+            (codes[:, 10] == ord('T')) & (codes[:, 13] == ord(':')) & (codes[:, 16] == ord(':'))
+        valid &= ((digits[:, DIGIT_COLUMNS] >= 0) & (digits[:, DIGIT_COLUMNS] <= 9)).all(axis=1)
+        offset_digits = digits[:, [20, 21, 23, 24]]
+        valid &= ~with_offset | ((offset_digits >= 0) & (offset_digits <= 9)).all(axis=1)
+
+        year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        month = digits[:, 5] * 10 + digits[:, 6]
+        day = digits[:, 8] * 10 + digits[:, 9]
+        leap_year = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+        month_days = np.array(DAYS_IN_MONTH)[np.clip(month, 1, 12) - 1] + (leap_year & (month == 2))
+        valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+        hour = digits[:, 11] * 10 + digits[:, 12]
+        minute = digits[:, 14] * 10 + digits[:, 15]
+        second = digits[:, 17] * 10 + digits[:, 18]
+        offset_hour = offset_digits[:, 0] * 10 + offset_digits[:, 1]
+        offset_minute = offset_digits[:, 2] * 10 + offset_digits[:, 3]
+        valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+        valid &= ~with_offset | ((offset_hour <= 23) & (offset_minute <= 59))
+        seconds = hour * 3600 + minute * 60 + second
+        offsets = offset_hour * 3600 + offset_minute * 60
+        offsets = np.where(with_offset, np.where(codes[:, 19] == ord('-'), -offsets, offsets), 0)
+        decoded = days_from_civil(year, month, day) * 86400 + seconds - offsets
+        epochs[valid] = decoded[valid]
+
+        # Everything else goes through the scalar decoder
+        for i in np.flatnonzero(~valid):
+            epoch = self.decode(lastmods[i])
+            if epoch is not None:
+                epochs[i] = epoch
+        return epochs
+
+
+# Function to turn the result of decode_batch into a list of epochs, None for missing values
+def epochs_to_list(epochs):
+    if np is not None and isinstance(epochs, np.ndarray):
+        return [None if epoch == MISSING_EPOCH else epoch for epoch in epochs.tolist()]
+    return list(epochs)
+
+
+# Function to keep the locs of a batch whose lastmod epoch is newer than the cutoff
+# Returns the kept locs and the newest lastmod of the batch (None for an empty batch)
+def filter_newer(locs, epochs, cutoff):
+    if not locs:
+        return [], None
+    if np is not None:
+        values = epochs if isinstance(epochs, np.ndarray) else \
+            np.fromiter((MISSING_EPOCH if epoch is None else epoch for epoch in epochs), dtype=np.int64, count=len(epochs))
+        kept = [locs[i] for i in np.flatnonzero(values > cutoff)]
+        newest = int(values.max())
+        return kept, (None if newest == MISSING_EPOCH else newest)
+    kept = [loc for loc, epoch in zip(locs, epochs) if epoch is not None and epoch > cutoff]
+    newest = max((epoch for epoch in epochs if epoch is not None), default=None)
+    return kept, newest
+
+
+# Function to decode and filter a batch of sitemap entries against a precomputed cutoff
+def filter_entries(entries, cutoff, decoder):
+    locs = []
+    lastmods = []
+    for entry in entries:
+        if entry.loc and entry.lastmod:
+            locs.append(entry.loc)
+            lastmods.append(entry.lastmod)
+    return filter_newer(locs, decoder.decode_batch(lastmods), cutoff)
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+
+# Function to parse a W3C / ISO 8601 lastmod value into a UTC epoch integer
+# Values without an offset (including date-only values) are taken as UTC
+def parse_lastmod_epoch(lastmod):
+    if not lastmod:
+        return None
+    lastmod = lastmod.replace("<![CDATA[", "").replace("]]>", "").strip()  # Remove CDATA
+    try:
+        lastmod_time = datetime.fromisoformat(lastmod)
+    except ValueError:
+        try:
+            lastmod_time = datetime.strptime(lastmod, '%Y-%m-%dT%H:%M:%S%z')
+        except ValueError:
+            logging.debug(f"Unparseable lastmod value: {lastmod}")
+            return None
+    if lastmod_time.tzinfo is None:
+        lastmod_time = lastmod_time.replace(tzinfo=timezone.utc)
+    return int(lastmod_time.timestamp())
+
+
+# High-water marks of the lastmod values already processed, kept per site and per sitemap
+# Each sitemap keeps the lastmod its index advertised and the newest entry lastmod it contained.
+# New watermarks are only proposed during discovery and advance when commit() is called,
+# after the batch of links they cover has been written out.
+class WatermarkStore:
+    def __init__(self, filename=None, default_epoch=0):
+        self.filename = filename
+        self.default_epoch = default_epoch or 0
+        self.sites = {}
+        self.sitemaps = {}
+        self.pending_sites = {}
+        self.pending_sitemaps = {}
+        if filename:
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.sites = data.get('sites', {})
+                self.sitemaps = data.get('sitemaps', {})
+            except FileNotFoundError:
+                pass
+            except (ValueError, OSError) as e:
+                logging.error(f"Failed to read watermarks {filename}. Exception: {e}")
+
+    # Function to get the watermark of a site, falling back to the legacy global cutoff
+    def site_watermark(self, site):
+        return self.sites.get(site, self.default_epoch)
+
+    # Function to get the (sitemap lastmod, entry lastmod) watermarks of a sitemap
+    # A sitemap seen for the first time starts from its site's watermark
+    def sitemap_watermarks(self, site, sitemap):
+        watermark = self.sitemaps.get(sitemap)
+        if watermark:
+            return watermark['lastmod'], watermark['entries']
+        site_watermark = self.site_watermark(site)
+        return site_watermark, site_watermark
+
+    # Function to propose new watermarks for a sitemap once it has been read in full
+    def propose(self, site, sitemap, sitemap_lastmod, entries_lastmod):
+        current_lastmod, current_entries = self.sitemap_watermarks(site, sitemap)
+        sitemap_lastmod = max(current_lastmod, sitemap_lastmod or 0)
+        entries_lastmod = max(current_entries, entries_lastmod or 0)
+        self.pending_sitemaps[sitemap] = {'lastmod': sitemap_lastmod, 'entries': entries_lastmod}
+        self.pending_sites[site] = max(self.pending_sites.get(site, self.site_watermark(site)), entries_lastmod)
+
+    # Function to advance the watermarks proposed during this cycle and persist them
+    def commit(self):
+        self.sitemaps.update(self.pending_sitemaps)
+        for site, watermark in self.pending_sites.items():
+            self.sites[site] = max(self.sites.get(site, 0), watermark)
+        self.pending_sitemaps = {}
+        self.pending_sites = {}
+        self.save()
+
+    # Function to write the watermarks to disk
+    def save(self):
+        if not self.filename:
+            return
+        temp_filename = f"{self.filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump({'sites': self.sites, 'sitemaps': self.sitemaps}, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            logging.error(f"Failed to write watermarks {self.filename}. Exception: {e}")
@@ -0,0 +1,161 @@
+import json
+import logging
+import math
+import os
+from time import time as current_time
+from urllib.parse import urlsplit
+
+# Defaults of the latency sketches: relative error of the quantiles, and buckets kept per sketch at most
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+
+# Latencies at or below this many seconds fall in the zero bucket
+MIN_LATENCY = 1e-6
+
+# Quantiles written to the summary file and the crawling log
+SUMMARY_QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+
+# Function to read the [Metrics] settings, falling back to the defaults above
+def metrics_settings(config):
+    return {
+        'relative_accuracy': config.getfloat('Metrics', 'relative_accuracy', fallback=DEFAULT_RELATIVE_ACCURACY),
+        'max_buckets': config.getint('Metrics', 'max_buckets', fallback=DEFAULT_MAX_BUCKETS),
+    }
+
+
+# Quantile sketch of latencies in fixed memory, with logarithmic buckets as in DDSketch
+# A latency v goes into bucket ceil(log(v) / log(gamma)), gamma = (1 + a) / (1 - a), so every quantile is
+# within a relative error a of the true one. Two sketches with the same accuracy merge exactly by adding
+# their bucket counts. Past max_buckets the lowest buckets are folded together, which blurs the fastest
+# latencies only; at the defaults 2048 buckets span far more than a microsecond to any request timeout.
+class QuantileSketch:
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.min_key = -math.inf  # Lowest bucket kept, raised as buckets are folded together
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if seconds <= MIN_LATENCY:
+            self.zero_count += 1
+            return
+        key = max(self.min_key, math.ceil(math.log(seconds) / self.log_gamma))
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    # Function to fold the lowest buckets into one until the sketch fits in max_buckets again
+    def collapse(self, min_key=-math.inf):
+        keys = sorted(self.buckets)
+        self.min_key = max(self.min_key, min_key, keys[max(0, len(keys) - self.max_buckets)])
+        folded = sum(self.buckets.pop(key) for key in keys if key < self.min_key)
+        if folded:
+            self.buckets[self.min_key] = self.buckets.get(self.min_key, 0) + folded
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError(f"Cannot merge sketches of relative accuracy {other.relative_accuracy} and {self.relative_accuracy}")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.buckets) > self.max_buckets or other.min_key > self.min_key:
+            self.collapse(other.min_key)
+
+    # Function to get the latency at quantile q (0 to 1), None for an empty sketch
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return self.min
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # Middle of the bucket in relative terms, kept within the latencies actually seen
+                return min(self.max, max(self.min, 2 * self.gamma ** key / (self.gamma + 1)))
+        return self.max
+
+
+# Latency sketches of a cycle per site and per user agent for the crawl, and per search engine for the
+# submissions. Sketches are created on first use; the failures are counted next to them. The metrics
+# of the shard processes pickle back to the parent in their CrawlReport and merge there.
+class LatencyMetrics:
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.sketches = {}
+        self.failures = {}
+        self.started = current_time()
+
+    # Function to add a latency in seconds to the sketch of (group, key), or a failure when it is None
+    def observe(self, group, key, seconds=None):
+        if seconds is None:
+            self.failures[(group, key)] = self.failures.get((group, key), 0) + 1
+            return
+        sketch = self.sketches.get((group, key))
+        if sketch is None:
+            sketch = self.sketches[(group, key)] = QuantileSketch(self.relative_accuracy, self.max_buckets)
+        sketch.add(seconds)
+
+    # Function to add a page fetch to the sketches of its site and of its user agent
+    def observe_fetch(self, url, user_agent, seconds=None):
+        self.observe('site', (urlsplit(url).hostname or '').lower(), seconds)
+        self.observe('user_agent', user_agent, seconds)
+
+    def merge(self, other):
+        for name, sketch in other.sketches.items():
+            if name not in self.sketches:
+                self.sketches[name] = QuantileSketch(sketch.relative_accuracy, sketch.max_buckets)
+            self.sketches[name].merge(sketch)
+        for name, count in other.failures.items():
+            self.failures[name] = self.failures.get(name, 0) + count
+        self.started = min(self.started, other.started)
+
+    # Function to get the summary of every sketch, in milliseconds, as {group: {key: {...}}}
+    def summary(self):
+        summary = {}
+        for (group, key) in sorted(set(self.sketches) | set(self.failures)):
+            sketch = self.sketches.get((group, key))
+            entry = {'count': sketch.count if sketch else 0, 'failures': self.failures.get((group, key), 0)}
+            if sketch:
+                entry['mean'] = round(sketch.sum / sketch.count * 1000, 1)
+                for name, q in SUMMARY_QUANTILES:
+                    entry[name] = round(sketch.quantile(q) * 1000, 1)
+                entry['max'] = round(sketch.max * 1000, 1)
+            summary.setdefault(group, {})[key] = entry
+        return summary
+
+    def log_summary(self):
+        for group, entries in self.summary().items():
+            for key, entry in entries.items():
+                quantiles = ', '.join(f"{name} {entry[name]} ms" for name, _ in SUMMARY_QUANTILES if name in entry)
+                logging.info(f"Latency of {group} {key}: {entry['count']} requests, {entry['failures']} failures, {quantiles}")
+
+    # Function to write the summary of the cycle to a JSON file, replacing the previous cycle's
+    def write_summary(self, filename):
+        temp_filename = f"{filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump({'started': round(self.started), 'finished': round(current_time()),
+                           'relative_accuracy': self.relative_accuracy, 'latency_ms': self.summary()},
+                          f, separators=(',', ':'))
+            os.replace(temp_filename, filename)
+        except OSError as e:
+            logging.error(f"Failed to write latency summary {filename}. Exception: {e}")
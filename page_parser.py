@@ -0,0 +1,114 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from page_stats import PageStats
+
+try:
+    import lxml.html
+except ImportError:  # lxml is optional, pages are then parsed with BeautifulSoup only
+    lxml = None
+
+# Defaults of the parsing executor
+DEFAULT_EXECUTOR = 'process'
+DEFAULT_PARSER = 'html.parser'
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_DELAY = 0.01
+
+
+# Function to read the [Parsing] settings, falling back to the defaults above
+def parser_settings(config):
+    return {
+        'executor': config.get('Parsing', 'executor', fallback=DEFAULT_EXECUTOR),
+        'workers': config.getint('Parsing', 'workers', fallback=0) or None,
+        'parser': config.get('Parsing', 'parser', fallback=DEFAULT_PARSER),
+        'batch_size': config.getint('Parsing', 'batch_size', fallback=DEFAULT_BATCH_SIZE),
+    }
+
+
+# Function to compute the statistics of a page
+# With parser='lxml' and lxml installed the page is parsed by lxml.html directly, which releases the GIL
+def parse_page(text, parser=DEFAULT_PARSER):
+    if parser == 'lxml' and lxml is not None:
+        try:
+            tree = lxml.html.document_fromstring(text)
+        except (ValueError, lxml.etree.ParserError):  # Empty page or one lxml cannot read
+            return PageStats(None, len(text), 0, 0)
+        title = tree.find('.//title')
+        return PageStats(title.text if title is not None else None, len(text),
+                         len(tree.xpath('//img')), len(tree.xpath('//a')))
+    soup = BeautifulSoup(text, parser)
+    title = soup.title.string if soup.title else None
+    # A plain str, since the NavigableString would drag the whole tree along when pickled back
+    return PageStats(str(title) if title is not None else None, len(text),
+                     len(soup.find_all('img')), len(soup.find_all('a')))
+
+
+# Function to compute the statistics of a batch of pages, run inside the executor
+def parse_pages(texts, parser=DEFAULT_PARSER):
+    results = []
+    for text in texts:
+        try:
+            results.append(parse_page(text, parser))
+        except Exception as e:  # Hand the error back to the page's caller rather than failing the batch
+            results.append(e)
+    return results
+
+
+# Pool parsing pages off the event loop, in worker processes by default or in threads
+# Only used with [Parsing] deep_analysis on; otherwise pages are read by page_stats as they stream in.
+# Pages handed over by parse() are grouped into batches of batch_size (or whatever arrived within
+# batch_delay seconds) so each executor round trip carries several pages. Fetching coroutines only
+# wait for their own page, so downloads go on while every worker is busy parsing.
+class PageParserPool:
+    def __init__(self, executor=DEFAULT_EXECUTOR, workers=None, parser=DEFAULT_PARSER,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_delay=DEFAULT_BATCH_DELAY):
+        self.workers = workers or os.cpu_count() or 1
+        if executor == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.parser = parser
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.pending = []
+        self.flush_handle = None
+
+    # Function to get the statistics of a page once its batch has been parsed
+    async def parse(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_delay, self.flush)
+        result = await future
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    # Function to hand the pending pages to the executor as one batch
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        loop = asyncio.get_running_loop()
+        batch_future = loop.run_in_executor(self.executor, parse_pages, [text for text, _ in batch], self.parser)
+        batch_future.add_done_callback(lambda done: self.deliver(batch, done))
+
+    # Function to pass the results of a parsed batch on to the waiting pages
+    def deliver(self, batch, done):
+        error = asyncio.CancelledError() if done.cancelled() else done.exception()
+        results = done.result() if error is None else [error] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
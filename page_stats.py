@@ -0,0 +1,177 @@
+import codecs
+from collections import namedtuple
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional, pages are then tokenized by html.parser
+    etree = None
+
+# Statistics of a crawled page as logged by crawl_url
+# truncated is set when the body went over the byte cap, skipped when its Content-Type was not read at all,
+# and timings holds the seconds of every request phase once crawl_url has read the page
+PageStats = namedtuple('PageStats', ['title', 'page_length', 'num_images', 'num_links', 'truncated', 'skipped',
+                                     'timings'], defaults=(False, False, None))
+
+# Size of the chunks read from a page response body
+CHUNK_SIZE = 64 * 1024
+
+# Defaults of the body limits: bytes read from a page at most (0 for no cap), and the content types read
+DEFAULT_MAX_BODY_BYTES = 5 * 1024 * 1024
+DEFAULT_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+# Function to read the body limits from [Parsing], falling back to the defaults above
+# An empty content_types reads every content type
+def body_limit_settings(config):
+    content_types = config.get('Parsing', 'content_types', fallback=','.join(DEFAULT_CONTENT_TYPES))
+    return {
+        'max_bytes': config.getint('Parsing', 'max_body_bytes', fallback=DEFAULT_MAX_BODY_BYTES),
+        'content_types': tuple(content_type.strip().lower() for content_type in content_types.split(',')
+                               if content_type.strip()),
+    }
+
+
+# Function to tell whether the body of a response is worth reading, from its Content-Type
+# Responses without a Content-Type are read, as most servers sending one then send HTML
+def content_type_allowed(response, content_types=None):
+    content_type = response.headers.get('Content-Type')
+    if not content_types or not content_type:
+        return True
+    return content_type.split(';')[0].strip().lower() in content_types
+
+
+# Function to iterate over the body chunks of a response, stopping at max_bytes
+# With a state dict, state['truncated'] is set once the cap cuts the body short
+async def iter_body_chunks(response, max_bytes=None, state=None):
+    read = 0
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        if max_bytes and read + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - read]
+            if state is not None:
+                state['truncated'] = True
+            if chunk:
+                yield chunk
+            return
+        read += len(chunk)
+        yield chunk
+
+
+# Tokenizer of the standard library counting the tags it comes across, used when lxml is missing
+# Script and style contents and comments are skipped by HTMLParser itself.
+class TagCounter(HTMLParser):
+    def __init__(self, stats):
+        super().__init__(convert_charrefs=True)
+        self.stats = stats
+        self.in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        self.stats.count_tag(tag)
+        if tag == 'title' and self.stats.title is None:
+            self.in_title = True
+            self.stats.title = ''
+
+    def handle_startendtag(self, tag, attrs):
+        self.stats.count_tag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self.in_title = False
+        elif tag == 'html':
+            self.stats.finished = True
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.stats.title += data
+
+
+# Incremental page statistics fed with raw body chunks as they arrive
+# Only the title and the <img> and <a> tags are looked at: lxml's pull parser reports each tag as it
+# is read and every finished element is dropped right away, so no tree is ever kept in memory. Once
+# </html> has been read the rest of the body is only counted. The page length is counted in bytes.
+class PageStatsStream:
+    def __init__(self, encoding=None):
+        self.page_length = 0
+        self.title = None
+        self.num_images = 0
+        self.num_links = 0
+        self.finished = False
+        self.truncated = False
+        if etree is not None:
+            self.parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+            self.tokenizer = None
+        else:
+            self.parser = None
+            self.tokenizer = TagCounter(self)
+            self.decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+
+    def count_tag(self, tag):
+        if tag == 'img':
+            self.num_images += 1
+        elif tag == 'a':
+            self.num_links += 1
+
+    def feed(self, data):
+        self.page_length += len(data)
+        if self.finished or not data:
+            return
+        if self.parser is None:
+            self.tokenizer.feed(self.decoder.decode(data))
+            return
+        self.parser.feed(data)
+        self.read_events()
+
+    def read_events(self):
+        for event, element in self.parser.read_events():
+            tag = element.tag
+            if event == 'start':
+                self.count_tag(tag)
+                continue
+            if tag == 'title' and self.title is None:
+                self.title = element.text or ''
+            elif tag == 'html':
+                self.finished = True
+            # Release the element and the finished siblings before it
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    # Function to finish the page and get its statistics
+    def close(self):
+        if not self.finished:
+            if self.parser is None:
+                self.tokenizer.feed(self.decoder.decode(b'', final=True))
+                self.tokenizer.close()
+            else:
+                try:
+                    self.parser.close()
+                except etree.XMLSyntaxError:  # Empty page or one lxml cannot read
+                    pass
+                self.read_events()
+        return PageStats(self.title, self.page_length, self.num_images, self.num_links, self.truncated)
+
+
+# Function to read the statistics of a page from an aiohttp response, chunk by chunk as it arrives
+# With a hashlib digest the body is hashed on the way as well. Reading stops after max_bytes, so the caller
+# can release the connection right away, and bodies of a Content-Type outside content_types are not read.
+async def read_page_stats(response, digest=None, max_bytes=None, content_types=None):
+    if not content_type_allowed(response, content_types):
+        return PageStats(None, 0, 0, 0, skipped=True)
+    stats = PageStatsStream(response.charset)
+    state = {}
+    async for chunk in iter_body_chunks(response, max_bytes, state):
+        stats.feed(chunk)
+        if digest is not None:
+            digest.update(chunk)
+    stats.truncated = state.get('truncated', False)
+    return stats.close()
+
+
+# Function to read the body of a page, up to max_bytes, for the parsers of the deep analysis
+# Returns (body, truncated)
+async def read_page_body(response, max_bytes=None):
+    state = {}
+    body = b''.join([chunk async for chunk in iter_body_chunks(response, max_bytes, state)])
+    return body, state.get('truncated', False)
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import logging
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from time import monotonic
+from urllib.parse import urlsplit
+
+from adaptive_concurrency import (DEFAULT_DECREASE_FACTOR, DEFAULT_INITIAL_IN_FLIGHT, DEFAULT_LATENCY_TOLERANCE,
+                                  AdaptiveLimit, RequestSlot)
+
+# Rate (requests per second), burst size and maximum requests in flight for one host
+HostLimit = namedtuple('HostLimit', ['rate', 'burst', 'max_in_flight'])
+
+# Settings of the adaptive concurrency control shared by every host
+AdaptiveSettings = namedtuple('AdaptiveSettings', ['initial_in_flight', 'latency_tolerance', 'decrease_factor'])
+
+# Host of the Bing IndexNow endpoint, paced by the bing_* settings
+BING_HOST = 'www.bing.com'
+
+# Defaults used when [RateLimit] leaves a setting out
+DEFAULT_REQUESTS_PER_SECOND = 0.5
+DEFAULT_BURST = 1
+DEFAULT_MAX_IN_FLIGHT = 2
+DEFAULT_BING_REQUESTS_PER_SECOND = 5
+
+# Number of hosts the shared token buckets of a sharded crawl can hold
+DEFAULT_SHARED_HOSTS = 1024
+
+
+# Function to read the per-host limits from [RateLimit]
+# Returns the default limit of every host, the limits of the hosts that override it (Bing IndexNow
+# included) and the adaptive concurrency settings. Overrides are listed as host=rate pairs in
+# host_requests_per_second.
+def rate_limit_settings(config):
+    default_limit = HostLimit(config.getfloat('RateLimit', 'requests_per_second', fallback=DEFAULT_REQUESTS_PER_SECOND),
+                              config.getint('RateLimit', 'burst', fallback=DEFAULT_BURST),
+                              config.getint('RateLimit', 'max_in_flight_per_host', fallback=DEFAULT_MAX_IN_FLIGHT))
+    host_limits = {
+        BING_HOST: HostLimit(config.getfloat('RateLimit', 'bing_requests_per_second', fallback=DEFAULT_BING_REQUESTS_PER_SECOND),
+                             config.getint('RateLimit', 'bing_burst', fallback=DEFAULT_BURST),
+                             config.getint('RateLimit', 'bing_max_in_flight', fallback=1)),
+    }
+    for item in config.get('RateLimit', 'host_requests_per_second', fallback='').split(','):
+        host, _, rate = item.partition('=')
+        if host.strip() and rate.strip():
+            host_limits[host.strip().lower()] = default_limit._replace(rate=float(rate))
+    adaptive_settings = AdaptiveSettings(
+        config.getint('RateLimit', 'initial_in_flight_per_host', fallback=DEFAULT_INITIAL_IN_FLIGHT),
+        config.getfloat('RateLimit', 'latency_tolerance', fallback=DEFAULT_LATENCY_TOLERANCE),
+        config.getfloat('RateLimit', 'decrease_factor', fallback=DEFAULT_DECREASE_FACTOR))
+    return default_limit, host_limits, adaptive_settings
+
+
+# Token bucket refilled at rate tokens per second, holding at most burst tokens
+# Waiters are served one at a time in arrival order
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:  # No rate limit
+            return
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Token buckets of every host kept in shared memory, so the processes of a sharded crawl keep one rate per host
+# Each slot holds a key of the host, its tokens and the time they were counted, and hosts are placed by
+# open addressing. A waiter takes its token right away, running into debt when there is none, and then
+# sleeps until the debt is paid off, so waiters of every process are served in the order they came.
+# Created from a multiprocessing context and handed to the shard processes when they start.
+class SharedTokenBuckets:
+    def __init__(self, context, size=DEFAULT_SHARED_HOSTS):
+        self.size = size
+        self.lock = context.Lock()
+        self.slots = context.RawArray('d', size * 3)
+
+    # Function to get a non-zero key of a host that a double holds exactly
+    def host_key(self, host):
+        return float(int.from_bytes(hashlib.blake2b(host.encode('utf-8'), digest_size=6).digest(), 'big') + 1)
+
+    # Function to find the slot of a host, claiming a free one the first time, with the lock held
+    def find_slot(self, key):
+        index = int(key) % self.size
+        for _ in range(self.size):
+            if self.slots[index * 3] in (key, 0):
+                break
+            index = (index + 1) % self.size  # Once the table is full the host shares the last slot probed
+        return index * 3
+
+    # Function to take a token of a host, returning the seconds to wait before using it
+    def reserve(self, host, rate, burst=1):
+        key = self.host_key(host)
+        with self.lock:
+            offset = self.find_slot(key)
+            now = monotonic()
+            if self.slots[offset] != key:
+                self.slots[offset:offset + 3] = [key, burst, now]
+            tokens = min(burst, self.slots[offset + 1] + (now - self.slots[offset + 2]) * rate) - 1
+            self.slots[offset + 1] = tokens
+            self.slots[offset + 2] = now
+        return 0 if tokens >= 0 else -tokens / rate
+
+
+# Token bucket of one host in the SharedTokenBuckets, used like a TokenBucket
+class SharedTokenBucket:
+    def __init__(self, buckets, host, rate, burst=1):
+        self.buckets = buckets
+        self.host = host
+        self.rate = rate
+        self.burst = max(1, burst)
+
+    async def acquire(self):
+        if self.rate <= 0:  # No rate limit
+            return
+        delay = self.buckets.reserve(self.host, self.rate, self.burst)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Rate limiter with its own token bucket and adaptive in-flight limit for every host
+# Each site is paced on its own, so a slow or strict host never holds back the others.
+# The in-flight limit starts at initial_in_flight and moves between 1 and the host's max_in_flight
+# with the latency and overload signals fed back through the slot yielded by limit().
+# Buckets and limits are created lazily, inside the event loop that uses them. With shared_buckets the
+# rates hold across every process of a sharded crawl; the in-flight limits stay per process.
+class HostRateLimiter:
+    def __init__(self, default_limit, host_limits=None, adaptive_settings=None, shared_buckets=None):
+        self.default_limit = default_limit
+        self.host_limits = host_limits or {}
+        self.adaptive_settings = adaptive_settings or AdaptiveSettings(DEFAULT_INITIAL_IN_FLIGHT,
+                                                                       DEFAULT_LATENCY_TOLERANCE,
+                                                                       DEFAULT_DECREASE_FACTOR)
+        self.shared_buckets = shared_buckets
+        self.buckets = {}
+        self.concurrency = {}
+
+    # Function to get the limit of a host
+    def host_limit(self, host):
+        return self.host_limits.get(host, self.default_limit)
+
+    # Function to wait for a slot and a token of the URL's host, holding the slot until the block exits
+    # Yields a RequestSlot to record() the response status on; timeouts and connection errors
+    # raised inside the block are recorded on their own
+    @asynccontextmanager
+    async def limit(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        if host not in self.buckets:
+            host_limit = self.host_limit(host)
+            if self.shared_buckets is not None:
+                self.buckets[host] = SharedTokenBucket(self.shared_buckets, host, host_limit.rate, host_limit.burst)
+            else:
+                self.buckets[host] = TokenBucket(host_limit.rate, host_limit.burst)
+            self.concurrency[host] = AdaptiveLimit(host, host_limit.max_in_flight,
+                                                   initial_limit=self.adaptive_settings.initial_in_flight,
+                                                   latency_tolerance=self.adaptive_settings.latency_tolerance,
+                                                   decrease_factor=self.adaptive_settings.decrease_factor)
+        adaptive_limit = self.concurrency[host]
+        await adaptive_limit.acquire()
+        try:
+            await self.buckets[host].acquire()
+            slot = RequestSlot(adaptive_limit)
+            try:
+                yield slot
+            except BaseException as e:
+                slot.record_error(e)
+                raise
+        finally:
+            await adaptive_limit.release()
+
+    # Function to log the current concurrency limit and latency of every host
+    def log_limits(self):
+        for adaptive_limit in self.concurrency.values():
+            logging.info(f"Concurrency limit of {adaptive_limit.summary()}")
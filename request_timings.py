@@ -0,0 +1,151 @@
+import bisect
+import logging
+from time import monotonic
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Phases of a request, in the order they happen
+# queued: waiting for a free connection of the pool, dns: resolving the host, connect: TCP handshake (TCP and
+# TLS together on aiohttp, which reports no TLS step of its own), tls: TLS handshake, ttfb: from the request
+# headers sent to the response headers received, transfer: reading the body
+PHASES = ('queued', 'dns', 'connect', 'tls', 'ttfb', 'transfer', 'total')
+
+# Upper bounds of the latency histogram buckets in milliseconds; a last bucket takes everything slower
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+# Phase timings of one request, filled in by the trace hooks of the transport and by crawl_url
+# A phase the request skipped, such as DNS and connect on a pooled connection, stays at zero.
+class RequestTimings:
+    def __init__(self):
+        self.start = monotonic()
+        self.started = {}
+        self.phases = {}
+        self.headers_received = None
+
+    def begin(self, phase):
+        self.started[phase] = monotonic()
+
+    def end(self, phase):
+        started = self.started.pop(phase, None)
+        if started is not None:
+            self.add(phase, monotonic() - started)
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    # Function to mark the response headers as received, ending the time to first byte
+    def response_started(self):
+        if self.headers_received is None:
+            self.headers_received = monotonic()
+            self.end('ttfb')
+
+    # Function to end the transfer once the body has been read, returns the timings in seconds by phase
+    def finish(self):
+        now = monotonic()
+        self.response_started()
+        self.phases['transfer'] = now - self.headers_received
+        self.phases['total'] = now - self.start
+        return {phase: self.phases.get(phase, 0.0) for phase in PHASES}
+
+
+# Function to describe phase timings for the crawling log, as in 'dns 3 ms, connect 41 ms, ...'
+def format_timings(timings):
+    return ', '.join(f"{phase} {timings[phase] * 1000:.0f} ms" for phase in PHASES if phase in timings)
+
+
+# Function to create the aiohttp TraceConfig feeding the RequestTimings passed as trace_request_ctx
+# Requests made without one are not traced.
+def create_trace_config():
+    def hook(action, phase=None):
+        async def on_event(session, context, params):
+            timings = context.trace_request_ctx
+            if isinstance(timings, RequestTimings):
+                action(timings, phase)
+        return on_event
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(hook(RequestTimings.begin, 'queued'))
+    trace_config.on_connection_queued_end.append(hook(RequestTimings.end, 'queued'))
+    trace_config.on_dns_resolvehost_start.append(hook(RequestTimings.begin, 'dns'))
+    trace_config.on_dns_resolvehost_end.append(hook(RequestTimings.end, 'dns'))
+    trace_config.on_connection_create_start.append(hook(RequestTimings.begin, 'connect'))
+    trace_config.on_connection_create_end.append(hook(RequestTimings.end, 'connect'))
+    trace_config.on_request_headers_sent.append(hook(RequestTimings.begin, 'ttfb'))
+    trace_config.on_request_end.append(hook(lambda timings, phase: timings.response_started()))
+    return trace_config
+
+
+# Function to create the httpx trace extension feeding a RequestTimings
+# httpx resolves the host inside its TCP connect, so the DNS time is part of connect there.
+def httpx_trace(timings):
+    phases = {'connection.connect_tcp': 'connect', 'connection.start_tls': 'tls',
+              'http11.receive_response_headers': 'ttfb', 'http2.receive_response_headers': 'ttfb'}
+
+    async def trace(event_name, info):
+        name, _, step = event_name.rpartition('.')
+        phase = phases.get(name)
+        if phase == 'ttfb' and step == 'complete':
+            timings.response_started()
+        elif phase is not None and step == 'started':
+            timings.begin(phase)
+        elif phase is not None and step == 'complete':
+            timings.end(phase)
+    return trace
+
+
+# Function to fill a RequestTimings from the niquests connection info, once the response headers are in
+# The DNS, connect and TLS times of a connection are counted on the first request it carries only.
+def niquests_timings(timings, conn_info, first_use):
+    elapsed = monotonic() - timings.start
+    if conn_info is not None and first_use:
+        for phase, latency in (('dns', conn_info.resolution_latency), ('tls', conn_info.tls_handshake_latency)):
+            if latency is not None:
+                timings.add(phase, latency.total_seconds())
+        if conn_info.established_latency is not None:
+            timings.add('connect', max(0.0, conn_info.established_latency.total_seconds() - timings.phases.get('tls', 0.0)))
+    setup = sum(timings.phases.get(phase, 0.0) for phase in ('dns', 'connect', 'tls'))
+    timings.add('ttfb', max(0.0, elapsed - setup))
+    timings.headers_received = monotonic()
+
+
+# Latency histograms of the request phases, per host and user agent
+# Each (host, user agent) keeps the request count and, per phase, the bucket counts over HISTOGRAM_BOUNDS_MS
+# and the sum of its seconds. The histograms are plain dicts so the ones of every shard merge in the parent.
+class LatencyHistograms:
+    def __init__(self):
+        self.keys = {}
+
+    # Function to count the phase timings of a request
+    def add(self, url, user_agent, timings):
+        key = ((urlsplit(url).hostname or '').lower(), user_agent)
+        entry = self.keys.setdefault(key, {'requests': 0, 'buckets': {}, 'sums': {}})
+        entry['requests'] += 1
+        for phase, seconds in timings.items():
+            buckets = entry['buckets'].setdefault(phase, [0] * (len(HISTOGRAM_BOUNDS_MS) + 1))
+            buckets[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, seconds * 1000)] += 1
+            entry['sums'][phase] = entry['sums'].get(phase, 0.0) + seconds
+
+    def merge(self, other):
+        for key, other_entry in other.keys.items():
+            entry = self.keys.setdefault(key, {'requests': 0, 'buckets': {}, 'sums': {}})
+            entry['requests'] += other_entry['requests']
+            for phase, other_buckets in other_entry['buckets'].items():
+                buckets = entry['buckets'].setdefault(phase, [0] * len(other_buckets))
+                for index, count in enumerate(other_buckets):
+                    buckets[index] += count
+            for phase, seconds in other_entry['sums'].items():
+                entry['sums'][phase] = entry['sums'].get(phase, 0.0) + seconds
+
+    # Function to log the histograms at the end of a cycle: the mean of every phase, then the total time
+    # histogram as 'bucket bound: count' pairs
+    def log_summary(self):
+        for (host, user_agent), entry in sorted(self.keys.items()):
+            requests = entry['requests']
+            means = ', '.join(f"{phase} {entry['sums'][phase] / requests * 1000:.0f} ms"
+                              for phase in PHASES if phase in entry['sums'])
+            labels = [f"<={bound} ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]} ms"]
+            histogram = ', '.join(f"{label}: {count}" for label, count in zip(labels, entry['buckets'].get('total', []))
+                                  if count)
+            logging.info(f"Latency of {host} with {user_agent}: {requests} requests, mean {means}; total {histogram}")
@@ -0,0 +1,122 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from time import monotonic
+
+import aiohttp
+
+from adaptive_concurrency import parse_retry_after
+
+# Statuses worth another attempt later; any other HTTP error is final
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+# Defaults of the retry budget and backoff
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 10
+DEFAULT_MAX_DELAY = 900
+DEFAULT_JITTER = 0.5
+
+
+# Function to read the [Retry] settings, falling back to the defaults above
+def retry_settings(config):
+    return {
+        'max_attempts': config.getint('Retry', 'max_attempts', fallback=DEFAULT_MAX_ATTEMPTS),
+        'base_delay': config.getfloat('Retry', 'base_delay', fallback=DEFAULT_BASE_DELAY),
+        'max_delay': config.getfloat('Retry', 'max_delay', fallback=DEFAULT_MAX_DELAY),
+        'jitter': config.getfloat('Retry', 'jitter', fallback=DEFAULT_JITTER),
+    }
+
+
+# Function to tell whether a failed request may succeed when tried again
+def is_retryable(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+# Function to get the Retry-After delay carried by a failed response, if any
+def error_retry_after(error):
+    headers = getattr(error, 'headers', None)
+    return parse_retry_after(headers.get('Retry-After')) if headers else None
+
+
+# Delayed-retry queue of failed jobs, kept as a heap of due times
+# A job is a tuple of arguments for the handler that failed on it, and is also its key for the retry
+# budget. Each retry waits base_delay * 2^(attempt - 1) seconds, capped at max_delay and spread by
+# +/- jitter, or the server's Retry-After when it sent one. Nothing sleeps per job: callers pop the
+# due jobs into their own queue, or drain() waits for the earliest one.
+class RetryScheduler:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, jitter=DEFAULT_JITTER):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.heap = []
+        self.attempts = {}
+        self.sequence = itertools.count()  # Keeps jobs due at the same time in scheduling order
+
+    def __len__(self):
+        return len(self.heap)
+
+    # Function to queue a job to run after delay seconds
+    # attempts counts the tries the job already used up, such as those of an earlier run
+    def schedule(self, job, delay=0, attempts=None):
+        if attempts:
+            self.attempts[job] = attempts
+        heapq.heappush(self.heap, (monotonic() + delay, next(self.sequence), job))
+
+    # Function to get the backoff delay of a retry attempt
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # Function to schedule another attempt of a failed job
+    # Returns False when the error is final or the job has used up its retry budget
+    def retry(self, job, error):
+        if not is_retryable(error):
+            self.forget(job)
+            return False
+        attempt = self.attempts.get(job, 0) + 1
+        if attempt > self.max_attempts:
+            self.forget(job)
+            logging.error(f"Giving up on {job} after {self.max_attempts} retries. Exception: {error}")
+            return False
+        self.attempts[job] = attempt
+        retry_after = error_retry_after(error)
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        self.schedule(job, delay)
+        logging.info(f"Retrying {job} in {delay:.1f} seconds (attempt {attempt} of {self.max_attempts})")
+        return True
+
+    # Function to drop the retry budget of a job that succeeded or was given up on
+    # A scheduler kept across cycles would otherwise hold the budget of every job it ever saw
+    def forget(self, job):
+        self.attempts.pop(job, None)
+
+    # Function to pop every job whose time has come
+    def pop_due(self):
+        now = monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        return due
+
+    # Function to get the seconds left until the earliest job is due, None when the queue is empty
+    def next_delay(self):
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - monotonic())
+
+    # Function to run handle(*job) for every job as it comes due, until none is left
+    # Jobs scheduled again by handle are picked up as well
+    async def drain(self, handle):
+        while self.heap:
+            await asyncio.sleep(self.next_delay())
+            for job in self.pop_due():
+                try:
+                    await handle(*job)
+                except Exception as e:
+                    logging.error(f"Failed to retry {job}. Exception: {e}")
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+from time import time as current_time
+from urllib.parse import urljoin, urlsplit
+
+# Default lifetime of a cached robots.txt, in seconds
+DEFAULT_ROBOTS_TTL = 24 * 60 * 60
+
+
+# Function to tell whether a configured source is a bare site root rather than a sitemap URL
+def is_site_root(url):
+    return urlsplit(url).path in ('', '/')
+
+
+# Function to read the Sitemap: lines of a robots.txt body
+def parse_robots_sitemaps(text, robots_url):
+    sitemaps = []
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        field, _, value = line.partition(':')
+        if field.strip().lower() == 'sitemap' and value.strip():
+            sitemap = urljoin(robots_url, value.strip())
+            if sitemap not in sitemaps:
+                sitemaps.append(sitemap)
+    return sitemaps
+
+
+# On-disk cache of the sitemap URLs advertised by each site's robots.txt
+class RobotsCache:
+    def __init__(self, filename=None, ttl=DEFAULT_ROBOTS_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self.entries = {}
+        if filename:
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (ValueError, OSError) as e:
+                logging.error(f"Failed to read robots cache {filename}. Exception: {e}")
+
+    # Function to get the cached sitemaps of a robots.txt, None when missing or expired
+    def get(self, robots_url):
+        entry = self.entries.get(robots_url)
+        if entry and current_time() - entry['fetched_at'] < self.ttl:
+            return entry['sitemaps']
+        return None
+
+    # Function to store the sitemaps read from a robots.txt
+    def put(self, robots_url, sitemaps):
+        self.entries[robots_url] = {'fetched_at': current_time(), 'sitemaps': sitemaps}
+
+    # Function to write the cache to disk
+    def save(self):
+        if not self.filename:
+            return
+        temp_filename = f"{self.filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            logging.error(f"Failed to write robots cache {self.filename}. Exception: {e}")
+
+
+# Function to find the sitemaps of a site root through its (cached) robots.txt
+# Falls back to /sitemap.xml when robots.txt cannot be read or lists no sitemap
+async def get_robots_sitemaps(session, site_root, host_limits, robots_cache):
+    robots_url = urljoin(site_root, '/robots.txt')
+    sitemaps = robots_cache.get(robots_url)
+    if sitemaps is None:
+        try:
+            async with host_limits.for_url(robots_url):
+                async with session.get(robots_url) as response:
+                    if response.status == 404:
+                        text = ''  # No robots.txt, remembered like an empty one
+                    else:
+                        response.raise_for_status()
+                        text = await response.text(errors='replace')
+            sitemaps = parse_robots_sitemaps(text, robots_url)
+            robots_cache.put(robots_url, sitemaps)
+        except Exception as e:
+            logging.error(f"Failed to fetch {robots_url}. Exception: {e}")
+            sitemaps = []
+    return sitemaps or [urljoin(site_root, '/sitemap.xml')]
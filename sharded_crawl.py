@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from latency_sketch import LatencyMetrics
+from rate_limiter import SharedTokenBuckets
+from request_timings import LatencyHistograms
+from transfer_stats import TransferStats
+
+# Shards are partitioned by host unless [Crawler] shard_by = url
+DEFAULT_SHARD_BY = 'host'
+
+# Shard processes are spawned on every platform, since the parent has an event loop running
+SHARD_CONTEXT = multiprocessing.get_context('spawn')
+
+# Token buckets handed to this shard process when it started
+shard_buckets = None
+
+
+# Function to get the shard of a URL, from a stable hash of its host or of the whole URL
+# Python's hash() is salted per process, so it cannot be used to agree on shards across processes
+def shard_of(url, shard_count, shard_by=DEFAULT_SHARD_BY):
+    key = (urlsplit(url).hostname or '').lower() if shard_by == 'host' else url
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big') % shard_count
+
+
+# Function to split the in-flight limits of every host between the shards
+# Needed when shards are partitioned by URL, since each host is then crawled by every shard
+def split_rate_limits(rate_limits, shard_count):
+    default_limit, host_limits, adaptive_settings = rate_limits
+
+    def split(host_limit):
+        return host_limit._replace(max_in_flight=max(1, host_limit.max_in_flight // shard_count))
+
+    return split(default_limit), {host: split(host_limit) for host, host_limit in host_limits.items()}, adaptive_settings
+
+
+# Function to create the token buckets shared by the parent and every shard process
+def create_shared_buckets():
+    return SharedTokenBuckets(SHARD_CONTEXT)
+
+
+# Function to keep the shared token buckets in a shard process as it starts
+def init_shard_process(buckets):
+    global shard_buckets
+    shard_buckets = buckets
+
+
+# Function to get the shared token buckets of this shard process
+def current_shard_buckets():
+    return shard_buckets
+
+
+# Pages fetched by a crawl or a shard of it, merged into one report at the end of a sharded crawl
+class CrawlReport:
+    def __init__(self):
+        self.shards = 1
+        self.pages = 0
+        self.failures = 0
+        self.bytes = 0  # Body bytes read, up to the byte cap of each page
+        self.truncated = 0
+        self.skipped = 0
+        self.duration = 0.0
+        self.transfers = TransferStats()  # Bytes on the wire against page bytes, per host
+        self.latencies = LatencyHistograms()  # Request phase timings, per host and user agent
+        self.metrics = LatencyMetrics()  # Quantile sketches of the fetch latencies, per site and user agent
+        self.variants = {}  # User agent classes learned by a shard, merged by the parent's UaVariantPlanner
+
+    # Function to count a page fetch, given its PageStats or None when it failed
+    # With the URL and user agent, the phase timings of the page go into the latency histograms
+    def add(self, stats, url=None, user_agent=None):
+        if stats is None:
+            self.failures += 1
+        elif stats.skipped:
+            self.skipped += 1
+        else:
+            self.pages += 1
+            self.bytes += stats.page_length
+            self.truncated += stats.truncated
+        if stats is not None and stats.timings and url is not None:
+            self.latencies.add(url, user_agent, stats.timings)
+
+    def merge(self, other):
+        self.shards += other.shards
+        self.pages += other.pages
+        self.failures += other.failures
+        self.bytes += other.bytes
+        self.truncated += other.truncated
+        self.skipped += other.skipped
+        self.transfers.merge(other.transfers)
+        self.latencies.merge(other.latencies)
+        self.metrics.merge(other.metrics)
+        self.duration = max(self.duration, other.duration)
+
+    def summary(self):
+        return (f"{self.pages} pages ({self.truncated} truncated), {self.skipped} skipped content types, "
+                f"{self.failures} failed fetches, {self.bytes / 1024 / 1024:.1f} MB in {self.duration:.0f} seconds")
+
+
+# Function to merge the reports of the shards into one
+def merge_reports(reports):
+    merged = CrawlReport()
+    merged.shards = 0
+    for report in reports:
+        merged.merge(report)
+    return merged
+
+
+# Function to run crawl(shard, shard_count, *args) for every shard, each in its own process with its own
+# event loop, and gather the CrawlReport of every shard that finished
+# The shard processes take the shared token buckets when they start, through init_shard_process.
+async def run_shards(crawl, shard_count, shared_buckets, *args):
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=shard_count, mp_context=SHARD_CONTEXT,
+                             initializer=init_shard_process, initargs=(shared_buckets,)) as executor:
+        results = await asyncio.gather(*(loop.run_in_executor(executor, crawl, shard, shard_count, *args)
+                                         for shard in range(shard_count)), return_exceptions=True)
+    reports = []
+    for shard, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logging.error(f"Failed to crawl shard {shard + 1} of {shard_count}. Exception: {result}")
+            continue
+        logging.info(f"Shard {shard + 1} of {shard_count}: {result.summary()}")
+        reports.append(result)
+    return reports
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+import os
+
+
+# On-disk cache of the HTTP validators of every sitemap document, keyed by sitemap URL
+# ETag and Last-Modified are sent back as If-None-Match / If-Modified-Since on the next cycle,
+# and the body digest catches unchanged documents from servers that send no validators
+class SitemapValidatorCache:
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.unchanged_urls = set()
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            logging.error(f"Failed to read sitemap cache {filename}. Exception: {e}")
+
+    # Function to build the conditional request headers for a sitemap URL
+    def request_headers(self, url):
+        headers = {}
+        entry = self.entries.get(url)
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    # Function to record a 304 Not Modified response
+    def mark_not_modified(self, url):
+        self.unchanged_urls.add(url)
+
+    # Function to store the validators and body digest of a full response
+    def update(self, url, etag, last_modified, digest):
+        previous = self.entries.get(url)
+        if previous and previous.get('digest') == digest:
+            self.unchanged_urls.add(url)
+        else:
+            self.unchanged_urls.discard(url)
+        self.entries[url] = {'etag': etag, 'last_modified': last_modified, 'digest': digest}
+
+    # Function to keep the (sitemap URL, lastmod epoch) children of a sitemap index read in full
+    # A 304 carries no body, so they are what the index hands on when it comes back unchanged
+    def set_children(self, url, children):
+        if url in self.entries:
+            self.entries[url]['children'] = [list(child) for child in children]
+
+    # Function to get the children kept for a sitemap index, None when the cache knows no index at that URL
+    def children(self, url):
+        children = self.entries.get(url, {}).get('children')
+        return None if children is None else [tuple(child) for child in children]
+
+    # Function to check whether a sitemap was unchanged during this cycle
+    def is_unchanged(self, url):
+        return url in self.unchanged_urls
+
+    # Function to write the cache back to disk, called once the cycle's links are committed
+    def save(self):
+        temp_filename = f"{self.filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_filename, self.filename)
+            self.unchanged_urls.clear()
+        except OSError as e:
+            logging.error(f"Failed to write sitemap cache {self.filename}. Exception: {e}")
+
+
+# Function to create the digest object used for sitemap bodies
+def new_body_digest():
+    return hashlib.sha256()
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import xml.etree.ElementTree as ET
+import zlib
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from lastmod_filter import BATCH_SIZE, LastmodDecoder, epochs_to_list, filter_entries
+from robots_sitemaps import RobotsCache, get_robots_sitemaps, is_site_root
+from sitemap_cache import new_body_digest
+from sitemap_parser import CHUNK_SIZE, SitemapStreamParser, is_gzip_sitemap
+from sitemap_snapshots import diff_fingerprints
+from transfer_stats import accept_encoding
+
+# Default connection settings for the discovery stage
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 4
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_REQUEST_TIMEOUT = 60
+
+# Default budget of the recursive sitemap expansion
+DEFAULT_MAX_DEPTH = 5
+DEFAULT_MAX_SITEMAPS = 10000
+
+
+# Function to record the (lastmod epoch, priority, changefreq) of the links kept from a batch of entries
+def record_link_info(link_info, entries, links, decoder):
+    entries_by_loc = {entry.loc: entry for entry in entries}
+    for link in links:
+        entry = entries_by_loc.get(link)
+        if entry is not None:
+            link_info[link] = (decoder.decode(entry.lastmod), entry.priority, entry.changefreq)
+
+
+# Function to create the shared discovery session with a keep-alive connection pool
+def create_discovery_session(max_connections=DEFAULT_MAX_CONNECTIONS,
+                             max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                             keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                             request_timeout=DEFAULT_REQUEST_TIMEOUT):
+    connector = aiohttp.TCPConnector(limit=max_connections,
+                                     limit_per_host=max_connections_per_host,
+                                     keepalive_timeout=keepalive_timeout)
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'Accept-Encoding': accept_encoding()})
+
+
+# Per-host concurrency cap shared by every discovery coroutine
+class HostLimits:
+    def __init__(self, max_per_host):
+        self.max_per_host = max_per_host
+        self.semaphores = {}
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self.semaphores[host]
+
+
+# Function to stream the entries of a sitemap through the shared session
+# Entries are parsed while the body is still arriving, gzip sitemaps are inflated on the fly
+# With a validator cache the request is conditional, and a 304 yields no entries at all
+# With a TransferStats the wire and body bytes of the sitemap are recorded on it
+async def stream_sitemap_entries(session, url, host_limits, parser, cache=None, transfers=None):
+    headers = cache.request_headers(url) if cache else {}
+    digest = new_body_digest()
+    async with host_limits.for_url(url):
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                logging.debug(f"Sitemap not modified: {url}")
+                cache.mark_not_modified(url)
+                return
+            response.raise_for_status()
+            gzip_expected = is_gzip_sitemap(url, response.headers.get('Content-Type'))
+            body_bytes = 0
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                body_bytes += len(chunk)
+                digest.update(chunk)
+                for entry in parser.feed(chunk):
+                    yield entry
+            if gzip_expected and not parser.gzipped:
+                logging.debug(f"Gzip sitemap {url} arrived already decompressed by the transport")
+            if transfers is not None:
+                wire_bytes = transfers.record(url, response, body_bytes)
+                logging.debug(f"Sitemap {url}: {wire_bytes} bytes on the wire for {body_bytes} bytes, "
+                              f"Content-Encoding: {response.headers.get('Content-Encoding', 'identity')}")
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    for entry in parser.close():
+        yield entry
+    if cache:
+        cache.update(url, etag, last_modified, digest.hexdigest())
+
+
+# Function to read one sitemap document, whatever its kind
+# For a sitemap index, proposes its own watermark and returns the (sitemap URL, lastmod epoch) pairs of
+# its children, the ones kept by the validator cache when the index comes back 304.
+# For a urlset with a snapshot, returns the URLs added or changed since that snapshot and records
+# the removed ones on the snapshot store. Without a snapshot (or store), keeps the entries newer
+# than the sitemap's own watermark. Entries are decoded and filtered in batches either way, and
+# the sitemap's next watermark and snapshot are proposed for the caller to commit.
+# With a link_info dict the lastmod, priority and changefreq of every kept link are recorded in it.
+# Returns (child sitemaps, links)
+async def read_sitemap(session, site, sitemap_url, sitemap_lastmod, host_limits, watermarks, decoder,
+                       cache=None, snapshots=None, link_info=None, transfers=None):
+    logging.debug(f"Reading sitemap: {sitemap_url}")
+    parser = SitemapStreamParser(None)
+    children = []
+    links = []
+    added = []
+    changed = []
+    _, entries_watermark = watermarks.sitemap_watermarks(site, sitemap_url)
+    newest_lastmod = entries_watermark
+    previous = snapshots.previous(sitemap_url) if snapshots else None
+    batch = []
+
+    def flush_batch():
+        nonlocal newest_lastmod
+        kept_from = len(links)
+        if snapshots:
+            entries = [entry for entry in batch if entry.loc]
+            epochs = epochs_to_list(decoder.decode_batch([entry.lastmod for entry in entries]))
+            fingerprints = [(entry.loc, epoch) for entry, epoch in zip(entries, epochs)]
+            snapshots.stage(sitemap_url, fingerprints)
+            newest = max((epoch for epoch in epochs if epoch is not None), default=None)
+            if previous is not None:
+                delta, batch_added, batch_changed = diff_fingerprints(previous, fingerprints)
+                links.extend(delta)
+                added.extend(batch_added)
+                changed.extend(batch_changed)
+            else:
+                links.extend(url for url, epoch in fingerprints if epoch is not None and epoch > entries_watermark)
+        else:
+            kept, newest = filter_entries(batch, entries_watermark, decoder)
+            links.extend(kept)
+        if link_info is not None:
+            record_link_info(link_info, batch, links[kept_from:], decoder)
+        if newest is not None:
+            newest_lastmod = max(newest_lastmod, newest)
+        batch.clear()
+
+    try:
+        async for entry in stream_sitemap_entries(session, sitemap_url, host_limits, parser, cache, transfers):
+            if parser.kind == 'sitemapindex':
+                if entry.loc:
+                    children.append((entry.loc, decoder.decode(entry.lastmod)))
+                continue
+            batch.append(entry)
+            if len(batch) >= BATCH_SIZE:
+                flush_batch()
+        flush_batch()
+    except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError, zlib.error) as e:
+        logging.error(f"Failed to fetch sitemap {sitemap_url}. Exception: {e}")
+        if snapshots:
+            snapshots.discard(sitemap_url)
+        return [], links
+    except BaseException:
+        # Never let a partly read sitemap replace its snapshot, whatever stopped the read
+        if snapshots:
+            snapshots.discard(sitemap_url)
+        raise
+    if cache and parser.kind == 'sitemapindex':
+        cache.set_children(sitemap_url, children)
+    elif cache and parser.kind is None and cache.is_unchanged(sitemap_url):
+        # An unchanged index still hands its children on, each checked against its own watermark and
+        # validators, since a child can change without its index changing
+        children = cache.children(sitemap_url) or []
+    if children:
+        # An index keeps a watermark of its own too, so a nested one is gated on the lastmod it was last
+        # read at rather than on the site's, which another branch of the site may have moved past it
+        watermarks.propose(site, sitemap_url, sitemap_lastmod, None)
+    if cache and cache.is_unchanged(sitemap_url):
+        if snapshots:
+            snapshots.discard(sitemap_url)
+        return children, []
+    if parser.kind != 'sitemapindex':
+        watermarks.propose(site, sitemap_url, sitemap_lastmod, newest_lastmod)
+        if previous is not None:
+            removed = list(previous)
+            snapshots.record_delta(added, changed, removed)
+            logging.info(f"Sitemap {sitemap_url}: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    return children, links
+
+
+# Function to discover the links of every configured source as one breadth-first async frontier
+# A source is either a sitemap (index) URL or a bare site root, whose sitemaps come from robots.txt.
+# Nested sitemap indexes are expanded recursively as soon as they are read; a visited set breaks
+# cycles and duplicates, and max_depth / max_sitemaps bound the expansion.
+# Returns the links in source and sitemap index order. Only sitemaps newer than their watermarks are
+# read, and sitemaps found unchanged through the optional validator cache contribute no links.
+# With a snapshot store the links are the URLs added or changed since the last committed read,
+# otherwise the entries newer than their watermark. The watermarks and snapshots proposed here
+# advance when the caller commits them. With a link_info dict the lastmod, priority and changefreq of
+# every link are recorded in it, for the crawl frontier. With a TransferStats the bytes every sitemap took on
+# the wire are recorded on it.
+async def discover_sitemap_links(sources, watermarks,
+                                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                                 max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                                 request_timeout=DEFAULT_REQUEST_TIMEOUT,
+                                 cache=None, decoder=None, robots_cache=None,
+                                 max_depth=DEFAULT_MAX_DEPTH, max_sitemaps=DEFAULT_MAX_SITEMAPS,
+                                 snapshots=None, link_info=None, transfers=None):
+    host_limits = HostLimits(max_connections_per_host)
+    decoder = decoder or LastmodDecoder()
+    robots_cache = robots_cache or RobotsCache()
+    visited = set()
+    results = {}
+    pending = set()
+
+    # Function to add a sitemap to the frontier unless it was seen before or is over budget
+    def schedule(site, sitemap_url, lastmod, depth, key):
+        if sitemap_url in visited:
+            logging.debug(f"Skipping already visited sitemap: {sitemap_url}")
+            return
+        if depth > max_depth:
+            logging.warning(f"Skipping sitemap {sitemap_url}: deeper than {max_depth} levels")
+            return
+        if len(visited) >= max_sitemaps:
+            logging.warning(f"Skipping sitemap {sitemap_url}: budget of {max_sitemaps} sitemaps reached")
+            return
+        visited.add(sitemap_url)
+        sitemap_watermark, _ = watermarks.sitemap_watermarks(site, sitemap_url)
+        logging.debug(f"Sitemap: {sitemap_url}, Last Modified: {lastmod}, Watermark: {sitemap_watermark}")
+        if lastmod is not None and lastmod <= sitemap_watermark:
+            return
+        pending.add(asyncio.ensure_future(expand(site, sitemap_url, lastmod, depth, key)))
+
+    # Function to read a sitemap and push its children onto the frontier
+    async def expand(site, sitemap_url, lastmod, depth, key):
+        children, links = await read_sitemap(session, site, sitemap_url, lastmod, host_limits,
+                                              watermarks, decoder, cache, snapshots, link_info, transfers)
+        results[key] = links
+        for index, (child, child_lastmod) in enumerate(children):
+            schedule(site, child, child_lastmod, depth + 1, key + (index,))
+
+    # Function to seed the frontier with the sitemaps of one configured source
+    async def seed(source, source_index):
+        if is_site_root(source):
+            sitemaps = await get_robots_sitemaps(session, source, host_limits, robots_cache)
+        else:
+            sitemaps = [source]
+        for index, sitemap_url in enumerate(sitemaps):
+            schedule(source, sitemap_url, None, 0, (source_index, index))
+
+    sources = [source.strip() for source in sources if source.strip()]
+    async with create_discovery_session(max_connections, max_connections_per_host,
+                                        keepalive_timeout, request_timeout) as session:
+        await asyncio.gather(*(seed(source, index) for index, source in enumerate(sources)))
+        while pending:
+            done, _ = await asyncio.wait(pending)
+            pending.difference_update(done)
+            for task in done:
+                if task.exception():
+                    logging.error(f"Failed to expand a sitemap. Exception: {task.exception()}")
+    robots_cache.save()
+    return [link for key in sorted(results) for link in results[key]]
@@ -0,0 +1,139 @@
+import xml.etree.ElementTree as ET
+import zlib
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+# Size of the chunks read from a sitemap response body
+CHUNK_SIZE = 64 * 1024
+
+# One <url> or <sitemap> entry of a sitemap document
+SitemapEntry = namedtuple('SitemapEntry', ['loc', 'lastmod', 'changefreq', 'priority'])
+
+SITEMAP_ENTRY_FIELDS = SitemapEntry._fields
+
+# First bytes of every gzip member
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_CONTENT_TYPES = ('application/gzip', 'application/x-gzip', 'application/x-gunzip')
+
+# Entry element of each kind of sitemap document, keyed by the root element
+ENTRY_TAGS = {'urlset': 'url', 'sitemapindex': 'sitemap'}
+
+
+# Function to strip the namespace from an element tag
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+# Function to clean the text of a sitemap field
+def clean_text(text):
+    if text is None:
+        return None
+    text = text.replace("<![CDATA[", "").replace("]]>", "").strip()  # Remove CDATA
+    return text or None
+
+
+# Function to tell from the URL extension or the content type whether a sitemap is gzip-compressed
+def is_gzip_sitemap(url, content_type=None):
+    if urlsplit(url).path.lower().endswith('.gz'):
+        return True
+    return bool(content_type) and content_type.split(';')[0].strip().lower() in GZIP_CONTENT_TYPES
+
+
+# Streaming gunzip of a .xml.gz body, chunk by chunk and member by member
+# Output is produced in pieces of at most CHUNK_SIZE bytes so the document is never inflated in memory
+class GzipChunkDecoder:
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        while data:
+            piece = self.decompressor.decompress(data, CHUNK_SIZE)
+            if piece:
+                yield piece
+            if self.decompressor.eof:  # Start the next member of a multi-member file
+                data = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = self.decompressor.unconsumed_tail
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+# Incremental sitemap parser fed with raw body chunks as they arrive
+# Each <url> (or <sitemap> for an index) element is turned into a SitemapEntry
+# and then released, so memory stays constant regardless of the document size.
+# Gzip bodies (.xml.gz) are recognised by their magic bytes and inflated on the fly, since a .gz
+# sitemap served with Content-Encoding: gzip arrives already inflated whatever its extension says.
+# With entry_tag=None the entry element follows the root element, and kind tells which one it was.
+class SitemapStreamParser:
+    def __init__(self, entry_tag='url'):
+        self.entry_tag = entry_tag
+        self.kind = None
+        self.gzipped = False
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.root = None
+        self.decoder = None
+        self.head = b''
+
+    def feed(self, data):
+        if self.head is not None:
+            # Wait for the first two bytes before deciding whether the body is gzip
+            self.head += data
+            if len(self.head) < len(GZIP_MAGIC):
+                return []
+            data, self.head = self.head, None
+            if data.startswith(GZIP_MAGIC):
+                self.gzipped = True
+                self.decoder = GzipChunkDecoder()
+        if self.decoder is None:
+            self.parser.feed(data)
+            return self.read_entries()
+        entries = []
+        for piece in self.decoder.decompress(data):
+            self.parser.feed(piece)
+            entries.extend(self.read_entries())
+        return entries
+
+    def close(self):
+        if self.head:  # Body shorter than the gzip magic
+            self.parser.feed(self.head)
+            self.head = None
+        if self.decoder is not None:
+            self.parser.feed(self.decoder.flush())
+        self.parser.close()
+        return self.read_entries()
+
+    def read_entries(self):
+        entries = []
+        for event, elem in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = elem
+                    self.kind = local_name(elem.tag)
+                    if self.entry_tag is None:
+                        self.entry_tag = ENTRY_TAGS.get(self.kind, 'url')
+                continue
+            if local_name(elem.tag) != self.entry_tag:
+                continue
+            fields = {}
+            for child in elem:  # Only direct children, so <image:loc> and friends are ignored
+                name = local_name(child.tag)
+                if name in SITEMAP_ENTRY_FIELDS and name not in fields:
+                    fields[name] = clean_text(child.text)
+            entries.append(SitemapEntry(fields.get('loc'), fields.get('lastmod'),
+                                        fields.get('changefreq'), fields.get('priority')))
+            # Free the element and drop it from the root so the tree never grows
+            elem.clear()
+            if self.root is not None and elem is not self.root:
+                self.root.clear()
+        return entries
+
+
+# Function to yield the entries of a sitemap from an iterable of body chunks
+def iter_sitemap_entries(chunks, entry_tag='url'):
+    parser = SitemapStreamParser(entry_tag)
+    for chunk in chunks:
+        if chunk:
+            yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,95 @@
+import logging
+import sqlite3
+
+# Marker for a URL missing from the previous snapshot
+NOT_IN_SNAPSHOT = object()
+
+
+# Store of the (url, lastmod) fingerprints of every sitemap as of its last committed read
+# Each new read of a sitemap is diffed against its snapshot to find the added, changed and
+# removed URLs. The new fingerprints are staged while the sitemap streams in and replace the
+# snapshot when commit() is called, after the cycle's delta has been written out.
+class SnapshotStore:
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshot_sitemaps (sitemap TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS snapshots (
+                sitemap TEXT NOT NULL, url TEXT NOT NULL, lastmod INTEGER,
+                PRIMARY KEY (sitemap, url)
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE staged_snapshots (sitemap TEXT NOT NULL, url TEXT NOT NULL, lastmod INTEGER);
+        """)
+        self.staged_sitemaps = set()
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    # Function to load the snapshot of a sitemap, None when the sitemap was never read before
+    def previous(self, sitemap):
+        known = self.connection.execute('SELECT 1 FROM snapshot_sitemaps WHERE sitemap = ?', (sitemap,)).fetchone()
+        if known is None:
+            return None
+        rows = self.connection.execute('SELECT url, lastmod FROM snapshots WHERE sitemap = ?', (sitemap,))
+        return dict(rows)
+
+    # Function to stage a batch of (url, lastmod) fingerprints of a sitemap being read
+    def stage(self, sitemap, fingerprints):
+        if sitemap not in self.staged_sitemaps:
+            self.connection.execute('DELETE FROM staged_snapshots WHERE sitemap = ?', (sitemap,))
+            self.staged_sitemaps.add(sitemap)
+        self.connection.executemany('INSERT INTO staged_snapshots (sitemap, url, lastmod) VALUES (?, ?, ?)',
+                                    ((sitemap, url, lastmod) for url, lastmod in fingerprints))
+
+    # Function to drop what was staged for a sitemap whose read failed
+    def discard(self, sitemap):
+        if sitemap in self.staged_sitemaps:
+            self.connection.execute('DELETE FROM staged_snapshots WHERE sitemap = ?', (sitemap,))
+            self.staged_sitemaps.discard(sitemap)
+
+    # Function to record the delta of a fully read sitemap
+    def record_delta(self, added, changed, removed):
+        self.added.extend(added)
+        self.changed.extend(changed)
+        self.removed.extend(removed)
+
+    # Function to replace the snapshots of every sitemap staged during this cycle
+    def commit(self):
+        try:
+            with self.connection:
+                for sitemap in self.staged_sitemaps:
+                    self.connection.execute('DELETE FROM snapshots WHERE sitemap = ?', (sitemap,))
+                    self.connection.execute('INSERT OR REPLACE INTO snapshots (sitemap, url, lastmod) '
+                                            'SELECT sitemap, url, lastmod FROM staged_snapshots WHERE sitemap = ?',
+                                            (sitemap,))
+                    self.connection.execute('INSERT OR IGNORE INTO snapshot_sitemaps (sitemap) VALUES (?)', (sitemap,))
+                self.connection.execute('DELETE FROM staged_snapshots')
+        except sqlite3.Error as e:
+            logging.error(f"Failed to commit sitemap snapshots to {self.filename}. Exception: {e}")
+        self.staged_sitemaps = set()
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    def close(self):
+        self.connection.close()
+
+
+# Function to diff a batch of fingerprints against a sitemap's previous snapshot
+# Matched URLs are popped from previous, so whatever is left at the end of the sitemap was removed
+# Returns the added and changed URLs of the batch in document order, then each kind on its own
+def diff_fingerprints(previous, fingerprints):
+    delta = []
+    added = []
+    changed = []
+    for url, lastmod in fingerprints:
+        previous_lastmod = previous.pop(url, NOT_IN_SNAPSHOT)
+        if previous_lastmod is NOT_IN_SNAPSHOT:
+            added.append(url)
+        elif previous_lastmod != lastmod:
+            changed.append(url)
+        else:
+            continue
+        delta.append(url)
+    return delta, added, changed
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import adaptive_concurrency
+from adaptive_concurrency import AdaptiveLimit, parse_retry_after, percentile
+
+
+# Clock standing in for monotonic(), advanced by the simulation
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(adaptive_concurrency, 'monotonic', clock)
+    return clock
+
+
+# Function to feed an AdaptiveLimit responses whose latency comes from latency(limit)
+# Time moves on by a latency per round of limit requests, as with limit requests in flight
+def simulate(adaptive_limit, clock, latency, responses=5000):
+    limits = []
+    for _ in range(responses):
+        seconds = latency(int(adaptive_limit.limit))
+        clock.now += seconds / int(adaptive_limit.limit)
+        adaptive_limit.on_response(seconds, 200)
+        limits.append(adaptive_limit.limit)
+    return limits
+
+
+@pytest.mark.parametrize('sigma', [0.3, 0.6])
+def test_stationary_latency_climbs_to_max_limit(clock, sigma):
+    rng = random.Random(1)
+    adaptive_limit = AdaptiveLimit('example.com', 16)
+    limits = simulate(adaptive_limit, clock, lambda limit: 0.2 * rng.lognormvariate(0, sigma))
+    assert int(adaptive_limit.limit) == 16
+    assert sum(limits[-1000:]) / 1000 > 15
+    assert adaptive_limit.decreases <= 2
+
+
+def test_latency_rising_with_load_backs_off(clock):
+    rng = random.Random(1)
+    adaptive_limit = AdaptiveLimit('example.com', 32)
+    # Past 4 requests in flight the host queues them, and latency grows with the square of the load
+    limits = simulate(adaptive_limit, clock,
+                      lambda limit: 0.2 * max(1, limit / 4) ** 2 * rng.lognormvariate(0, 0.3))
+    assert adaptive_limit.decreases > 0
+    assert max(limits[-1000:]) < 24
+    assert sum(limits[-1000:]) / 1000 < 16
+
+
+def test_host_that_got_slower_recovers(clock):
+    adaptive_limit = AdaptiveLimit('example.com', 8, initial_limit=8)
+    simulate(adaptive_limit, clock, lambda limit: 0.1, responses=200)
+    simulate(adaptive_limit, clock, lambda limit: 0.5, responses=3000)
+    assert int(adaptive_limit.limit) == 8
+
+
+def test_overload_status_halves_the_limit(clock):
+    adaptive_limit = AdaptiveLimit('example.com', 16, initial_limit=8)
+    adaptive_limit.on_response(0.1, 429)
+    assert int(adaptive_limit.limit) == 4
+
+
+def test_retry_after_pauses_the_host(clock):
+    adaptive_limit = AdaptiveLimit('example.com', 16, initial_limit=8)
+    adaptive_limit.on_response(0.1, 503, retry_after='30')
+    assert adaptive_limit.paused_until == clock.now + 30
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('Thu, 01 Jan 1970 00:00:00 GMT') == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_percentile():
+    assert percentile([], 0.5) is None
+    assert percentile([1, 2, 3, 4], 0.5) == 3
+    assert percentile([1, 2, 3, 4], 0.99) == 4
@@ -0,0 +1,67 @@
+import configparser
+
+from crawl_frontier import CrawlFrontier, frontier_settings, iter_frontier
+
+NOW = 1714521600.0
+
+
+def test_fresh_links_come_first_within_a_site():
+    frontier = CrawlFrontier(now=NOW)
+    frontier.push('https://a.example/old', NOW - 30 * 86400)
+    frontier.push('https://a.example/fresh', NOW - 3600)
+    frontier.push('https://a.example/unknown')
+    assert [row[0] for row in frontier] == ['https://a.example/fresh', 'https://a.example/old',
+                                            'https://a.example/unknown']
+    assert len(frontier) == 0
+
+
+def test_sites_take_turns_by_weight():
+    frontier = CrawlFrontier(now=NOW, site_weights={'a.example': 2.0})
+    for page in range(4):
+        frontier.push(f'https://a.example/{page}')
+        frontier.push(f'https://b.example/{page}')
+    hosts = [row[0].split('/')[2][0] for row in frontier]
+    assert hosts[:6] == ['a', 'b', 'a', 'a', 'b', 'a']
+
+
+def test_site_pushed_between_pops_takes_its_turn_next():
+    frontier = CrawlFrontier(now=NOW)
+    for page in range(3):
+        frontier.push(f'https://a.example/{page}')
+    assert frontier.pop() == ['https://a.example/0']
+    frontier.push('https://b.example/0')
+    assert [row[0] for row in frontier] == ['https://b.example/0', 'https://a.example/1', 'https://a.example/2']
+
+
+def test_iter_frontier_holds_at_most_max_links():
+    read = []
+
+    def rows():
+        for page in range(100):
+            read.append(page)
+            yield [f'https://a.example/{page}', str(NOW - page), '0.5', 'daily']
+
+    ordered = []
+    for row in iter_frontier(rows(), max_links=10, now=NOW):
+        assert len(read) - len(ordered) <= 10
+        ordered.append(row)
+    assert sorted(row[0] for row in ordered) == sorted(f'https://a.example/{page}' for page in range(100))
+
+
+def test_iter_frontier_orders_within_its_window():
+    rows = [['https://a.example/old', str(NOW - 30 * 86400)], [], ['https://a.example/fresh', str(NOW)],
+            ['https://a.example/bare']]
+    assert [row[0] for row in iter_frontier(rows, now=NOW)] == ['https://a.example/fresh', 'https://a.example/old',
+                                                                'https://a.example/bare']
+    assert [row[0] for row in iter_frontier(rows, max_links=1, now=NOW)] == ['https://a.example/old',
+                                                                             'https://a.example/fresh',
+                                                                             'https://a.example/bare']
+
+
+def test_frontier_settings():
+    config = configparser.ConfigParser()
+    config.read_string('[Frontier]\nsite_weights = A.example=2, b.example = 0.5\nmax_links = 50\n')
+    settings = frontier_settings(config)
+    assert settings['site_weights'] == {'a.example': 2.0, 'b.example': 0.5}
+    assert settings['max_links'] == 50
+    assert settings['recency_half_life'] == 24 * 3600
@@ -0,0 +1,63 @@
+import pytest
+
+from csv_dedup import CsvDeduplicator, dedupe_external, dedupe_in_memory
+
+URLS = [f'https://example.com/{page % 7}' for page in range(30)] + ['https://example.com/last']
+UNIQUE = list(dict.fromkeys(URLS))
+
+
+def write_urls(filename, urls):
+    filename.write_text(''.join(f'{url}\n' for url in urls), encoding='utf-8')
+
+
+def read_urls(filename):
+    return filename.read_text(encoding='utf-8').splitlines()
+
+
+def test_dedupe_in_memory_keeps_first_occurrences(tmp_path):
+    write_urls(tmp_path / 'links.csv', URLS)
+    assert dedupe_in_memory(tmp_path / 'links.csv', tmp_path / 'unique.csv', 100)
+    assert read_urls(tmp_path / 'unique.csv') == UNIQUE
+    assert not dedupe_in_memory(tmp_path / 'links.csv', tmp_path / 'unique.csv', 3)
+
+
+def test_dedupe_external_keeps_first_seen_order(tmp_path):
+    write_urls(tmp_path / 'links.csv', URLS)
+    dedupe_external(str(tmp_path / 'links.csv'), str(tmp_path / 'unique.csv'), 2)
+    assert read_urls(tmp_path / 'unique.csv') == UNIQUE
+
+
+@pytest.mark.parametrize('memory_limit', [1024 * 1024, 300])
+def test_first_sync_rebuilds_the_file(tmp_path, memory_limit):
+    write_urls(tmp_path / 'links.csv', URLS)
+    dedup = CsvDeduplicator(str(tmp_path / 'dedup.db'), memory_limit)
+    dedup.sync(str(tmp_path / 'links.csv'))
+    assert read_urls(tmp_path / 'links.csv') == UNIQUE
+    dedup.close()
+
+
+def test_append_unique_skips_known_urls(tmp_path):
+    dedup = CsvDeduplicator(str(tmp_path / 'dedup.db'))
+    links = str(tmp_path / 'links.csv')
+    assert dedup.append_unique(links, ['https://example.com/a', 'https://example.com/b', 'https://example.com/a']) == 2
+    assert dedup.append_unique(links, ['https://example.com/b', 'https://example.com/c']) == 1
+    assert read_urls(tmp_path / 'links.csv') == ['https://example.com/a', 'https://example.com/b', 'https://example.com/c']
+    dedup.close()
+
+
+def test_sync_drops_duplicates_appended_by_other_writers(tmp_path):
+    dedup = CsvDeduplicator(str(tmp_path / 'dedup.db'))
+    links = str(tmp_path / 'links.csv')
+    dedup.append_unique(links, ['https://example.com/a'])
+    with open(links, 'a', encoding='utf-8') as f:
+        f.write('https://example.com/a\nhttps://example.com/b\nhttps://example.com/b\n')
+    dedup.sync(links)
+    assert read_urls(tmp_path / 'links.csv') == ['https://example.com/a', 'https://example.com/b']
+    dedup.close()
+
+    # The index survives a restart, and a file cleared by another writer is indexed again from scratch
+    dedup = CsvDeduplicator(str(tmp_path / 'dedup.db'))
+    assert dedup.append_unique(links, ['https://example.com/b']) == 0
+    write_urls(tmp_path / 'links.csv', [])
+    assert dedup.append_unique(links, ['https://example.com/b']) == 1
+    dedup.close()
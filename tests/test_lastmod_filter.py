@@ -0,0 +1,86 @@
+import pytest
+import pytz
+
+import lastmod_filter
+from lastmod_filter import LastmodDecoder, days_from_civil, epochs_to_list, filter_entries, filter_newer
+from sitemap_parser import SitemapEntry
+
+# 2024-05-01T00:00:00Z
+EPOCH = 1714521600
+
+LASTMODS = [
+    ('2024-05-01T00:00:00Z', EPOCH),
+    ('2024-05-01T03:00:00+03:00', EPOCH),
+    ('2024-04-30T22:00:00-02:00', EPOCH),
+    ('2024-05-01T03:00:00+0300', EPOCH),
+    ('2024-05-01T03:00:00', EPOCH),
+    ('<![CDATA[ 2024-05-01T03:00:00 ]]>', EPOCH),
+    ('2024-05-01', EPOCH - 3 * 3600),
+    ('2024-02-29T00:00:00Z', EPOCH - 62 * 86400),
+    ('2024-02-31T00:00:00Z', None),
+    ('2023-02-29T00:00:00+00:00', None),
+    ('2024-13-01T00:00:00Z', None),
+    ('2024-01-01T25:30:00Z', None),
+    ('2024-05-01T10:99:00+02:00', None),
+    ('yesterday', None),
+    ('', None),
+    (None, None),
+]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        if lastmod_filter.np is None:
+            pytest.skip('NumPy is not installed')
+    else:
+        monkeypatch.setattr(lastmod_filter, 'np', None)
+    return request.param
+
+
+def test_days_from_civil():
+    assert days_from_civil(1970, 1, 1) == 0
+    assert days_from_civil(2024, 5, 1) * 86400 == EPOCH
+
+
+def test_decode_batch_reads_naive_lastmods_in_the_program_timezone(backend):
+    decoder = LastmodDecoder(pytz.timezone('Europe/Athens'))
+    epochs = epochs_to_list(decoder.decode_batch([lastmod for lastmod, _ in LASTMODS]))
+    assert epochs == [epoch for _, epoch in LASTMODS]
+
+
+def test_decode_batch_agrees_with_decode(backend):
+    decoder = LastmodDecoder(pytz.timezone('Europe/Athens'))
+    lastmods = [lastmod for lastmod, _ in LASTMODS]
+    assert epochs_to_list(decoder.decode_batch(lastmods)) == [decoder.decode(lastmod) for lastmod in lastmods]
+
+
+def test_filter_newer(backend):
+    epochs = LastmodDecoder().decode_batch(['2024-05-01T00:00:00Z', None, '2024-05-02T00:00:00Z'])
+    kept, newest = filter_newer(['a', 'b', 'c'], epochs, EPOCH)
+    assert kept == ['c']
+    assert newest == EPOCH + 86400
+    assert filter_newer([], [], EPOCH) == ([], None)
+
+
+def test_filter_entries_skips_entries_without_a_lastmod(backend):
+    entries = [SitemapEntry('https://example.com/a', '2024-05-02T00:00:00Z', None, None),
+               SitemapEntry('https://example.com/b', None, None, None)]
+    assert filter_entries(entries, EPOCH, LastmodDecoder()) == (['https://example.com/a'], EPOCH + 86400)
+
+
+@pytest.mark.parametrize('lastmod', [
+    '2024-01-01T25:30:00Z',
+    '2024-01-01T24:00:00Z',
+    '2024-01-01T10:99:00+02:00',
+    '2024-01-01T10:00:60Z',
+    '2024-01-01T10:00:00+24:00',
+    '2024-01-01T10:00:00+02:60',
+    '2024-00-10T10:00:00Z',
+    '2024-04-31T10:00:00Z',
+    '2024-01-00T10:00:00Z',
+])
+def test_decode_batch_rejects_what_decode_rejects(backend, lastmod):
+    decoder = LastmodDecoder()
+    lastmods = [lastmod, '2024-05-01T00:00:00Z']
+    assert epochs_to_list(decoder.decode_batch(lastmods)) == [decoder.decode(lastmod) for lastmod in lastmods]
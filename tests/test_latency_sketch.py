@@ -0,0 +1,88 @@
+import configparser
+import json
+import pickle
+import random
+
+import pytest
+
+from latency_sketch import LatencyMetrics, QuantileSketch, metrics_settings
+
+
+def exact_quantile(values, q):
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize('q', [0.5, 0.9, 0.99])
+def test_quantiles_within_the_relative_accuracy(q):
+    rng = random.Random(1)
+    latencies = [rng.lognormvariate(-1.5, 0.8) for _ in range(20000)]
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for seconds in latencies:
+        sketch.add(seconds)
+    assert sketch.quantile(q) == pytest.approx(exact_quantile(latencies, q), rel=0.02)
+
+
+def test_merged_sketches_match_one_sketch():
+    rng = random.Random(2)
+    latencies = [rng.expovariate(5) for _ in range(5000)]
+    whole = QuantileSketch()
+    shards = [QuantileSketch() for _ in range(4)]
+    for index, seconds in enumerate(latencies):
+        whole.add(seconds)
+        shards[index % 4].add(seconds)
+    merged = QuantileSketch()
+    for shard in shards:
+        merged.merge(pickle.loads(pickle.dumps(shard)))
+    assert merged.buckets == whole.buckets
+    assert merged.count == whole.count
+    assert merged.quantile(0.95) == whole.quantile(0.95)
+
+
+def test_merge_refuses_another_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.05))
+
+
+def test_bucket_count_stays_under_max_buckets():
+    sketch = QuantileSketch(relative_accuracy=0.01, max_buckets=50)
+    for exponent in range(-60, 40):
+        sketch.add(1.5 ** exponent)
+    assert len(sketch.buckets) <= 50
+    assert sketch.count == 100
+    # Only the fastest latencies are blurred
+    assert sketch.quantile(1.0) == pytest.approx(1.5 ** 39, rel=0.02)
+
+
+def test_empty_and_zero_latencies():
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+    sketch.add(0.0)
+    sketch.add(0.2)
+    assert sketch.quantile(0.0) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(0.2, rel=0.01)
+
+
+def test_metrics_summary_by_site_and_user_agent(tmp_path):
+    metrics = LatencyMetrics()
+    metrics.observe_fetch('https://Example.com/a', 'desktop', 0.1)
+    metrics.observe_fetch('https://example.com/b', 'desktop')
+    other = LatencyMetrics()
+    other.observe_fetch('https://example.com/c', 'mobile', 0.3)
+    other.observe('submission', 'bing', 0.05)
+    metrics.merge(other)
+    summary = metrics.summary()
+    assert summary['site']['example.com']['count'] == 2
+    assert summary['site']['example.com']['failures'] == 1
+    assert summary['user_agent']['desktop'] == {'count': 1, 'failures': 1, 'mean': 100.0, 'p50': 100.0, 'p95': 100.0,
+                                                'p99': 100.0, 'max': 100.0}
+    assert summary['submission']['bing']['p50'] == pytest.approx(50.0, rel=0.01)
+
+    filename = tmp_path / 'latency_summary.json'
+    metrics.write_summary(str(filename))
+    assert json.loads(filename.read_text(encoding='utf-8'))['latency_ms'] == summary
+
+
+def test_metrics_settings():
+    config = configparser.ConfigParser()
+    config.read_string('[Metrics]\nrelative_accuracy = 0.02\n')
+    assert metrics_settings(config) == {'relative_accuracy': 0.02, 'max_buckets': 2048}
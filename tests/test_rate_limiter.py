@@ -0,0 +1,87 @@
+import asyncio
+import configparser
+import multiprocessing
+from time import monotonic
+
+import pytest
+
+from rate_limiter import (BING_HOST, HostLimit, HostRateLimiter, SharedTokenBucket, SharedTokenBuckets, TokenBucket,
+                          rate_limit_settings)
+
+
+def test_rate_limit_settings():
+    config = configparser.ConfigParser()
+    config.read_string('[RateLimit]\nrequests_per_second = 2\nmax_in_flight_per_host = 4\n'
+                       'host_requests_per_second = Slow.example=0.1\nlatency_tolerance = 3\n')
+    default_limit, host_limits, adaptive_settings = rate_limit_settings(config)
+    assert default_limit == HostLimit(2.0, 1, 4)
+    assert host_limits['slow.example'] == HostLimit(0.1, 1, 4)
+    assert host_limits[BING_HOST].rate == 5
+    assert adaptive_settings.latency_tolerance == 3.0
+
+
+async def time_acquires(bucket, count):
+    start = monotonic()
+    for _ in range(count):
+        await bucket.acquire()
+    return monotonic() - start
+
+
+def test_token_bucket_spends_its_burst_then_paces():
+    assert asyncio.run(time_acquires(TokenBucket(20, burst=3), 3)) < 0.04
+    assert asyncio.run(time_acquires(TokenBucket(20, burst=1), 5)) >= 0.19
+    assert asyncio.run(time_acquires(TokenBucket(0), 100)) < 0.04
+
+
+def test_shared_token_buckets_keep_one_rate_per_host():
+    buckets = SharedTokenBuckets(multiprocessing.get_context('spawn'), size=8)
+    assert buckets.reserve('a.example', 10) == 0
+    assert buckets.reserve('a.example', 10) == pytest.approx(0.1, abs=0.01)
+    assert buckets.reserve('a.example', 10) == pytest.approx(0.2, abs=0.01)
+    assert buckets.reserve('b.example', 10) == 0
+    assert asyncio.run(time_acquires(SharedTokenBucket(buckets, 'c.example', 20), 3)) >= 0.09
+
+
+def test_in_flight_requests_stay_under_the_host_limit():
+    limiter = HostRateLimiter(HostLimit(0, 1, 2))
+    in_flight = {}
+    peaks = {}
+
+    async def fetch(url):
+        host = url.split('/')[2]
+        async with limiter.limit(url) as slot:
+            in_flight[host] = in_flight.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), in_flight[host])
+            await asyncio.sleep(0.01)
+            in_flight[host] -= 1
+            slot.record(200)
+
+    async def crawl():
+        await asyncio.gather(*(fetch(f'https://a.example/{page}') for page in range(20)),
+                             fetch('https://b.example/'))
+
+    asyncio.run(crawl())
+    assert peaks == {'a.example': 2, 'b.example': 1}
+
+
+def test_overload_status_and_timeout_lower_the_limit():
+    limiter = HostRateLimiter(HostLimit(0, 1, 8))
+
+    async def fetch(status=None, error=None):
+        async with limiter.limit('https://a.example/') as slot:
+            if error is not None:
+                raise error
+            slot.record(status)
+
+    async def crawl():
+        await fetch(200)
+        limiter.concurrency['a.example'].limit = 8.0
+        await fetch(503)
+        with pytest.raises(asyncio.TimeoutError):
+            await fetch(error=asyncio.TimeoutError())
+
+    asyncio.run(crawl())
+    # The timeout right after the 503 counts as the same push back
+    adaptive_limit = limiter.concurrency['a.example']
+    assert int(adaptive_limit.limit) == 4
+    assert adaptive_limit.overloads == 2
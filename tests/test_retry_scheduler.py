@@ -0,0 +1,86 @@
+import asyncio
+
+import aiohttp
+import pytest
+from multidict import CIMultiDict
+from yarl import URL
+
+import retry_scheduler
+from retry_scheduler import RetryScheduler, is_retryable
+
+
+def response_error(status, headers=None):
+    request_info = aiohttp.RequestInfo(URL('https://example.com/'), 'GET', CIMultiDict(), URL('https://example.com/'))
+    return aiohttp.ClientResponseError(request_info, (), status=status, headers=headers)
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (response_error(503), True),
+    (response_error(429), True),
+    (response_error(404), False),
+    (asyncio.TimeoutError(), True),
+    (aiohttp.ClientConnectionError(), True),
+    (ValueError(), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) == retryable
+
+
+def test_backoff_doubles_up_to_max_delay():
+    retries = RetryScheduler(base_delay=10, max_delay=60, jitter=0)
+    assert [retries.backoff(attempt) for attempt in range(1, 6)] == [10, 20, 40, 60, 60]
+
+
+def test_retry_uses_retry_after_and_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(retry_scheduler, 'monotonic', lambda: 100.0)
+    retries = RetryScheduler(max_attempts=2, base_delay=10, jitter=0)
+    assert retries.retry(('url',), response_error(503, {'Retry-After': '30'}))
+    assert retries.heap[0][0] == 130.0
+    assert retries.retry(('url',), response_error(503))
+    assert not retries.retry(('url',), response_error(503))
+    assert not retries.retry(('other',), response_error(404))
+    assert len(retries) == 2
+
+
+def test_pop_due_in_due_order(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(retry_scheduler, 'monotonic', lambda: now[0])
+    retries = RetryScheduler()
+    retries.schedule(('late',), 20)
+    retries.schedule(('first',), 5)
+    retries.schedule(('second',), 5)
+    assert retries.pop_due() == []
+    assert retries.next_delay() == 5
+    now[0] = 110.0
+    assert retries.pop_due() == [('first',), ('second',)]
+    assert len(retries) == 1
+
+
+def test_drain_runs_jobs_scheduled_again():
+    retries = RetryScheduler(base_delay=0.001, jitter=0)
+    handled = []
+
+    async def handle(url):
+        handled.append(url)
+        if len(handled) < 3:
+            retries.retry((url,), asyncio.TimeoutError())
+
+    retries.schedule(('url',))
+    asyncio.run(retries.drain(handle))
+    assert handled == ['url', 'url', 'url']
+    assert len(retries) == 0
+
+
+def test_attempts_of_an_earlier_run_count_against_the_budget():
+    retries = RetryScheduler(max_attempts=3, jitter=0)
+    retries.schedule(('url',), attempts=2)
+    assert retries.retry(('url',), response_error(503))
+    assert not retries.retry(('url',), response_error(503))
+    assert retries.attempts == {}
+
+
+def test_forget_drops_the_budget_of_a_job():
+    retries = RetryScheduler(max_attempts=1, jitter=0)
+    assert retries.retry(('url',), response_error(503))
+    retries.forget(('url',))
+    assert retries.retry(('url',), response_error(503))
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+import lastmod_filter
+from lastmod_filter import LastmodDecoder
+from lastmod_watermarks import WatermarkStore
+from sitemap_cache import SitemapValidatorCache
+from sitemap_discovery import discover_sitemap_links
+from sitemap_snapshots import SnapshotStore
+
+URLSET = '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{}</urlset>'
+SITEMAP_INDEX = ('<?xml version="1.0" encoding="UTF-8"?>'
+                 '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{}</sitemapindex>')
+
+
+def url_entry(loc, lastmod=None):
+    lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ''
+    return f"<url><loc>{loc}</loc>{lastmod}</url>"
+
+
+def sitemap_entry(loc, lastmod=None):
+    lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ''
+    return f"<sitemap><loc>{loc}</loc>{lastmod}</sitemap>"
+
+
+# Function to serve sitemap documents by path, BASE in them standing for the server's own URL
+# With etags the documents carry an ETag and a matching If-None-Match gets a 304
+@asynccontextmanager
+async def serve(documents, etags=False):
+    async def handler(request):
+        text = documents[request.path].replace('BASE', base)
+        etag = f'"{hashlib.sha256(text.encode()).hexdigest()}"'
+        if etags and request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304)
+        return web.Response(text=text, content_type='application/xml', headers={'ETag': etag} if etags else None)
+
+    app = web.Application()
+    app.router.add_get('/{name}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    try:
+        yield base
+    finally:
+        await runner.cleanup()
+
+
+# Function to serve sitemap documents by path and run discovery against them
+async def discover(documents, **kwargs):
+    async with serve(documents) as base:
+        return base, await discover_sitemap_links([f"{base}/sitemap.xml"], WatermarkStore(default_epoch=0), **kwargs)
+
+
+# Function to run discovery cycles against the same server, committing like the main script after each one
+# update(documents) is called between the cycles; returns the links of every cycle
+async def discover_cycles(documents, updates, tmp_path, etags=False):
+    watermarks = WatermarkStore(default_epoch=0)
+    snapshots = SnapshotStore(':memory:')
+    cache = SitemapValidatorCache(str(tmp_path / 'sitemap_cache.json'))
+    cycles = []
+    async with serve(documents, etags) as base:
+        for update in [None] + updates:
+            if update is not None:
+                update(documents)
+            cycles.append(await discover_sitemap_links([f"{base}/sitemap.xml"], watermarks, cache=cache,
+                                                       decoder=LastmodDecoder(), snapshots=snapshots))
+            watermarks.commit()
+            snapshots.commit()
+            cache.save()
+    return cycles
+
+
+@pytest.mark.parametrize('sitemap_diff', [True, False])
+def test_entry_without_lastmod_does_not_drop_the_sitemap(sitemap_diff):
+    document = URLSET.format(url_entry('https://example.com/a', '2024-05-01T10:00:00+00:00') +
+                             url_entry('https://example.com/b'))
+    snapshots = SnapshotStore(':memory:') if sitemap_diff else None
+    _, links = asyncio.run(discover({'/sitemap.xml': document}, decoder=LastmodDecoder(), snapshots=snapshots))
+    assert links == ['https://example.com/a']
+
+
+def test_snapshot_of_entry_without_lastmod_is_committed():
+    document = URLSET.format(url_entry('https://example.com/a', '2024-05-01') + url_entry('https://example.com/b'))
+    snapshots = SnapshotStore(':memory:')
+    base, _ = asyncio.run(discover({'/sitemap.xml': document}, decoder=LastmodDecoder(), snapshots=snapshots))
+    snapshots.commit()
+    assert snapshots.previous(f"{base}/sitemap.xml") == {'https://example.com/a': 1714521600, 'https://example.com/b': None}
+
+
+def test_failed_read_never_commits_a_partial_snapshot(monkeypatch):
+    entries = ''.join(url_entry(f"https://example.com/{i}", '2024-05-01') for i in range(lastmod_filter.BATCH_SIZE + 10))
+    calls = []
+    decode_batch = LastmodDecoder.decode_batch
+
+    # The second batch fails after the first one has been staged
+    def failing_decode_batch(self, lastmods):
+        calls.append(len(lastmods))
+        if len(calls) == 2:
+            raise RuntimeError('decoder failure')
+        return decode_batch(self, lastmods)
+
+    monkeypatch.setattr(LastmodDecoder, 'decode_batch', failing_decode_batch)
+    snapshots = SnapshotStore(':memory:')
+    base, links = asyncio.run(discover({'/sitemap.xml': URLSET.format(entries)}, decoder=LastmodDecoder(),
+                                       snapshots=snapshots))
+    assert len(calls) == 2
+    assert links == []
+    snapshots.commit()
+    assert snapshots.previous(f"{base}/sitemap.xml") is None
+
+
+@pytest.mark.parametrize('etags', [True, False])
+def test_unchanged_index_still_expands_its_changed_children(tmp_path, etags):
+    documents = {
+        '/sitemap.xml': SITEMAP_INDEX.format(sitemap_entry('BASE/posts.xml') + sitemap_entry('BASE/pages.xml')),
+        '/posts.xml': URLSET.format(url_entry('https://example.com/post-1', '2024-05-01')),
+        '/pages.xml': URLSET.format(url_entry('https://example.com/about', '2024-05-01')),
+    }
+
+    def add_post(documents):
+        documents['/posts.xml'] = URLSET.format(url_entry('https://example.com/post-1', '2024-05-01') +
+                                                url_entry('https://example.com/post-2', '2024-05-02'))
+
+    cycles = asyncio.run(discover_cycles(documents, [add_post, None], tmp_path, etags))
+    assert cycles == [['https://example.com/post-1', 'https://example.com/about'], ['https://example.com/post-2'], []]
+
+
+@pytest.mark.parametrize('etags', [True, False])
+def test_nested_index_is_gated_on_its_own_watermark(tmp_path, etags):
+    documents = {
+        '/sitemap.xml': SITEMAP_INDEX.format(sitemap_entry('BASE/news.xml', '2024-05-01') +
+                                             sitemap_entry('BASE/pages.xml', '2024-06-01')),
+        '/news.xml': SITEMAP_INDEX.format(sitemap_entry('BASE/posts.xml', '2024-05-01')),
+        '/posts.xml': URLSET.format(url_entry('https://example.com/post-1', '2024-05-01')),
+        '/pages.xml': URLSET.format(url_entry('https://example.com/about', '2024-06-01')),
+    }
+
+    # A late update in the news branch, older than what the pages branch already moved the site to
+    def add_post(documents):
+        documents['/sitemap.xml'] = SITEMAP_INDEX.format(sitemap_entry('BASE/news.xml', '2024-05-10') +
+                                                         sitemap_entry('BASE/pages.xml', '2024-06-01'))
+        documents['/news.xml'] = SITEMAP_INDEX.format(sitemap_entry('BASE/posts.xml', '2024-05-10'))
+        documents['/posts.xml'] = URLSET.format(url_entry('https://example.com/post-1', '2024-05-01') +
+                                                url_entry('https://example.com/post-2', '2024-05-10'))
+
+    cycles = asyncio.run(discover_cycles(documents, [add_post, None], tmp_path, etags))
+    assert cycles == [['https://example.com/post-1', 'https://example.com/about'], ['https://example.com/post-2'], []]
@@ -0,0 +1,63 @@
+import gzip
+
+import pytest
+
+from sitemap_parser import SitemapEntry, SitemapStreamParser, is_gzip_sitemap, iter_sitemap_entries
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://example.com/a</loc>
+    <lastmod>2024-05-01T00:00:00+00:00</lastmod>
+    <changefreq>daily</changefreq>
+    <priority>0.8</priority>
+    <image:image><image:loc>https://example.com/a.png</image:loc></image:image>
+  </url>
+  <url>
+    <loc><![CDATA[ https://example.com/b ]]></loc>
+  </url>
+</urlset>
+"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://example.com/sitemap-1.xml</loc><lastmod>2024-07-01T12:00:00+00:00</lastmod></sitemap>
+</sitemapindex>
+"""
+
+ENTRIES = [SitemapEntry('https://example.com/a', '2024-05-01T00:00:00+00:00', 'daily', '0.8'),
+           SitemapEntry('https://example.com/b', None, None, None)]
+
+
+def chunks(content, size):
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize('size', [1, 7, 64 * 1024])
+def test_entries_whatever_the_chunk_size(size):
+    assert list(iter_sitemap_entries(chunks(URLSET, size))) == ENTRIES
+
+
+def test_gzip_body_with_several_members():
+    body = gzip.compress(URLSET[:200]) + gzip.compress(URLSET[200:])
+    parser = SitemapStreamParser()
+    entries = []
+    for chunk in chunks(body, 50):
+        entries.extend(parser.feed(chunk))
+    entries.extend(parser.close())
+    assert parser.gzipped
+    assert entries == ENTRIES
+
+
+def test_entry_tag_follows_the_root_element():
+    parser = SitemapStreamParser(entry_tag=None)
+    entries = parser.feed(SITEMAP_INDEX) + parser.close()
+    assert parser.kind == 'sitemapindex'
+    assert [entry.loc for entry in entries] == ['https://example.com/sitemap-1.xml']
+
+
+def test_is_gzip_sitemap():
+    assert is_gzip_sitemap('https://example.com/sitemap.xml.gz')
+    assert is_gzip_sitemap('https://example.com/sitemap', 'application/x-gzip; charset=binary')
+    assert not is_gzip_sitemap('https://example.com/sitemap.xml', 'application/xml')
+
@@ -0,0 +1,32 @@
+from sitemap_snapshots import SnapshotStore, diff_fingerprints
+
+
+def test_diff_fingerprints_finds_added_changed_and_removed():
+    previous = {'https://example.com/a': 1, 'https://example.com/b': 2, 'https://example.com/c': 3}
+    delta, added, changed = diff_fingerprints(previous, [('https://example.com/a', 1), ('https://example.com/b', 5),
+                                                         ('https://example.com/d', None)])
+    assert delta == ['https://example.com/b', 'https://example.com/d']
+    assert added == ['https://example.com/d']
+    assert changed == ['https://example.com/b']
+    assert previous == {'https://example.com/c': 3}  # What is left was removed
+
+
+def test_staged_snapshot_replaces_the_previous_one_on_commit():
+    snapshots = SnapshotStore(':memory:')
+    assert snapshots.previous('sitemap.xml') is None
+    snapshots.stage('sitemap.xml', [('https://example.com/a', 1), ('https://example.com/b', None)])
+    snapshots.commit()
+    snapshots.stage('sitemap.xml', [('https://example.com/a', 2)])
+    assert snapshots.previous('sitemap.xml') == {'https://example.com/a': 1, 'https://example.com/b': None}
+    snapshots.commit()
+    assert snapshots.previous('sitemap.xml') == {'https://example.com/a': 2}
+
+
+def test_discarded_snapshot_keeps_the_previous_one():
+    snapshots = SnapshotStore(':memory:')
+    snapshots.stage('sitemap.xml', [('https://example.com/a', 1)])
+    snapshots.commit()
+    snapshots.stage('sitemap.xml', [('https://example.com/b', 1)])
+    snapshots.discard('sitemap.xml')
+    snapshots.commit()
+    assert snapshots.previous('sitemap.xml') == {'https://example.com/a': 1}
@@ -0,0 +1,41 @@
+from ua_variants import UaVariantPlanner, page_signature, refine_classes
+
+AGENTS = ['desktop-1', 'desktop-2', 'mobile-1']
+
+
+# Function to run a verification of example.com where the mobile agent gets pages of its own
+def verify(planner, urls):
+    for url in urls:
+        for agent in planner.plan(url, AGENTS):
+            body_hash = 'mobile' if agent.startswith('mobile') else 'desktop'
+            planner.observe(url, agent, 'Accept-Encoding', f"{body_hash} {url}")
+    return planner.learn()['example.com']['classes']
+
+
+def test_agents_with_the_same_pages_form_a_class():
+    planner = UaVariantPlanner(verify_sample=3)
+    classes = verify(planner, [f'https://example.com/{page}' for page in range(3)])
+    assert sorted(classes) == [['desktop-1', 'desktop-2'], ['mobile-1']]
+
+
+def test_a_page_sampled_twice_counts_once():
+    planner = UaVariantPlanner(verify_sample=2)
+    classes = verify(planner, ['https://example.com/a', 'https://example.com/a'])
+    assert sorted(classes) == [['desktop-1', 'desktop-2'], ['mobile-1']]
+    assert planner.verifying['example.com']['urls'] == {'https://example.com/a'}
+
+
+def test_page_signature_ignores_the_fetch_order():
+    assert page_signature({'a': '1', 'b': '2'}) == page_signature({'b': '2', 'a': '1'})
+    assert page_signature({'a': '1', 'b': '2'}) != page_signature({'a': '2', 'b': '1'})
+
+
+def test_learned_classes_plan_one_fetch_per_class():
+    planner = UaVariantPlanner(verify_sample=1)
+    planner.merge({'example.com': {'classes': [['desktop-1', 'desktop-2'], ['mobile-1']], 'vary': ['accept-encoding'],
+                                   'verified': 4102444800}})
+    assert planner.plan('https://example.com/page', AGENTS) == ['desktop-1', 'mobile-1']
+
+
+def test_refine_classes():
+    assert sorted(refine_classes([['a', 'b', 'c']], [['a', 'b'], ['c'], ['d']])) == [['a', 'b'], ['c'], ['d']]
@@ -0,0 +1,61 @@
+from url_state_store import STATE_FAILED, STATE_REJECTED, STATE_SUBMITTED, UrlStateStore
+
+
+def test_urls_in_a_state_include_the_buffered_changes(tmp_path):
+    url_states = UrlStateStore(str(tmp_path / 'url_states.db'))
+    url_states.set_state('bing', 'https://example.com/a', STATE_FAILED)
+    url_states.set_state('bing', 'https://example.com/b', STATE_FAILED)
+    url_states.set_state('bing', 'https://example.com/b', STATE_SUBMITTED)
+    url_states.set_state('google', 'https://example.com/c', STATE_FAILED)
+    assert list(url_states.urls('bing', STATE_FAILED)) == ['https://example.com/a']
+    url_states.close()
+
+
+def test_states_are_buffered_until_flushed(tmp_path):
+    filename = str(tmp_path / 'url_states.db')
+    url_states = UrlStateStore(filename, batch_size=10)
+    url_states.set_state('bing', 'https://example.com/a', STATE_SUBMITTED)
+    assert url_states.is_submitted('bing', 'https://example.com/a')
+    assert UrlStateStore(filename).get_state('bing', 'https://example.com/a') is None
+    url_states.flush()
+    assert UrlStateStore(filename).is_submitted('bing', 'https://example.com/a')
+    url_states.close()
+
+
+def test_batch_size_flushes_and_attempts_add_up(tmp_path):
+    url_states = UrlStateStore(str(tmp_path / 'url_states.db'), batch_size=2)
+    url_states.set_state('bing', 'https://example.com/a', STATE_FAILED)
+    url_states.set_state('bing', 'https://example.com/b', STATE_FAILED)
+    assert url_states.pending == {}
+    url_states.set_state('bing', 'https://example.com/a', STATE_SUBMITTED)
+    url_states.flush()
+    assert url_states.connection.execute(
+        "SELECT state, attempts FROM url_states WHERE url = 'https://example.com/a'").fetchone() == (STATE_SUBMITTED, 2)
+    assert url_states.count('bing') == 2
+    assert url_states.count('bing', STATE_FAILED) == 1
+    url_states.close()
+
+
+def test_import_csv_keeps_the_states_already_stored(tmp_path):
+    csv_filename = tmp_path / 'Bing_Submission_Errors.csv'
+    csv_filename.write_text('https://example.com/a\n\nhttps://example.com/b\n', encoding='utf-8')
+    url_states = UrlStateStore(str(tmp_path / 'url_states.db'))
+    url_states.set_state('bing', 'https://example.com/a', STATE_SUBMITTED)
+    url_states.import_csv('bing', str(csv_filename), STATE_FAILED)
+    url_states.import_csv('bing', str(tmp_path / 'missing.csv'))
+    assert url_states.get_state('bing', 'https://example.com/a') == STATE_SUBMITTED
+    assert url_states.get_state('bing', 'https://example.com/b') == STATE_FAILED
+    assert url_states.get_state('google', 'https://example.com/b') is None
+    url_states.close()
+
+
+def test_urls_with_attempts_leave_out_used_up_and_rejected_urls(tmp_path):
+    url_states = UrlStateStore(str(tmp_path / 'url_states.db'))
+    url_states.set_state('bing', 'https://example.com/a', STATE_FAILED)
+    for _ in range(3):
+        url_states.set_state('bing', 'https://example.com/b', STATE_FAILED)
+    url_states.set_state('bing', 'https://example.com/c', STATE_REJECTED)
+    assert list(url_states.urls_with_attempts('bing', STATE_FAILED)) == [('https://example.com/a', 1),
+                                                                         ('https://example.com/b', 3)]
+    assert list(url_states.urls_with_attempts('bing', STATE_FAILED, 3)) == [('https://example.com/a', 1)]
+    url_states.close()
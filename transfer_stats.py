@@ -0,0 +1,90 @@
+import logging
+from urllib.parse import urlsplit
+
+try:
+    from aiohttp.compression_utils import HAS_BROTLI, HAS_ZSTD
+except ImportError:  # Older aiohttp releases decode gzip and deflate only
+    HAS_BROTLI = HAS_ZSTD = False
+
+# Bodies smaller than this are often sent uncompressed on purpose, so they are not flagged as uncompressed
+MIN_COMPRESSIBLE_BYTES = 1024
+
+# Content types that compress well, the ones worth flagging when a server sends them uncompressed
+COMPRESSIBLE_TYPES = ('text/', 'application/xml', 'application/xhtml+xml', 'application/json',
+                      'application/javascript', 'application/rss+xml', 'application/atom+xml')
+
+
+# Function to build the Accept-Encoding header of the aiohttp sessions, best encoding first
+# Only the encodings aiohttp can inflate are offered: zstd and br when their packages are installed.
+def accept_encoding():
+    encodings = []
+    if HAS_ZSTD:
+        encodings.append('zstd')
+    if HAS_BROTLI:
+        encodings.append('br;q=0.9' if encodings else 'br')
+    encodings.append('gzip;q=0.8' if encodings else 'gzip')
+    encodings.append('deflate;q=0.5')
+    return ', '.join(encodings)
+
+
+# Function to get the content encoding a response came with, 'identity' when it was not compressed
+def response_encoding(response):
+    return (response.headers.get('Content-Encoding') or 'identity').strip().lower()
+
+
+# Function to get the number of body bytes a response took on the wire, before decompression
+# Returns None when the transport does not count them
+def response_wire_bytes(response):
+    return getattr(response.content, 'total_raw_bytes', None)
+
+
+# Function to tell whether a server sent a body it should have compressed
+def served_uncompressed(response, body_bytes):
+    if response_encoding(response) != 'identity' or body_bytes < MIN_COMPRESSIBLE_BYTES:
+        return False
+    content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith('+xml')
+
+
+# Bytes on the wire against decompressed body bytes, per host
+# Each host keeps [responses, uncompressed responses, wire bytes, body bytes]; the stats are plain dicts so
+# the ones of every shard pickle back to the parent and merge there.
+class TransferStats:
+    def __init__(self):
+        self.hosts = {}
+        self.encodings = {}
+
+    # Function to record a response once its body has been read, returns its wire bytes
+    def record(self, url, response, body_bytes):
+        wire_bytes = response_wire_bytes(response)
+        if wire_bytes is None:
+            wire_bytes = body_bytes
+        encoding = response_encoding(response)
+        host = self.hosts.setdefault((urlsplit(url).hostname or '').lower(), [0, 0, 0, 0])
+        host[0] += 1
+        host[1] += served_uncompressed(response, body_bytes)
+        host[2] += wire_bytes
+        host[3] += body_bytes
+        self.encodings[encoding] = self.encodings.get(encoding, 0) + 1
+        return wire_bytes
+
+    def merge(self, other):
+        for name, counts in other.hosts.items():
+            host = self.hosts.setdefault(name, [0, 0, 0, 0])
+            for index, count in enumerate(counts):
+                host[index] += count
+        for encoding, count in other.encodings.items():
+            self.encodings[encoding] = self.encodings.get(encoding, 0) + count
+
+    # Function to log the transfer of every host, as in the crawl report at the end of a run
+    def log_summary(self, label):
+        for name, (responses, uncompressed, wire_bytes, body_bytes) in sorted(self.hosts.items()):
+            ratio = wire_bytes / body_bytes if body_bytes else 1.0
+            message = (f"{label} transfer of {name}: {responses} responses, {wire_bytes / 1024 / 1024:.2f} MB on the wire "
+                       f"for {body_bytes / 1024 / 1024:.2f} MB of bodies ({ratio:.0%}), {uncompressed} served uncompressed")
+            if uncompressed:
+                logging.warning(message)
+            else:
+                logging.info(message)
+        if self.encodings:
+            logging.info(f"{label} content encodings: {self.encodings}")
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+from time import time as current_time
+from urllib.parse import urlsplit
+
+# Defaults of the full-matrix verification runs
+DEFAULT_VERIFY_INTERVAL_DAYS = 7
+DEFAULT_VERIFY_SAMPLE = 50
+
+
+# Function to read the variant planner settings from [UserAgents], falling back to the defaults above
+def variant_settings(config):
+    return {
+        'verify_interval': config.getfloat('UserAgents', 'verify_interval_days', fallback=DEFAULT_VERIFY_INTERVAL_DAYS) * 86400,
+        'verify_sample': config.getint('UserAgents', 'verify_sample', fallback=DEFAULT_VERIFY_SAMPLE),
+    }
+
+
+# Function to get the site a URL belongs to
+def site_of(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+# Function to normalise a Vary header into its sorted, lower-case field names
+def vary_fields(vary):
+    return ','.join(sorted({field.strip().lower() for field in (vary or '').split(',') if field.strip()}))
+
+
+# Function to get the common refinement of two lists of agent classes
+# Two agents stay together only if both lists put them in the same class; agents known to one list only
+# keep a class of their own
+def refine_classes(classes, other_classes):
+    other_index = {agent: index for index, agent_class in enumerate(other_classes) for agent in agent_class}
+    refined = {}
+    for index, agent_class in enumerate(classes):
+        for agent in agent_class:
+            key = (index, other_index[agent]) if agent in other_index else (index, None, agent)
+            refined.setdefault(key, []).append(agent)
+    known = {agent for agent_class in classes for agent in agent_class}
+    for agent in other_index:
+        if agent not in known:
+            refined[(None, agent)] = [agent]
+    return list(refined.values())
+
+
+# Function to get the signature of the body hashes an agent got, keyed by page URL
+# The pages are sorted first, so the signature does not depend on the order they were fetched in
+def page_signature(hashes):
+    digest = hashlib.blake2b(digest_size=16)
+    for url, body_hash in sorted(hashes.items()):
+        digest.update(f"{url} {body_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+# Equivalence classes of user agents learned per site, so each distinct variant of a page is fetched once
+# A verification run fetches the first verify_sample distinct pages of a site with every agent, and agents
+# whose response bodies hashed the same on every one of those pages form a class. Later crawls fetch only the
+# first agent of each class. Pages that change on every request never hash the same, so their agents
+# simply stay apart. Sites are verified again every verify_interval seconds, when a new agent shows up,
+# or as soon as a representative response comes back with a Vary header not seen when they were learned.
+class UaVariantPlanner:
+    def __init__(self, filename=None, verify_interval=DEFAULT_VERIFY_INTERVAL_DAYS * 86400,
+                 verify_sample=DEFAULT_VERIFY_SAMPLE):
+        self.filename = filename
+        self.verify_interval = verify_interval
+        self.verify_sample = verify_sample
+        self.sites = {}
+        self.verifying = {}
+        self.merged = set()
+        self.planned = 0
+        self.matrix = 0
+        if filename:
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    self.sites = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (ValueError, OSError) as e:
+                logging.error(f"Failed to read user agent classes {filename}. Exception: {e}")
+
+    # Function to tell whether the classes of a site have to be verified with the full agent matrix
+    def needs_verification(self, site, agents):
+        entry = self.sites.get(site)
+        if entry is None or entry.get('drift'):
+            return True
+        if current_time() - entry.get('verified', 0) >= self.verify_interval:
+            return True
+        known = {agent for agent_class in entry['classes'] for agent in agent_class}
+        return any(agent not in known for agent in agents)
+
+    # Function to choose the agents to fetch a URL with, out of the agents the crawl asks for
+    # Verification samples are fetched once with every agent of matrix (agents by default)
+    def plan(self, url, agents, matrix=None):
+        matrix = list(dict.fromkeys(matrix or agents))
+        site = site_of(url)
+        self.matrix += len(agents)
+        state = self.verifying.get(site)
+        if state is None and self.needs_verification(site, matrix):
+            state = self.verifying[site] = {'urls': set(), 'hashes': {}, 'vary': set()}
+            logging.info(f"Verifying the user agent classes of {site} on {self.verify_sample} pages")
+        if state is not None and (url in state['urls'] or len(state['urls']) < self.verify_sample):
+            state['urls'].add(url)
+            planned = list(matrix)
+        elif site not in self.sites:  # Nothing learned yet
+            planned = list(agents)
+        else:
+            class_index = {agent: index for index, agent_class in enumerate(self.sites[site]['classes'])
+                           for agent in agent_class}
+            representatives = {}
+            for agent in agents:
+                representatives.setdefault(class_index.get(agent, agent), agent)
+            planned = list(representatives.values())
+        self.planned += len(planned)
+        return planned
+
+    # Function to feed the Vary header and body hash of a page fetched with an agent
+    def observe(self, url, agent, vary, body_hash):
+        site = site_of(url)
+        fields = vary_fields(vary)
+        state = self.verifying.get(site)
+        if state is not None and url in state['urls']:
+            # Each agent keeps one body hash per sample page, the last one when a page is fetched again
+            state['hashes'].setdefault(agent, {})[url] = body_hash
+            state['vary'].add(fields)
+            return
+        entry = self.sites.get(site)
+        if entry is not None and not entry.get('drift') and fields not in entry['vary']:
+            entry['drift'] = True
+            logging.info(f"Vary header of {site} changed to '{fields}', verifying its user agent classes next cycle")
+
+    # Function to get the classes learned by this cycle's verification runs, keyed by site
+    def learn(self):
+        learned = {}
+        for site, state in self.verifying.items():
+            classes = {}
+            for agent, hashes in state['hashes'].items():
+                classes.setdefault(page_signature(hashes), []).append(agent)
+            if classes:
+                learned[site] = {'classes': list(classes.values()), 'vary': sorted(state['vary']),
+                                 'verified': current_time()}
+        return learned
+
+    # Function to store learned classes, refining the ones already merged this cycle, such as those of another shard
+    def merge(self, learned):
+        for site, entry in learned.items():
+            if site in self.merged:
+                previous = self.sites[site]
+                entry = dict(entry, classes=refine_classes(previous['classes'], entry['classes']),
+                             vary=sorted(set(previous['vary']) | set(entry['vary'])))
+            self.sites[site] = entry
+            self.merged.add(site)
+            agents = sum(len(agent_class) for agent_class in entry['classes'])
+            logging.info(f"User agent classes of {site}: {agents} agents in {len(entry['classes'])} classes")
+
+    # Function to log how many fetches the classes saved this cycle
+    def log_summary(self):
+        logging.info(f"User agent planner: {self.planned} fetches planned for {self.matrix} requested agent variants")
+
+    # Function to write the classes back to disk, at the end of the crawl
+    def save(self):
+        temp_filename = f"{self.filename}.tmp"
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as f:
+                json.dump(self.sites, f)
+            os.replace(temp_filename, self.filename)
+        except OSError as e:
+            logging.error(f"Failed to write user agent classes {self.filename}. Exception: {e}")
@@ -0,0 +1,121 @@
+import csv
+import logging
+import sqlite3
+from time import time as current_time
+
+# Submission states recorded per engine and URL
+STATE_SUBMITTED = 'submitted'
+STATE_FAILED = 'failed'  # May succeed when tried again
+STATE_REJECTED = 'rejected'  # Failed with an error no retry can fix
+
+# Number of state changes buffered before they are written in one transaction
+DEFAULT_BATCH_SIZE = 500
+
+
+# Indexed store of the per-engine submission state of every URL, kept in SQLite (WAL mode)
+# Lookups go through the (engine, url) primary key instead of re-reading the submission CSVs,
+# and state changes are buffered and written in batched transactions.
+class UrlStateStore:
+    def __init__(self, filename, batch_size=DEFAULT_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.pending = {}
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS url_states (
+                engine TEXT NOT NULL, url TEXT NOT NULL, state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, updated_at INTEGER NOT NULL,
+                PRIMARY KEY (engine, url)
+            ) WITHOUT ROWID
+        """)
+        self.connection.commit()
+
+    # Function to get the state of a URL for an engine, None when it was never submitted
+    def get_state(self, engine, url):
+        pending = self.pending.get((engine, url))
+        if pending is not None:
+            return pending[0]
+        row = self.connection.execute('SELECT state FROM url_states WHERE engine = ? AND url = ?',
+                                      (engine, url)).fetchone()
+        return row[0] if row else None
+
+    # Function to check whether a URL was already submitted successfully to an engine
+    def is_submitted(self, engine, url):
+        return self.get_state(engine, url) == STATE_SUBMITTED
+
+    # Function to record the state of a URL for an engine
+    def set_state(self, engine, url, state):
+        previous = self.pending.get((engine, url))
+        attempts = (previous[1] if previous else 0) + 1
+        self.pending[(engine, url)] = (state, attempts, int(current_time()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    # Function to write the buffered state changes in one transaction
+    def flush(self):
+        if not self.pending:
+            return
+        rows = [(engine, url, state, attempts, updated_at)
+                for (engine, url), (state, attempts, updated_at) in self.pending.items()]
+        try:
+            with self.connection:
+                self.connection.executemany("""
+                    INSERT INTO url_states (engine, url, state, attempts, updated_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (engine, url) DO UPDATE SET
+                        state = excluded.state,
+                        attempts = url_states.attempts + excluded.attempts,
+                        updated_at = excluded.updated_at
+                """, rows)
+            self.pending = {}
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write URL states to {self.filename}. Exception: {e}")
+
+    # Function to count the URLs of an engine, optionally in one state
+    def count(self, engine, state=None):
+        self.flush()
+        if state is None:
+            row = self.connection.execute('SELECT COUNT(*) FROM url_states WHERE engine = ?', (engine,)).fetchone()
+        else:
+            row = self.connection.execute('SELECT COUNT(*) FROM url_states WHERE engine = ? AND state = ?',
+                                          (engine, state)).fetchone()
+        return row[0]
+
+    # Function to iterate over the URLs of an engine in one state
+    def urls(self, engine, state):
+        self.flush()
+        for row in self.connection.execute('SELECT url FROM url_states WHERE engine = ? AND state = ?', (engine, state)):
+            yield row[0]
+
+    # Function to iterate over the (url, attempts) of an engine in one state, the URLs with fewer than
+    # max_attempts attempts only when it is given
+    def urls_with_attempts(self, engine, state, max_attempts=None):
+        self.flush()
+        query = 'SELECT url, attempts FROM url_states WHERE engine = ? AND state = ?'
+        parameters = (engine, state)
+        if max_attempts is not None:
+            query += ' AND attempts < ?'
+            parameters += (max_attempts,)
+        for row in self.connection.execute(query, parameters):
+            yield row[0], row[1]
+
+    # Function to import an existing submission CSV (URL in the first column) for an engine
+    # URLs already in the store keep their state
+    def import_csv(self, engine, filename, state=STATE_SUBMITTED):
+        self.flush()
+        imported_at = int(current_time())
+        try:
+            with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+                reader = csv.reader(csvfile)
+                with self.connection:
+                    cursor = self.connection.executemany(
+                        'INSERT OR IGNORE INTO url_states (engine, url, state, attempts, updated_at) VALUES (?, ?, ?, 0, ?)',
+                        ((engine, row[0], state, imported_at) for row in reader if row and row[0]))
+            logging.info(f"Imported {cursor.rowcount} URLs for {engine} from {filename}")
+        except FileNotFoundError:
+            logging.error(f"File {filename} not found.")
+
+    def close(self):
+        self.flush()
+        self.connection.close()